@@ -0,0 +1,181 @@
+import cv2
+import os
+import csv
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from main import AssetManager, NullSink, GuidanceSystem, MOTION_BACKENDS, OverlayDrawer, SessionManager, MotionTraceRecorder, ReplayClock, open_frame_source
+
+# ==========================================
+# 1. Single Recording
+# ==========================================
+
+def process_recording(spec, out_dir, arch="LOWER", motion="lk", realtime=False, max_frames=None):
+    # Replays one recording through GuidanceSystem + SessionManager with no window and no audio.
+    # By default frames are fed in lockstep with the motion and state steps, every frame analysed at the
+    # motion width whatever the CPU load (so runs are reproducible), with capture timing on the media clock;
+    # realtime=True paces at the recorded fps on the wall clock with the adaptive scheduler, as live.
+    # The raw motion stream is saved as motion_trace.npz for sweep.py.
+    cv2.setNumThreads(1) # one recording per core; OpenCV's own pool would only oversubscribe
+    source = open_frame_source(spec, realtime=realtime)
+    summary = {"recording": spec, "arch": arch, "motion": motion, "save_dir": out_dir, "error": None}
+    if motion not in MOTION_BACKENDS:
+        source.release()
+        summary["error"] = f"unknown motion backend {motion!r}"
+        return summary
+    if not source.is_opened():
+        summary["error"] = "could not open"
+        return summary
+
+    assets = AssetManager(NullSink())
+    guidance = GuidanceSystem(assets)
+    guidance.set_motion_backend(motion)
+    guidance.trace_recorder = MotionTraceRecorder()
+    clock = None
+    if not realtime:
+        clock = guidance.clock = ReplayClock()
+        guidance.scheduler.pin()
+    session = SessionManager(guidance, assets, OverlayDrawer(assets), save_dir=out_dir)
+
+    motion_done = threading.Event()
+    failures = []
+    counts = {"results": 0, "stable": 0, "speed_warning": 0, "stability_warning": 0, "quality_warning": 0}
+    def on_stage(stage, dt):
+        if stage == "motion": motion_done.set()
+    def on_update(res):
+        if res is None: return
+        ms = res.motion
+        counts["results"] += 1
+        counts["stable"] += int(ms.mu < guidance.CAPTURE_SPEED_THRESH and ms.sigma < guidance.CAPTURE_STAB_THRESH)
+        counts["speed_warning"] += int(ms.speed_warning)
+        counts["stability_warning"] += int(ms.stability_warning)
+        counts["quality_warning"] += int(not ms.quality_ok)
+    def on_step_failed(e):
+        failures.append(e)
+        motion_done.set()
+    guidance.on_stage_timing = on_stage
+    guidance.on_step_failed = on_step_failed
+    guidance.on_guidance_updated = on_update
+
+    session.start_session()
+    if arch == "UPPER":
+        # Walk the state machine to the upper scan without capturing anything for the lower arch
+        session.action_button_click()
+        session.action_button_click()
+    session.action_button_click()
+
+    frames = 0
+    t_begin = time.perf_counter()
+    while max_frames is None or frames < max_frames:
+        ret, frame = source.read()
+        if not ret: break
+        motion_done.clear()
+        if clock: clock.set(frames / source.fps)
+        if guidance.process_frame(frame, flip=1) < 0: break
+        if not realtime and not motion_done.wait(timeout=1.0):
+            summary["error"] = f"motion step timed out at frame {frames}"
+            break
+        if failures: break
+        frames += 1
+    if failures: summary["error"] = f"guidance failed at frame {frames}: {failures[0]!r}"
+    wall = time.perf_counter() - t_begin
+
+    # Finish the arch (captures stay on disk), let the writer drain, then shut down
+    guidance.trace_recorder.save(os.path.join(out_dir, "motion_trace.npz"), target_width=guidance.motion_width,
+                                 recording=spec, fps=source.fps)
+    session.action_button_click()
+    session.wait_saved() # UPPER: the click saved the scan in the background
+    session.save_mosaics()
+    captures = list(session.files_lower if arch == "LOWER" else session.files_upper)
+    session.capture_writer.flush()
+    guidance.stop()
+    source.release()
+    assets.close()
+
+    n = max(1, counts["results"])
+    metrics = session.metrics()
+    summary.update({"save_dir": session.store.dir, "frames": frames, "wall_s": wall, "fps": frames / wall if wall > 0 else 0.0,
+                    "captures": len(captures), "files": [os.path.basename(p) for p in captures],
+                    "stable_ratio": counts["stable"] / n, "speed_warning_ratio": counts["speed_warning"] / n,
+                    "stability_warning_ratio": counts["stability_warning"] / n, "quality_warning_ratio": counts["quality_warning"] / n,
+                    "write_failed": metrics["writer"]["failed"], "duplicates_skipped": metrics["dedup"][arch]["hits"],
+                    "e2e": metrics["e2e"]})
+    with open(os.path.join(out_dir, "summary.json"), "w") as f: json.dump(summary, f, indent=2)
+    return summary
+
+# ==========================================
+# 2. Fan-out
+# ==========================================
+
+def expand_recordings(paths, exts=(".mp4", ".avi", ".mov", ".mkv")):
+    # Directories of videos are expanded; a directory of images is itself one recording
+    out = []
+    for path in paths:
+        if os.path.isdir(path):
+            videos = sorted(os.path.join(path, f) for f in os.listdir(path) if f.lower().endswith(exts))
+            out.extend(videos or [path])
+        else:
+            out.append(path)
+    return out
+
+def output_dir_for(out_root, spec, taken):
+    stem = os.path.splitext(os.path.basename(os.path.normpath(spec)))[0] or "recording"
+    name, i = stem, 1
+    while name in taken:
+        i += 1
+        name = f"{stem}_{i}"
+    taken.add(name)
+    return os.path.join(out_root, name)
+
+def write_report(out_root, summaries):
+    with open(os.path.join(out_root, "summary.json"), "w") as f: json.dump(summaries, f, indent=2)
+    fields = ["recording", "arch", "frames", "captures", "stable_ratio", "speed_warning_ratio",
+              "stability_warning_ratio", "quality_warning_ratio", "duplicates_skipped", "write_failed", "fps", "wall_s", "error"]
+    with open(os.path.join(out_root, "summary.csv"), "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+        writer.writeheader()
+        for s in summaries: writer.writerow(s)
+
+# ==========================================
+# 3. Entry Point
+# ==========================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless auto-capture over recorded sessions")
+    parser.add_argument("recordings", nargs="+", help="video files, image directories, or directories of videos")
+    parser.add_argument("--out", default=os.path.join(os.getcwd(), "BatchCaptures"), help="one sub-directory per recording")
+    parser.add_argument("--arch", choices=["LOWER", "UPPER"], default="LOWER", help="arch the recordings show")
+    parser.add_argument("--motion", choices=sorted(MOTION_BACKENDS), default="lk", help="motion estimator backend")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--realtime", action="store_true", help="pace at the recorded fps instead of lockstep")
+    parser.add_argument("--frames", type=int, default=None, help="stop after N frames per recording")
+    args = parser.parse_args()
+
+    specs = expand_recordings(args.recordings)
+    os.makedirs(args.out, exist_ok=True)
+    taken = set()
+    jobs = [(spec, output_dir_for(args.out, spec, taken)) for spec in specs]
+    print(f"[BATCH] {len(jobs)} recording(s) -> {args.out}")
+
+    summaries = []
+    t_begin = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.jobs or os.cpu_count()) as executor:
+        futures = {executor.submit(process_recording, spec, out_dir, args.arch, args.motion, args.realtime, args.frames): spec
+                   for spec, out_dir in jobs}
+        for future in as_completed(futures):
+            spec = futures[future]
+            try: s = future.result()
+            except Exception as e: s = {"recording": spec, "arch": args.arch, "error": repr(e)}
+            summaries.append(s)
+            if s.get("error"): print(f"[BATCH] {spec}: FAILED ({s['error']})")
+            else: print(f"[BATCH] {spec}: {s['captures']} captures, stable {s['stable_ratio']:.0%}, {s['fps']:.0f} fps")
+
+    summaries.sort(key=lambda s: s["recording"])
+    write_report(args.out, summaries)
+    print(f"[BATCH] Done in {time.perf_counter() - t_begin:.1f}s, report: {os.path.join(args.out, 'summary.csv')}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,587 @@
+import cv2
+import numpy as np
+import threading
+import time
+import json
+import gc
+import os
+import sys
+import socket
+import subprocess
+import tracemalloc
+import argparse
+
+from main import (AssetManager, NullSink, GuidanceSystem, OverlayDrawer, MOTION_BACKENDS, MotionPreprocessor, FrameSource, FrameGrabber,
+                  ScanningState, ScopeView, StartupTimer, WorkerPool, focus_score, open_frame_source, open_scopes, DisplayScaler,
+                  QualityMeter, GuidanceResult, MotionState)
+from stream_server import StreamServer
+
+# ==========================================
+# 1. Synthetic Input
+# ==========================================
+
+class SyntheticSource(FrameSource):
+    # Pans a fixed random texture with a little hand jitter, so the suite runs without recordings
+    def __init__(self, n_frames=600, width=1920, height=1080, speed_px=6.0, seed=0):
+        super().__init__(fps=30.0)
+        self.name = f"synthetic:{width}x{height}"
+        self.n_frames = n_frames
+        self.width, self.height = width, height
+        self.speed_px = speed_px
+        rng = np.random.default_rng(seed)
+        tex_w = width + int(speed_px * n_frames) + 64
+        noise = rng.integers(0, 255, (height // 8 + 16, tex_w // 8 + 16, 3), dtype=np.uint8)
+        self.texture = cv2.resize(noise, (tex_w, height + 64), interpolation=cv2.INTER_CUBIC)
+        self.texture = cv2.GaussianBlur(self.texture, (5, 5), 0)
+        # Alternate between gliding and holding still so both capture paths get exercised
+        gliding = (np.arange(n_frames) // 90) % 2 == 0
+        self._x = 32 + np.cumsum(np.where(gliding, speed_px, 0.0)) + rng.normal(0.0, 1.5, n_frames)
+        self._y = 32 + rng.normal(0.0, 1.5, n_frames)
+
+    def is_opened(self):
+        return True
+
+    def read(self):
+        i = self.frames_read
+        if i >= self.n_frames: return False, None
+        self._pace()
+        x, y = int(self._x[i]), int(self._y[i])
+        self.frames_read += 1
+        return True, self.texture[y:y + self.height, x:x + self.width]
+
+# ==========================================
+# 2. Statistics
+# ==========================================
+
+def summarize(samples):
+    if not samples: return None
+    arr = np.asarray(samples) * 1000.0
+    p50, p90, p99 = np.percentile(arr, [50, 90, 99])
+    return {"n": int(arr.size), "mean_ms": float(arr.mean()), "p50_ms": float(p50),
+            "p90_ms": float(p90), "p99_ms": float(p99), "max_ms": float(arr.max())}
+
+def print_report(report):
+    print(f"\n[BENCH] {report['source']} ({report['pace']}, {report['motion']})")
+    print(f"  frames: {report['frames']}  wall: {report['wall_s']:.2f}s  fps: {report['fps']:.1f}  captures: {report['captures']}"
+          f"  ring dropped/overruns: {report['ring_dropped']}/{report['ring_overruns']}")
+    print(f"  motion schedule: every {report['motion_every_n']} frame(s) at {report['motion_width']}px")
+    if "display_skipped" in report:
+        print(f"  display skipped: {report['display_skipped']}  grabber refused: {report['grab_refused']}")
+    print(f"  {'stage':<16}{'n':>7}{'mean':>9}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}")
+    for stage, st in report["stages"].items():
+        if st is None: continue
+        print(f"  {stage:<16}{st['n']:>7}{st['mean_ms']:>9.2f}{st['p50_ms']:>9.2f}{st['p90_ms']:>9.2f}{st['p99_ms']:>9.2f}{st['max_ms']:>9.2f}")
+
+# ==========================================
+# 3. Pipeline Runner
+# ==========================================
+
+def run_pipeline(source, assets, pace="lockstep", max_frames=None, draw=True, motion="lk", trace=None, window=None):
+    # Mirrors the main() loop without a window: read -> process_frame (mirrored into the ring) -> draw_ui.
+    # "lockstep" waits for the motion worker after every frame (deterministic, every frame analysed),
+    # "realtime" paces at the source fps, "free" pushes frames as fast as the display loop allows,
+    # "grabber" paces at the source fps on a FrameGrabber thread while this loop shows only the newest frame.
+    # window: (w, h) the display frame is rendered to fit, None for capture resolution.
+    if pace == "grabber": return run_grabber_pipeline(source, assets, max_frames, draw, motion, trace, window)
+    guidance = GuidanceSystem(assets)
+    guidance.MOTION_BACKEND = motion
+    drawer = OverlayDrawer(assets)
+    stages = {"read": [], "process_frame": [], "display_copy": [], "motion": [], "state": [], "draw_ui": []}
+    stage_lock = threading.Lock()
+    motion_done = threading.Event()
+    captures = [0]
+    latest = [None]
+
+    def on_stage(stage, dt):
+        with stage_lock: stages.setdefault(stage, []).append(dt)
+        if stage == "motion": motion_done.set()
+
+    def on_capture(): captures[0] += 1
+    def on_update(res): latest[0] = res
+
+    guidance.on_stage_timing = on_stage
+    guidance.on_capture_triggered = on_capture
+    guidance.on_guidance_updated = on_update
+    source.realtime = pace == "realtime"
+    guidance.start()
+    guidance.set_processing_active(True)
+
+    state = ScanningState.SCANNING_LOWER
+    frames = 0
+    display, display_frame = DisplayScaler(), None
+    t_begin = time.perf_counter()
+    while max_frames is None or frames < max_frames:
+        t0 = time.perf_counter()
+        ret, frame = source.read()
+        t1 = time.perf_counter()
+        if not ret: break
+        motion_done.clear()
+        seq = guidance.process_frame(frame, flip=1)
+        t2 = time.perf_counter()
+        shown = guidance.frame_ring.borrow(seq)
+        if shown is not None:
+            display_frame = display.render(shown, window)
+            guidance.release_frame(seq)
+            drawer.set_scale(display.scale)
+        t3 = time.perf_counter()
+        if draw and display_frame is not None:
+            drawer.draw_ui(display_frame, state, latest[0], "Move along LOWER arch to the right.", "Finish Lower Scan", "1/2")
+        t4 = time.perf_counter()
+        with stage_lock:
+            stages["read"].append(t1 - t0)
+            stages["process_frame"].append(t2 - t1)
+            stages["display_copy"].append(t3 - t2)
+            if draw: stages["draw_ui"].append(t4 - t3)
+        if pace == "lockstep": motion_done.wait(timeout=1.0)
+        frames += 1
+    wall = time.perf_counter() - t_begin
+    guidance.stop()
+    if trace: guidance.profiler.export(trace)
+
+    with stage_lock:
+        return {"source": getattr(source, "name", "?"), "pace": pace, "motion": motion, "frames": frames, "wall_s": wall,
+                "fps": frames / wall if wall > 0 else 0.0, "captures": captures[0],
+                "ring_dropped": guidance.frame_ring.dropped, "ring_overruns": guidance.frame_ring.overruns,
+                "motion_every_n": guidance.scheduler.every_n, "motion_width": guidance.scheduler.width,
+                "stages": {k: summarize(v) for k, v in stages.items()}}
+
+def run_grabber_pipeline(source, assets, max_frames=None, draw=True, motion="lk", trace=None, window=None):
+    # Same threading as main(): capture is decoupled from display, so a slow draw_ui skips frames instead of lagging
+    guidance = GuidanceSystem(assets)
+    guidance.MOTION_BACKEND = motion
+    drawer = OverlayDrawer(assets)
+    captures = [0]
+    latest = [None]
+    def on_capture(): captures[0] += 1
+    def on_update(res): latest[0] = res
+    guidance.on_capture_triggered = on_capture
+    guidance.on_guidance_updated = on_update
+
+    source.realtime = True
+    grabber = FrameGrabber(source, guidance.frame_ring, flip=1)
+    grabber.profiler = guidance.profiler
+    guidance.start()
+    guidance.set_processing_active(True)
+    grabber.start()
+
+    state = ScanningState.SCANNING_LOWER
+    shown_frames, skipped, last_seq = 0, 0, -1
+    display, display_frame = DisplayScaler(), None
+    t_begin = time.perf_counter()
+    while max_frames is None or grabber.frames_grabbed < max_frames:
+        t0 = time.perf_counter()
+        seq, shown = grabber.next_frame(last_seq)
+        if shown is None:
+            if grabber.finished.is_set(): break
+            continue
+        if last_seq >= 0: skipped += seq - last_seq - 1
+        last_seq = seq
+        t1 = time.perf_counter()
+        display_frame = display.render(shown, window)
+        guidance.release_frame(seq)
+        drawer.set_scale(display.scale)
+        t2 = time.perf_counter()
+        if draw: drawer.draw_ui(display_frame, state, latest[0], "Move along LOWER arch to the right.", "Finish Lower Scan", "1/2")
+        t3 = time.perf_counter()
+        guidance.profiler.record("frame_wait", t1 - t0, seq)
+        guidance.profiler.record("display_copy", t2 - t1, seq)
+        if draw: guidance.profiler.record("draw_ui", t3 - t2, seq)
+        stamp = guidance.frame_ring.stamp(seq)
+        if stamp: guidance.profiler.record("display_age", time.monotonic() - stamp, seq)
+        shown_frames += 1
+    wall = time.perf_counter() - t_begin
+    grabber.stop()
+    guidance.stop()
+    if trace: guidance.profiler.export(trace)
+
+    return {"source": getattr(source, "name", "?"), "pace": "grabber", "motion": motion, "frames": grabber.frames_grabbed,
+            "wall_s": wall, "fps": shown_frames / wall if wall > 0 else 0.0, "captures": captures[0],
+            "ring_dropped": guidance.frame_ring.dropped, "ring_overruns": guidance.frame_ring.overruns,
+            "display_skipped": skipped, "grab_refused": grabber.frames_refused,
+            "motion_every_n": guidance.scheduler.every_n, "motion_width": guidance.scheduler.width,
+            "stages": guidance.profiler.summary()}
+
+def run_scopes(make_source, assets, scopes=2, workers=None, motion="lk"):
+    # N live-paced scopes on one shared WorkerPool, guidance only (no display): how many can this machine sustain?
+    pool = WorkerPool(workers or min(scopes, 4))
+    systems, grabbers = [], []
+    for i in range(scopes):
+        guidance = GuidanceSystem(assets, pool)
+        guidance.MOTION_BACKEND = motion
+        source = make_source(i)
+        source.realtime = True
+        grabber = FrameGrabber(source, guidance.frame_ring, flip=1)
+        guidance.start()
+        guidance.set_processing_active(True)
+        systems.append(guidance)
+        grabbers.append(grabber)
+    t_begin = time.perf_counter()
+    for grabber in grabbers: grabber.start()
+    for grabber in grabbers: grabber.finished.wait()
+    wall = time.perf_counter() - t_begin
+    results = []
+    for i, (guidance, grabber) in enumerate(zip(systems, grabbers)):
+        guidance.stop()
+        stages = guidance.profiler.summary()
+        results.append({"scope": i, "frames": grabber.frames_grabbed, "motion_steps": stages.get("motion", {}).get("n", 0),
+                        "ring_dropped": guidance.frame_ring.dropped, "motion_every_n": guidance.scheduler.every_n,
+                        "motion_width": guidance.scheduler.width, "pool": guidance.pool_stats(),
+                        "motion": stages.get("motion"), "e2e": stages.get("e2e")})
+    pool.close()
+    return {"suite": "scopes", "scopes": scopes, "workers": pool.workers, "motion": motion, "wall_s": wall, "results": results}
+
+def print_scopes(report):
+    print(f"\n[BENCH] {report['scopes']} scope(s) on {report['workers']} shared worker(s) ({report['motion']}), wall {report['wall_s']:.2f}s")
+    print(f"  {'scope':<7}{'frames':>8}{'steps':>10}{'dropped':>9}{'every_n':>9}{'width':>7}{'e2e p50':>9}{'e2e p90':>9}{'wait ms':>9}")
+    for r in report["results"]:
+        e2e, pool = r["e2e"] or {}, r["pool"] or {}
+        print(f"  {r['scope']:<7}{r['frames']:>8}{r['motion_steps']:>10}{r['ring_dropped']:>9}{r['motion_every_n']:>9}{r['motion_width']:>7}"
+              f"{e2e.get('p50_ms', 0.0):>9.2f}{e2e.get('p90_ms', 0.0):>9.2f}{pool.get('mean_wait_ms', 0.0):>9.2f}")
+
+# ==========================================
+# 4. Motion Estimator Suites
+# ==========================================
+
+def motion_grays(source, width=480, max_frames=None):
+    # Same ROI/downscale as GuidanceSystem._motion_worker, collected up front so only tracking is timed
+    grays = []
+    preprocessor = MotionPreprocessor()
+    while max_frames is None or len(grays) < max_frames:
+        ret, frame = source.read()
+        if not ret: break
+        grays.append(preprocessor.process(cv2.flip(frame, 1), width).copy())
+    return grays
+
+class LegacyFlow:
+    # The pre-engine tracker: plain pyramidal LK, filtered on the status flag only
+    name = "legacy-lk"
+    MAX_CORNERS, MIN_CORNERS = 100, 40
+
+    def __init__(self):
+        self.prev_gray, self.prev_pts = None, None
+        self.resets = 0
+
+    def estimate(self, gray):
+        measured = None
+        if self.prev_gray is None or self.prev_pts is None or len(self.prev_pts) < self.MIN_CORNERS:
+            self.prev_pts = cv2.goodFeaturesToTrack(gray, self.MAX_CORNERS, 0.01, 8, blockSize=3)
+            self.resets += 1
+        else:
+            next_pts, status, _ = cv2.calcOpticalFlowPyrLK(self.prev_gray, gray, self.prev_pts, None, winSize=(15,15), maxLevel=2)
+            good_new, good_old = next_pts[status == 1], self.prev_pts[status == 1]
+            if len(good_new) >= self.MIN_CORNERS:
+                dists = np.sqrt(np.sum((good_new - good_old)**2, axis=1))
+                measured = float(np.mean(dists)), float(np.std(dists))
+                self.prev_pts = good_new.reshape(-1, 1, 2)
+            else:
+                self.prev_pts = None
+        self.prev_gray = gray
+        return measured
+
+def run_estimator(estimator, grays, repeats=3):
+    # Every frame is analysed (LK_EVERY_N = 1) so per-call cost is comparable across estimators
+    times, mus = [], []
+    for r in range(repeats):
+        est = estimator()
+        for gray in grays:
+            t0 = time.perf_counter()
+            measured = est.estimate(gray)
+            times.append(time.perf_counter() - t0)
+            if r == 0: mus.append(np.nan if measured is None else measured[0])
+        if r == 0: resets = est.resets
+    mus = np.asarray(mus)
+    valid = mus[~np.isnan(mus)]
+    return {"estimator": estimator.name, "frames": len(grays), "resets": resets,
+            "valid_ratio": float(valid.size / max(1, mus.size)),
+            "mu_mean": float(valid.mean()) if valid.size else 0.0,
+            "mu_jitter": float(np.std(np.diff(valid))) if valid.size > 2 else 0.0,
+            "step": summarize(times)}
+
+def print_estimators(source_name, results):
+    print(f"\n[BENCH] motion estimators on {source_name}")
+    print(f"  {'estimator':<12}{'mean ms':>9}{'p90 ms':>9}{'fps':>9}{'resets':>8}{'valid':>8}{'mu':>8}{'jitter':>8}")
+    for r in results:
+        st = r["step"]
+        print(f"  {r['estimator']:<12}{st['mean_ms']:>9.2f}{st['p90_ms']:>9.2f}{1000.0 / max(st['mean_ms'], 1e-6):>9.0f}"
+              f"{r['resets']:>8}{r['valid_ratio']:>8.2f}{r['mu_mean']:>8.2f}{r['mu_jitter']:>8.2f}")
+
+def run_flow_suite(source, max_frames=None):
+    grays = motion_grays(source, max_frames=max_frames)
+    results = [run_estimator(est, grays) for est in [LegacyFlow] + list(MOTION_BACKENDS.values())]
+    print_estimators(getattr(source, "name", "?"), results)
+    return {"source": getattr(source, "name", "?"), "suite": "flow", "results": results}
+
+# ==========================================
+# 5. Allocation Suite
+# ==========================================
+
+def legacy_motion_step(frame, width, estimator):
+    # _motion_worker preprocessing before MotionPreprocessor: fresh resize and gray images every frame
+    h, w = frame.shape[:2]
+    crop = frame[int(h*0.2):int(h*0.8), int(w*0.15):int(w*0.85)]
+    ds = cv2.resize(crop, (width, int(crop.shape[0] * width / crop.shape[1])), interpolation=cv2.INTER_NEAREST)
+    gray = cv2.cvtColor(ds, cv2.COLOR_BGR2GRAY)
+    focus_score(gray)
+    return estimator.estimate(gray)
+
+def run_alloc_suite(source, width=480, max_frames=None, motion="lk"):
+    # Per-frame heap traffic of the motion step (preprocessing, focus score, estimator), legacy vs buffered;
+    # the buffered step also runs the QualityMeter histogram, as the live worker does.
+    # tracemalloc sees numpy/cv2 output arrays; OpenCV's internal scratch (LK pyramids, DFT) is not Python heap.
+    # transient = peak above the pre-step level, retained = traced growth over the measured steps. 2000 untimed
+    # steps run under tracing first: numpy's internal caches keep filling for ~1500 steps, then stay flat.
+    # At most 120 source frames are held and replayed back and forth, so long runs stay within memory.
+    frames, pool = [], 120
+    while len(frames) < pool and (max_frames is None or len(frames) < max_frames):
+        ret, frame = source.read()
+        if not ret: break
+        frames.append(cv2.flip(frame, 1))
+    cycle = frames + frames[-2:0:-1]
+    frames = [cycle[i % len(cycle)] for i in range(max_frames or 600)] if cycle else []
+    results = []
+    for label in ["legacy", "buffered"]:
+        estimator = MOTION_BACKENDS[motion]()
+        preprocessor = MotionPreprocessor()
+        meter = QualityMeter()
+        if label == "legacy": step = lambda f: legacy_motion_step(f, width, estimator)
+        else: step = lambda f: (focus_score(g := preprocessor.process(f, width), preprocessor.lap), meter.measure(g),
+                                estimator.estimate(g))
+        gc.collect()
+        gc_before = sum(s["collections"] for s in gc.get_stats())
+        # Results go into arrays sized up front so the bookkeeping itself does not show up as growth
+        n = len(frames)
+        transient, times = np.zeros(n), np.zeros(n)
+        tracemalloc.start()
+        for i in range(2000): step(cycle[i % len(cycle)])
+        start_mem = tracemalloc.get_traced_memory()[0]
+        for i in range(n):
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            t0 = time.perf_counter()
+            step(frames[i])
+            times[i] = time.perf_counter() - t0
+            transient[i] = tracemalloc.get_traced_memory()[1] - current
+        retained = tracemalloc.get_traced_memory()[0] - start_mem
+        tracemalloc.stop()
+        results.append({"path": label, "frames": len(frames), "transient_kb_mean": float(transient.mean() / 1024.0),
+                        "transient_kb_max": float(transient.max() / 1024.0),
+                        "retained_kb": retained / 1024.0,
+                        "gc_collections": sum(s["collections"] for s in gc.get_stats()) - gc_before,
+                        "buffer_sets": preprocessor.allocations, "step": summarize(times.tolist())})
+    return {"source": getattr(source, "name", "?"), "suite": "alloc", "motion": motion, "width": width, "results": results}
+
+def print_alloc(report):
+    print(f"\n[BENCH] motion step allocations on {report['source']} ({report['motion']}, width {report['width']})")
+    print(f"  {'path':<10}{'frames':>8}{'KB/frame':>10}{'KB max':>9}{'retained KB':>13}{'gc runs':>9}{'mean ms':>9}")
+    for r in report["results"]:
+        print(f"  {r['path']:<10}{r['frames']:>8}{r['transient_kb_mean']:>10.1f}{r['transient_kb_max']:>9.1f}"
+              f"{r['retained_kb']:>13.1f}{r['gc_collections']:>9}{r['step']['mean_ms']:>9.2f}")
+
+# ==========================================
+# 6. Startup Suite
+# ==========================================
+
+def startup_probe(specs, open_delay=0.0, parallel=True, timeout=10.0):
+    # Runs in a fresh interpreter (see run_startup_suite): main()'s startup up to the first guidance result on
+    # every scope, without windows. "synthetic" opens a SyntheticSource after open_delay s, standing in for
+    # UVC negotiation. Prints the StartupTimer marks as JSON on the last line.
+    import tempfile
+    os.chdir(tempfile.mkdtemp()) # sessions write their traces under the working directory
+    startup = StartupTimer(verbose=False)
+    def open_source(spec):
+        if spec != "synthetic": return open_frame_source(spec, realtime=True)
+        time.sleep(open_delay)
+        source = SyntheticSource(n_frames=300)
+        source.realtime = True
+        return source
+    sources, assets = open_scopes(specs, open_source, NullSink(), startup, parallel=parallel)
+    if sources is None:
+        assets.close()
+        raise SystemExit(1)
+    pool = WorkerPool(min(len(sources), 4))
+    views = [ScopeView(i + 1, source, assets, pool, startup=startup) for i, source in enumerate(sources)]
+    for view in views: view.start()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and not all(f"scope{v.index} first_guidance" in startup.marks and v.frames_rendered for v in views):
+        for view in views: view.render(timeout=0.01)
+    for view in views: view.stop()
+    pool.close()
+    assets.close()
+    print(json.dumps(startup.marks))
+
+def run_startup_suite(specs, runs=3, open_delay=1.0):
+    # Each run is a new process, so imports and every lazy initialisation are paid again; serial opens the
+    # sources one after another before loading assets (the old startup), parallel is the live sequence
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = []
+    for parallel in (False, True):
+        samples = []
+        for _ in range(runs):
+            code = f"import main, benchmark; benchmark.startup_probe({specs!r}, {open_delay!r}, {parallel!r})"
+            out = subprocess.run([sys.executable, "-c", code], cwd=here, capture_output=True, text=True, timeout=120)
+            if out.returncode != 0:
+                print(f"[ERR] Startup probe failed:\n{out.stderr.strip()}")
+                continue
+            samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+        names = sorted({k for m in samples for k in m}, key=lambda k: np.median([m.get(k, np.inf) for m in samples]))
+        results.append({"mode": "parallel" if parallel else "serial", "runs": len(samples),
+                        "median_ms": {k: float(np.median([m[k] for m in samples if k in m])) for k in names}})
+    return {"suite": "startup", "sources": specs, "open_delay_s": open_delay, "results": results}
+
+def print_startup(report):
+    print(f"\n[BENCH] startup of {len(report['sources'])} scope(s), {report['open_delay_s']:.2f}s simulated open (median ms since import)")
+    modes = report["results"]
+    print(f"  {'milestone':<26}" + "".join(f"{r['mode']:>10}" for r in modes))
+    for name in modes[-1]["median_ms"]:
+        print(f"  {name:<26}" + "".join(f"{r['median_ms'].get(name, float('nan')):>10.0f}" for r in modes))
+
+# ==========================================
+# 7. Stream Suite
+# ==========================================
+
+def stream_client(port, path, stop, counts, key, chunk=65536, pause=0.0):
+    # Local HTTP client counting MJPEG parts (or SSE messages) until stop is set; pause between reads makes
+    # it a slow viewer (with a small receive buffer, so the server sees the backpressure quickly)
+    marker = b"--" + StreamServer.BOUNDARY + b"\r\n" if path.startswith("/stream") else b"\n\n"
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if pause: sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 32768)
+    sock.connect(("127.0.0.1", port))
+    sock.sendall(f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n".encode("latin-1"))
+    sock.settimeout(0.2)
+    tail = b""
+    while not stop.is_set():
+        try: data = sock.recv(chunk)
+        except socket.timeout: continue
+        except OSError: break
+        if not data: break
+        buf = tail + data
+        counts[key] += buf.count(marker)
+        tail = buf[-(len(marker) - 1):]
+        if pause: time.sleep(pause)
+    sock.close()
+
+def run_stream_suite(source, viewers=3, slow=1, max_frames=None, width=640):
+    # The UI loop's side of StreamServer at camera rate: publish_frame/publish_guidance cost per frame with
+    # `viewers` local MJPEG clients reading at full speed, `slow` ones reading ~160 KB/s and one event listener.
+    # Frames should be encoded once, whatever the number of viewers, and the slow ones should only drop frames.
+    server = StreamServer(port=0, width=width)
+    if not server.start(): return None
+    stop = threading.Event()
+    counts = {}
+    threads = []
+    specs = [("fast", 0.0)] * viewers + [("slow", 0.1)] * slow
+    for i, (kind, pause) in enumerate(specs):
+        key = f"{kind}{i + 1}"
+        counts[key] = 0
+        threads.append(threading.Thread(target=stream_client, args=(server.port, "/stream.mjpg?scope=1", stop, counts, key),
+                                        kwargs={"chunk": 16384 if pause else 65536, "pause": pause}, daemon=True))
+    counts["events"] = 0
+    threads.append(threading.Thread(target=stream_client, args=(server.port, "/events", stop, counts, "events"), daemon=True))
+    for t in threads: t.start()
+    deadline = time.monotonic() + 2.0
+    while time.monotonic() < deadline and (server._viewer_count.get(1, 0) < len(specs) or not server._listeners): time.sleep(0.01)
+
+    source.realtime = True # camera rate, so the frame budget is real
+    publish, frames = [], 0
+    prompts = ["Slow down", "Keep steady", "Ready to capture"]
+    while max_frames is None or frames < max_frames:
+        ret, frame = source.read()
+        if not ret: break
+        t0 = time.perf_counter()
+        server.publish_frame(1, frame)
+        res = GuidanceResult(prompts[(frames // 45) % 3], (60, 200, 60), MotionState(travel=float("inf")), frames)
+        server.publish_guidance(1, res)
+        if frames % 30 == 0: server.publish_event("capture", {"scope": 1, "arch": "LOWER", "seq": frames})
+        publish.append(time.perf_counter() - t0)
+        frames += 1
+    time.sleep(0.5) # let the last parts drain
+    stats = server.stats()
+    stop.set()
+    for t in threads: t.join(timeout=2.0)
+    server.close()
+    counts["events"] = max(0, counts["events"] - 1) # the ": connected" comment
+    return {"source": getattr(source, "name", "?"), "suite": "stream", "width": width, "frames": frames,
+            "publish": summarize(publish), "received": counts, "server": stats}
+
+def print_stream(report):
+    if report is None: return
+    s = report["server"]
+    print(f"\n[BENCH] stream of {report['source']} at {report['width']}px: {report['frames']} frames offered, "
+          f"{s['frames_published']} taken, {s['frames_encoded']} encoded ({s['encode_ms_mean']:.1f} ms mean), "
+          f"{s['frames_replaced']} replaced before encoding")
+    p = report["publish"]
+    print(f"  publish on the UI thread: mean {p['mean_ms']:.2f} ms  p99 {p['p99_ms']:.2f} ms  max {p['max_ms']:.2f} ms")
+    print(f"  {'client':<10}{'received':>10}")
+    for key, n in report["received"].items(): print(f"  {key:<10}{n:>10}")
+    for c in s["clients"]: print(f"  server -> {c['kind']:<7}{c['peer']:<18} sent {c['sent']:>5}  dropped {c['dropped']:>5}")
+
+# ==========================================
+# 8. Entry Point
+# ==========================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless benchmark of the guidance pipeline")
+    parser.add_argument("sources", nargs="*", help="recorded sessions (video files or image directories)")
+    parser.add_argument("--suite", choices=["pipeline", "flow", "scopes", "alloc", "startup", "stream"], default="pipeline",
+                        help="flow: compare motion estimator backends on the same frames; scopes: concurrent live scopes on one pool; "
+                             "alloc: per-frame heap traffic of the motion step; startup: time to first frame / first guidance; "
+                             "stream: StreamServer fan-out to local viewers")
+    parser.add_argument("--scopes", type=int, default=2, help="scopes/startup suites: number of concurrent scopes")
+    parser.add_argument("--open-delay", type=float, default=1.0, help="startup suite: seconds a synthetic source takes to open")
+    parser.add_argument("--runs", type=int, default=3, help="startup suite: fresh processes per mode")
+    parser.add_argument("--workers", type=int, default=None, help="scopes suite: shared guidance threads")
+    parser.add_argument("--viewers", type=int, default=3, help="stream suite: full-speed MJPEG clients (plus one slow one)")
+    parser.add_argument("--pace", choices=["lockstep", "realtime", "free", "grabber"], default="lockstep")
+    parser.add_argument("--motion", choices=sorted(MOTION_BACKENDS), default="lk", help="backend for the pipeline suite")
+    parser.add_argument("--frames", type=int, default=None, help="stop after N frames per source")
+    parser.add_argument("--no-draw", action="store_true", help="skip OverlayDrawer.draw_ui")
+    parser.add_argument("--display", default=None, metavar="WxH", help="render the preview to fit this window (default: capture size)")
+    parser.add_argument("--json", default=None, help="write all reports to this file")
+    parser.add_argument("--trace", default=None, help="export each run's stage trace to <TRACE>_<i>.json/.csv")
+    args = parser.parse_args()
+
+    assets = AssetManager(NullSink())
+    reports = []
+    if args.suite == "scopes":
+        # Every scope replays the first source (or its own synthetic pan)
+        spec = args.sources[0] if args.sources else None
+        make = lambda i: SyntheticSource(n_frames=args.frames or 300, seed=i) if spec is None else open_frame_source(spec, realtime=True)
+        report = run_scopes(make, assets, args.scopes, args.workers, args.motion)
+        print_scopes(report)
+        reports.append(report)
+        specs = []
+    elif args.suite == "startup":
+        report = run_startup_suite(args.sources or ["synthetic"] * args.scopes, args.runs, args.open_delay)
+        print_startup(report)
+        reports.append(report)
+        specs = []
+    else:
+        specs = args.sources or [None]
+    for spec in specs:
+        source = SyntheticSource(n_frames=args.frames or 600) if spec is None else open_frame_source(spec, realtime=False)
+        if not source.is_opened():
+            print(f"[ERR] Could not open {spec}")
+            continue
+        if args.suite == "flow":
+            report = run_flow_suite(source, args.frames)
+        elif args.suite == "alloc":
+            report = run_alloc_suite(source, max_frames=args.frames, motion=args.motion)
+            print_alloc(report)
+        elif args.suite == "stream":
+            report = run_stream_suite(source, args.viewers, max_frames=args.frames)
+            print_stream(report)
+        else:
+            trace = f"{args.trace}_{len(reports)}" if args.trace else None
+            window = tuple(int(v) for v in args.display.lower().split("x")) if args.display else None
+            report = run_pipeline(source, assets, args.pace, args.frames, draw=not args.no_draw, motion=args.motion, trace=trace, window=window)
+            print_report(report)
+        source.release()
+        reports.append(report)
+    assets.close()
+
+    if args.json:
+        with open(args.json, "w") as f: json.dump(reports, f, indent=2)
+        print(f"[BENCH] Wrote {args.json}")
+
+if __name__ == "__main__":
+    main()
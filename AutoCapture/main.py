@@ -1,9 +1,17 @@
+import time
+PROCESS_T0 = time.perf_counter() # startup milestones count from here, so they include the imports below
 import cv2
 import numpy as np
 import threading
-import time
 import os
+import glob
+import argparse
 import platform
+import queue
+import json
+import io
+import wave
+from collections import deque, OrderedDict
 from dataclasses import dataclass
 from enum import Enum, auto
 
@@ -11,8 +19,236 @@ from enum import Enum, auto
 # 1. Configuration & Assets
 # ==========================================
 
-class AssetManager:
+class AudioClip:
+    # A voice prompt decoded once at startup; pcm is raw interleaved little-endian samples
+    def __init__(self, path):
+        self.name = os.path.basename(path)
+        self.path = path
+        with open(path, "rb") as f: self.wav_bytes = f.read()
+        with wave.open(io.BytesIO(self.wav_bytes)) as w:
+            self.channels, self.sample_width, self.rate = w.getnchannels(), w.getsampwidth(), w.getframerate()
+            self.pcm = w.readframes(w.getnframes())
+        self.duration = len(self.pcm) / float(self.channels * self.sample_width * self.rate)
+
+    def samples(self):
+        dtype = {1: np.uint8, 2: np.int16, 4: np.int32}[self.sample_width]
+        return np.frombuffer(self.pcm, dtype).reshape(-1, self.channels)
+
+# Sinks: play(clip, cancel) runs on the audio thread and returns once the clip has finished or soon after
+# the cancel Event is set, including when it was set before playback started.
+
+class NullSink:
+    # No audio device (or --mute): "plays" for the clip's duration so queueing behaves the same
+    name = "null"
+
+    def play(self, clip, cancel):
+        cancel.wait(clip.duration)
+
+class SoundDeviceSink:
+    # PortAudio via the optional sounddevice package; plays the preloaded PCM directly
+    name = "sounddevice"
+
     def __init__(self):
+        import sounddevice
+        sounddevice.query_devices(kind="output") # raises if there is no output device
+        self._sd = sounddevice
+
+    def play(self, clip, cancel):
+        if cancel.is_set(): return
+        self._sd.play(clip.samples(), clip.rate)
+        if cancel.wait(clip.duration): self._sd.stop()
+        else: self._sd.wait()
+
+class WinSoundSink:
+    name = "winsound"
+
+    def __init__(self):
+        import winsound
+        self._ws = winsound
+
+    def play(self, clip, cancel):
+        # Async from the file, so this thread can stop it; SND_MEMORY cannot be async
+        if cancel.is_set(): return
+        self._ws.PlaySound(clip.path, self._ws.SND_FILENAME | self._ws.SND_ASYNC | self._ws.SND_NODEFAULT)
+        if cancel.wait(clip.duration): self._ws.PlaySound(None, 0)
+
+class AlsaSink:
+    # Linux without sounddevice: libasound through ctypes, writing the preloaded PCM in short chunks so
+    # the cancel Event is seen within about one chunk plus the device latency. No extra package needed.
+    name = "alsa"
+    FORMATS = {1: 1, 2: 2, 4: 10} # sample width -> SND_PCM_FORMAT_U8 / S16_LE / S32_LE
+    CHUNK_S = 0.05
+    LATENCY_US = 100000
+
+    def __init__(self, device=b"default"):
+        import ctypes, ctypes.util
+        path = ctypes.util.find_library("asound")
+        if path is None: raise OSError("libasound not found")
+        lib = ctypes.CDLL(path)
+        pcm_p = ctypes.c_void_p
+        lib.snd_pcm_open.argtypes = [ctypes.POINTER(pcm_p), ctypes.c_char_p, ctypes.c_int, ctypes.c_int]
+        lib.snd_pcm_set_params.argtypes = [pcm_p, ctypes.c_int, ctypes.c_int, ctypes.c_uint, ctypes.c_uint, ctypes.c_int, ctypes.c_uint]
+        lib.snd_pcm_writei.argtypes = [pcm_p, ctypes.c_void_p, ctypes.c_ulong]
+        lib.snd_pcm_writei.restype = ctypes.c_long
+        lib.snd_pcm_recover.argtypes = [pcm_p, ctypes.c_int, ctypes.c_int]
+        for fn in (lib.snd_pcm_drain, lib.snd_pcm_drop, lib.snd_pcm_close): fn.argtypes = [pcm_p]
+        lib.snd_strerror.restype = ctypes.c_char_p
+        self._lib, self._ct, self.device = lib, ctypes, device
+        self._close(self._open()) # raises if there is no playback device
+
+    def _check(self, err, what):
+        if err < 0: raise OSError(f"{what}: {self._lib.snd_strerror(err).decode()}")
+
+    def _open(self):
+        pcm = self._ct.c_void_p()
+        self._check(self._lib.snd_pcm_open(self._ct.byref(pcm), self.device, 0, 0), "snd_pcm_open") # SND_PCM_STREAM_PLAYBACK
+        return pcm
+
+    def _close(self, pcm):
+        self._lib.snd_pcm_close(pcm)
+
+    def play(self, clip, cancel):
+        if cancel.is_set(): return
+        samples = clip.samples() # zero-copy view of the cached PCM
+        pcm = self._open()
+        try:
+            self._check(self._lib.snd_pcm_set_params(pcm, self.FORMATS[clip.sample_width], 3, clip.channels, clip.rate, 1,
+                                                     self.LATENCY_US), "snd_pcm_set_params") # SND_PCM_ACCESS_RW_INTERLEAVED
+            base, frame_bytes = samples.ctypes.data, clip.channels * clip.sample_width
+            chunk, pos, n = max(1, int(clip.rate * self.CHUNK_S)), 0, len(samples)
+            while pos < n:
+                if cancel.is_set():
+                    self._lib.snd_pcm_drop(pcm)
+                    return
+                written = self._lib.snd_pcm_writei(pcm, base + pos * frame_bytes, min(chunk, n - pos))
+                if written < 0: self._check(self._lib.snd_pcm_recover(pcm, int(written), 1), "snd_pcm_writei")
+                else: pos += written
+            self._lib.snd_pcm_drain(pcm)
+        finally: self._close(pcm)
+
+class PlayerProcessSink:
+    # Last resort: a command-line player, spawned without a shell and only from the audio thread
+    name = "process"
+    POLL_S = 0.05
+
+    def __init__(self, player):
+        import subprocess
+        self._sp = subprocess
+        self.player = player
+
+    def play(self, clip, cancel):
+        if cancel.is_set(): return
+        sp = self._sp
+        proc = sp.Popen([self.player, clip.path], stdin=sp.DEVNULL, stdout=sp.DEVNULL, stderr=sp.DEVNULL, close_fds=True)
+        while proc.poll() is None:
+            if cancel.wait(self.POLL_S):
+                proc.terminate()
+                break
+        proc.wait()
+
+def open_audio_sink():
+    # Best available output, falling back to NullSink so the app (and headless runs) never depend on audio.
+    # Probing can take a while (PortAudio enumerates devices), so AudioEngine does it on its own thread.
+    # Order: sounddevice (optional package, pip install sounddevice; any OS) -> winsound (Windows) ->
+    # ALSA through ctypes (Linux) -> a command-line player per prompt (e.g. macOS without sounddevice).
+    # All but the last play the preloaded PCM in-process. AudioEngine logs the one chosen as "output: <name>".
+    import shutil
+    try: return SoundDeviceSink()
+    except Exception: pass
+    if platform.system() == "Windows":
+        try: return WinSoundSink()
+        except ImportError: pass
+    if platform.system() == "Linux":
+        try: return AlsaSink()
+        except (OSError, AttributeError): pass
+    for player in ("afplay", "aplay", "paplay"):
+        path = shutil.which(player)
+        if path:
+            print(f"[AUDIO] No in-process output, spawning {os.path.basename(path)} per prompt (pip install sounddevice to avoid it)")
+            return PlayerProcessSink(path)
+    return NullSink()
+
+class AudioEngine:
+    # Preloaded clips played one at a time from a single worker thread, which also opens the output.
+    # play(interrupt=True) cuts the current prompt and drops anything queued; interrupt=False queues it.
+    # Every queued clip carries its own cancel Event, set under the lock, so an interrupt that lands
+    # between the worker taking a clip and the sink starting it still stops that clip.
+    MAX_QUEUED = 4
+
+    def __init__(self, voices_path, sink=None):
+        self.sink = sink # None: open_audio_sink() on the audio thread, prompts queue up meanwhile
+        self.ready = threading.Event()
+        self.clips = {}
+        for path in sorted(glob.glob(os.path.join(voices_path, "*.wav"))):
+            try: self.clips[os.path.basename(path)] = AudioClip(path)
+            except (OSError, wave.Error) as e: print(f"[ERR] Could not decode {path}: {e}")
+        self._queue = deque() # (clip, cancel Event)
+        self._cond = threading.Condition()
+        self._closed = False
+        self.playing = None
+        self._cancel = None # cancel Event of the clip being played
+        self.played = 0
+        self.interrupted = 0
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name="AudioEngine", daemon=True)
+        self._thread.start()
+
+    def play(self, name, interrupt=True):
+        clip = self.clips.get(name)
+        if clip is None: return False
+        with self._cond:
+            if self._closed: return False
+            if interrupt:
+                self.dropped += len(self._queue)
+                self._queue.clear()
+                if self.playing is not None and not self._cancel.is_set():
+                    self.interrupted += 1
+                    self._cancel.set()
+            elif len(self._queue) >= self.MAX_QUEUED:
+                self.dropped += 1
+                return False
+            self._queue.append((clip, threading.Event()))
+            self._cond.notify()
+        return True
+
+    def stop(self):
+        # Silence now and forget anything queued
+        with self._cond:
+            self.dropped += len(self._queue)
+            self._queue.clear()
+            if self._cancel is not None: self._cancel.set()
+
+    def wait_idle(self, timeout=None):
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._queue and self.playing is None, timeout)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._queue.clear()
+            if self._cancel is not None: self._cancel.set()
+            self._cond.notify_all()
+        self._thread.join(timeout=2.0)
+
+    def _run(self):
+        if self.sink is None: self.sink = open_audio_sink()
+        print(f"[AUDIO] {len(self.clips)} clips preloaded, output: {self.sink.name}")
+        self.ready.set()
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue or self._closed)
+                if self._closed: return
+                clip, cancel = self._queue.popleft()
+                self.playing, self._cancel = clip, cancel
+            try: self.sink.play(clip, cancel)
+            except Exception as e: print(f"[ERR] Audio playback failed ({clip.name}): {e}")
+            with self._cond:
+                self.playing = self._cancel = None
+                self.played += 1
+                self._cond.notify_all()
+
+class AssetManager:
+    def __init__(self, audio_sink=None):
         # Absolute path calculation
         self.base_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Assets")
         self.voices_path = os.path.join(self.base_path, "Voices")
@@ -21,8 +257,11 @@ class AssetManager:
         print(f"[ASSETS] Loading from: {self.base_path}")
         self.icon_lower = self._load_image("Lower.png")
         self.icon_upper = self._load_image("Upper.png")
+        self._icon_cache = {} # (id(icon), height) -> premultiplied (color, alpha) float32, shared by every drawer
         
         self.system = platform.system()
+        # Voice prompts are decoded once here and played off the UI thread
+        self.audio = AudioEngine(self.voices_path, audio_sink)
 
     def _load_image(self, name):
         path = os.path.join(self.base_path, name)
@@ -37,21 +276,458 @@ class AssetManager:
             print(f"[WARN] Asset not found: {name} at {path}")
         return None
 
-    def play_voice(self, filename):
-        self._play_sound_file(os.path.join(self.voices_path, filename))
+    def premultiplied_icon(self, icon, height):
+        # Resized once per (icon, height); returns (premultiplied colour, alpha) as float32
+        key = (id(icon), height)
+        cached = self._icon_cache.get(key)
+        if cached is None:
+            # Maintain aspect ratio
+            new_w = int(height * icon.shape[1] / icon.shape[0])
+            resized = cv2.resize(icon, (new_w, height), interpolation=cv2.INTER_AREA).astype(np.float32)
+            if resized.shape[2] == 4:
+                a = resized[:, :, 3] / 255.0
+                cached = (resized[:, :, :3] * a[..., None], a)
+            else:
+                cached = (resized[:, :, :3], np.ones(resized.shape[:2], np.float32))
+            self._icon_cache[key] = cached
+        return cached
+
+    def prewarm_icons(self, heights):
+        # Scale the arch icons before the first frame needs them
+        for icon in (self.icon_lower, self.icon_upper):
+            if icon is None: continue
+            for height in heights: self.premultiplied_icon(icon, height)
+
+    def play_voice(self, filename, interrupt=True):
+        # Never blocks: a new instruction replaces the one still playing unless interrupt=False
+        if not self.audio.play(filename, interrupt): print(f"[WARN] Voice prompt not played: {filename}")
+
+    def close(self):
+        self.audio.close()
 
-    def _play_sound_file(self, path):
-        if not os.path.exists(path): return
-        if self.system == "Windows":
-            import winsound
-            winsound.PlaySound(path, winsound.SND_ASYNC | winsound.SND_FILENAME)
-        elif self.system == "Darwin": # macOS
-            os.system(f"afplay '{path}' &")
-        elif self.system == "Linux":
-            os.system(f"aplay '{path}' &")
+# ==========================================
+# 2. Frame Sources
+# ==========================================
+
+class FrameSource:
+    # Common interface for live and recorded input: read() -> (ret, frame)
+    def __init__(self, fps=30.0, realtime=False):
+        self.fps = fps
+        self.realtime = realtime
+        self.frames_read = 0
+        self._next_due = None
+
+    def is_opened(self):
+        return False
+
+    def read(self):
+        return False, None
+
+    def release(self):
+        pass
+
+    def _pace(self):
+        # Replay at the recorded rate so the display behaves like a live scope
+        if not self.realtime or self.fps <= 0: return
+        now = time.monotonic()
+        if self._next_due is None: self._next_due = now
+        if self._next_due > now: time.sleep(self._next_due - now)
+        self._next_due = max(self._next_due + 1.0 / self.fps, time.monotonic() - 1.0 / self.fps)
+
+class CameraSource(FrameSource):
+    def __init__(self, index=0, width=1920, height=1080):
+        super().__init__()
+        self.name = f"camera:{index}"
+        self.cap = cv2.VideoCapture(index)
+        # High Res attempt
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        if fps and fps > 0: self.fps = fps
+
+    def is_opened(self):
+        return self.cap.isOpened()
+
+    def read(self):
+        ret, frame = self.cap.read()
+        if ret: self.frames_read += 1
+        return ret, frame
+
+    def release(self):
+        self.cap.release()
+
+class VideoFileSource(FrameSource):
+    def __init__(self, path, realtime=False, loop=False):
+        super().__init__(realtime=realtime)
+        self.name = os.path.basename(path)
+        self.path = path
+        self.loop = loop
+        self.cap = cv2.VideoCapture(path)
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        if fps and fps > 0: self.fps = fps
+
+    def is_opened(self):
+        return self.cap.isOpened()
+
+    def read(self):
+        self._pace()
+        ret, frame = self.cap.read()
+        if not ret and self.loop and self.frames_read > 0:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read()
+        if ret: self.frames_read += 1
+        return ret, frame
+
+    def release(self):
+        self.cap.release()
+
+class ImageDirSource(FrameSource):
+    IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp")
+
+    def __init__(self, path, fps=30.0, realtime=False, loop=False):
+        super().__init__(fps=fps, realtime=realtime)
+        self.name = os.path.basename(os.path.normpath(path))
+        self.path = path
+        self.loop = loop
+        self.files = sorted(f for f in glob.glob(os.path.join(path, "*")) if f.lower().endswith(self.IMAGE_EXTS))
+        self._index = 0
+
+    def is_opened(self):
+        return len(self.files) > 0
+
+    def read(self):
+        # An image that does not decode is logged and dropped from the list; the replay goes on with the next
+        self._pace()
+        while True:
+            if self._index >= len(self.files):
+                if not self.loop or not self.files: return False, None
+                self._index = 0
+            frame = cv2.imread(self.files[self._index], cv2.IMREAD_COLOR)
+            if frame is not None: break
+            print(f"[ERR] Could not decode {self.files[self._index]}, skipping it")
+            del self.files[self._index]
+        self._index += 1
+        self.frames_read += 1
+        return True, frame
+
+def open_frame_source(spec, realtime=True, loop=False):
+    # "0", "1", ... -> USB camera index, directory -> image replay, anything else -> video file
+    spec = str(spec)
+    if spec.isdigit(): return CameraSource(int(spec))
+    if os.path.isdir(spec): return ImageDirSource(spec, realtime=realtime, loop=loop)
+    return VideoFileSource(spec, realtime=realtime, loop=loop)
 
 # ==========================================
-# 2. Data Structures
+# 3. Frame Ring (zero-copy handoff)
+# ==========================================
+
+class FrameRing:
+    # Preallocated, sequence-numbered frame slots shared by the display loop and the guidance threads.
+    # The writer always fills the oldest unpinned slot (drop-oldest); readers borrow a read-only view
+    # and must release() it. A borrowed slot is never overwritten.
+    def __init__(self, slots=4):
+        self._n = slots
+        self._buffers = [None] * slots
+        self._seqs = [-1] * slots
+        self._stamps = [0.0] * slots # time.monotonic() when the frame arrived
+        self._refs = [0] * slots
+        self._seen = [True] * slots
+        self._cond = threading.Condition()
+        self._latest = -1
+        self._writing = -1
+        self._next_seq = 0
+        self.dropped = 0   # published frames overwritten before any reader borrowed them
+        self.overruns = 0  # incoming frames refused because every slot was pinned
+        self.on_commit = None # (seq), called after each new frame is published, outside the lock
+
+    @property
+    def latest_seq(self):
+        with self._cond:
+            return self._seqs[self._latest] if self._latest >= 0 else -1
+
+    def begin_write(self, shape, dtype=np.uint8):
+        with self._cond:
+            idx, oldest = -1, None
+            for i in range(self._n):
+                if self._refs[i] or i == self._latest or i == self._writing: continue
+                if oldest is None or self._seqs[i] < oldest: idx, oldest = i, self._seqs[i]
+            if idx < 0:
+                self.overruns += 1
+                return None
+            if self._seqs[idx] >= 0 and not self._seen[idx]: self.dropped += 1
+            self._seqs[idx] = -1
+            self._writing = idx
+        buf = self._buffers[idx]
+        if buf is None or buf.shape != shape or buf.dtype != dtype:
+            # Only happens once per slot per resolution
+            buf = self._buffers[idx] = np.empty(shape, dtype)
+        return buf
+
+    def commit_write(self, stamp=None):
+        with self._cond:
+            idx = self._writing
+            if idx < 0: return -1
+            seq = self._next_seq
+            self._next_seq += 1
+            self._seqs[idx] = seq
+            self._stamps[idx] = time.monotonic() if stamp is None else stamp
+            self._seen[idx] = False
+            self._latest = idx
+            self._writing = -1
+            self._cond.notify_all()
+        if self.on_commit: self.on_commit(seq)
+        return seq
+
+    def abort_write(self):
+        with self._cond:
+            self._writing = -1
+
+    def write(self, frame, flip=None, stamp=None):
+        # Copy (or mirror, which costs the same single pass) straight into a ring slot
+        buf = self.begin_write(frame.shape, frame.dtype)
+        if buf is None: return -1
+        if flip is None: np.copyto(buf, frame)
+        else: cv2.flip(frame, flip, dst=buf)
+        return self.commit_write(stamp)
+
+    def stamp(self, seq):
+        # Arrival time of a frame still held in the ring, else None
+        with self._cond:
+            for i in range(self._n):
+                if self._seqs[i] == seq and seq >= 0: return self._stamps[i]
+            return None
+
+    def _lend(self, idx):
+        self._refs[idx] += 1
+        self._seen[idx] = True
+        view = self._buffers[idx].view()
+        view.flags.writeable = False
+        return view
+
+    def borrow_latest(self, after_seq=-1):
+        with self._cond:
+            if self._latest < 0 or self._seqs[self._latest] <= after_seq: return None, None
+            return self._seqs[self._latest], self._lend(self._latest)
+
+    def borrow(self, seq):
+        with self._cond:
+            for i in range(self._n):
+                if self._seqs[i] == seq and seq >= 0: return self._lend(i)
+            return None
+
+    def release(self, seq):
+        with self._cond:
+            for i in range(self._n):
+                if self._seqs[i] == seq and self._refs[i] > 0:
+                    self._refs[i] -= 1
+                    return
+
+    def wait_newer(self, after_seq, timeout=None):
+        with self._cond:
+            return self._cond.wait_for(lambda: self._latest >= 0 and self._seqs[self._latest] > after_seq, timeout)
+
+    def wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+class FrameGrabber:
+    # Drains a FrameSource on its own thread so the driver queue never backs up behind the UI.
+    # Every frame is stamped on arrival and published into the ring; consumers only ever take
+    # the newest one, so slow display or analysis skips frames instead of lagging behind.
+    def __init__(self, source, ring, flip=None):
+        self.source = source
+        self.ring = ring
+        self.flip = flip
+        self.profiler = None # optional StageProfiler, gets "read" and "publish"
+        self.frames_grabbed = 0
+        self.frames_refused = 0 # ring had no free slot (every slot pinned)
+        self.finished = threading.Event() # source exhausted or failed
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop_event.clear()
+        self.finished.clear()
+        self._thread = threading.Thread(target=self._run, name="FrameGrabber", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread: self._thread.join(timeout=2.0)
+        self._thread = None
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            t0 = time.perf_counter()
+            ret, frame = self.source.read()
+            stamp = time.monotonic()
+            if not ret: break
+            t1 = time.perf_counter()
+            seq = self.ring.write(frame, self.flip, stamp)
+            if seq < 0: self.frames_refused += 1
+            else: self.frames_grabbed += 1
+            if self.profiler:
+                self.profiler.record("read", t1 - t0, seq)
+                self.profiler.record("publish", time.perf_counter() - t1, seq)
+        self.finished.set()
+        self.ring.wake()
+
+    def next_frame(self, after_seq, timeout=0.1):
+        # Block until a frame newer than after_seq exists; returns (seq, read-only view) or (None, None).
+        # The caller must release(seq) on the ring.
+        if not self.ring.wait_newer(after_seq, timeout): return None, None
+        return self.ring.borrow_latest(after_seq)
+
+# ==========================================
+# 4. Instrumentation
+# ==========================================
+
+class StageProfiler:
+    # Thread-safe per-stage latency histograms plus a bounded event trace for export.
+    # Histogram bins are log-spaced (20 per decade, 1 us .. 10 s), so percentiles are within ~6%.
+    BIN_EDGES_MS = np.logspace(-3, 4, 141)
+    MAX_EVENTS = 200000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hists = {}
+        self._events = deque(maxlen=self.MAX_EVENTS) # (t_monotonic, stage, ms, seq)
+        self.started_at = time.monotonic()
+        self.enabled = True
+
+    def record(self, stage, seconds, seq=-1):
+        if not self.enabled: return
+        ms = seconds * 1000.0
+        b = int(np.searchsorted(self.BIN_EDGES_MS, ms))
+        with self._lock:
+            hist = self._hists.get(stage)
+            if hist is None: hist = self._hists[stage] = [np.zeros(len(self.BIN_EDGES_MS) + 1, np.int64), 0, 0.0, 0.0]
+            hist[0][b] += 1
+            hist[1] += 1
+            hist[2] += ms
+            hist[3] = max(hist[3], ms)
+            self._events.append((time.monotonic(), stage, ms, seq))
+
+    def _percentile(self, counts, q):
+        target = q / 100.0 * counts.sum()
+        b = int(np.searchsorted(np.cumsum(counts), target))
+        edges = self.BIN_EDGES_MS
+        if b == 0: return float(edges[0])
+        if b >= len(edges): return float(edges[-1])
+        return float(np.sqrt(edges[b - 1] * edges[b])) # geometric bin centre
+
+    def summary(self):
+        with self._lock:
+            hists = {k: (v[0].copy(), v[1], v[2], v[3]) for k, v in self._hists.items()}
+        # Bin centres can overshoot the true maximum, so clamp to it
+        return {stage: {"n": n, "mean_ms": total / n, "p50_ms": min(self._percentile(counts, 50), peak),
+                        "p90_ms": min(self._percentile(counts, 90), peak), "p99_ms": min(self._percentile(counts, 99), peak), "max_ms": peak}
+                for stage, (counts, n, total, peak) in hists.items() if n}
+
+    def hud_lines(self, stages=None):
+        summary = self.summary()
+        lines = [f"{'stage':<14}{'p50':>7}{'p90':>7}{'p99':>7}"]
+        for stage in stages or sorted(summary):
+            st = summary.get(stage)
+            if st: lines.append(f"{stage:<14}{st['p50_ms']:>7.1f}{st['p90_ms']:>7.1f}{st['p99_ms']:>7.1f}")
+        return lines
+
+    def reset(self):
+        with self._lock:
+            self._hists = {}
+            self._events.clear()
+            self.started_at = time.monotonic()
+
+    def export(self, base_path):
+        # Writes <base>.json (summary + raw events) and <base>.csv (one row per event)
+        with self._lock: events = list(self._events)
+        t0 = self.started_at
+        with open(base_path + ".json", "w") as f:
+            json.dump({"summary": self.summary(), "duration_s": time.monotonic() - t0,
+                       "events": [{"t_s": round(t - t0, 6), "stage": st, "ms": round(ms, 4), "seq": seq}
+                                  for t, st, ms, seq in events]}, f)
+        with open(base_path + ".csv", "w") as f:
+            f.write("t_s,stage,ms,seq\n")
+            for t, st, ms, seq in events: f.write(f"{t - t0:.6f},{st},{ms:.4f},{seq}\n")
+        print(f"[TRACE] Exported {len(events)} events to {base_path}.json/.csv")
+
+class StartupTimer:
+    # Startup milestones in ms since PROCESS_T0, each recorded once (safe from any thread):
+    # "assets", "source 1 open", ..., "scope1 first_frame" (TTFF), "scope1 first_guidance" (TTFG)
+    def __init__(self, t0=None, verbose=True):
+        self.t0 = PROCESS_T0 if t0 is None else t0
+        self.verbose = verbose
+        self.marks = {}
+        self._lock = threading.Lock()
+
+    def mark(self, name):
+        with self._lock:
+            if name in self.marks: return False
+            ms = self.marks[name] = (time.perf_counter() - self.t0) * 1000.0
+        if self.verbose: print(f"[STARTUP] {name}: {ms:.0f} ms")
+        return True
+
+class SystemClock:
+    # Capture timing in the live app
+    def now(self):
+        return time.monotonic()
+
+class ReplayClock:
+    # Media time for lockstep/batch replays: set() it from the frame index before handing the frame over
+    def __init__(self, t=0.0):
+        self.t = t
+
+    def set(self, t):
+        self.t = t
+
+    def now(self):
+        return self.t
+
+class MotionTraceRecorder:
+    # Per motion step: clock time, raw (unsmoothed) motion and the odometry increment, so sweep.py can
+    # re-run smoothing, hysteresis and capture decisions offline for any thresholds.
+    FIELDS = ("t", "seq", "mu_raw", "sigma_raw", "dx", "dy", "active", "quality", "segment")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._rows = []
+            self.segments = ["default"]
+            self._segment = 0
+
+    def begin_segment(self, name):
+        # A new odometry track (arch) starts here
+        with self._lock:
+            self.segments.append(name)
+            self._segment = len(self.segments) - 1
+
+    def record(self, t, seq, mu_raw, sigma_raw, dx, dy, active, quality=True):
+        # quality: the live image-quality gate passed (its thresholds are not replayed)
+        with self._lock: self._rows.append((t, seq, mu_raw, sigma_raw, dx, dy, active, quality, self._segment))
+
+    def __len__(self):
+        return len(self._rows)
+
+    def save(self, path, **meta):
+        with self._lock: rows, segments = list(self._rows), list(self.segments)
+        cols = np.array(rows, np.float64).reshape(-1, len(self.FIELDS)).T
+        np.savez_compressed(path, segments=np.array(segments), meta=json.dumps(meta),
+                            **{name: col for name, col in zip(self.FIELDS, cols)})
+        print(f"[TRACE] Saved {len(rows)} motion steps to {path}")
+
+    @staticmethod
+    def load(path):
+        # -> (dict of field arrays, segment names, meta dict)
+        # Traces recorded before quality gating have no "quality" column: every step passed
+        with np.load(path) as z:
+            return ({name: z[name] if name in z.files else np.ones_like(z["t"]) for name in MotionTraceRecorder.FIELDS},
+                    [str(x) for x in z["segments"]], json.loads(str(z["meta"])))
+
+# ==========================================
+# 5. Data Structures
 # ==========================================
 
 @dataclass
@@ -60,12 +736,26 @@ class MotionState:
     sigma: float = 0.0
     speed_warning: bool = False
     stability_warning: bool = False
+    frame_ts: float = 0.0 # time.monotonic() arrival of the frame this was measured on
+    frame_seq: int = -1   # ring sequence ID of that frame
+    travel: float = 0.0   # odometry distance since the last capture (inf before the first)
+    brightness: float = 0.0 # mean gray level of the last analysed motion ROI
+    glare: float = 0.0      # fraction of its pixels at or above QualityMeter.GLARE_LEVEL
+    focus: float = 0.0      # focus_score of the motion ROI at motion_width
+    exposure_warning: bool = False
+    glare_warning: bool = False
+    blur_warning: bool = False
+
+    @property
+    def quality_ok(self):
+        return not (self.exposure_warning or self.glare_warning or self.blur_warning)
 
 @dataclass
 class GuidanceResult:
     prompt: str
     color: tuple
     motion: MotionState
+    frame_seq: int = -1 # frame the guidance was computed from (same as motion.frame_seq)
 
 class ScanningState(Enum):
     READY_TO_SCAN_LOWER = auto()
@@ -75,18 +765,22 @@ class ScanningState(Enum):
     COMPLETE = auto()
 
 # ==========================================
-# 3. Logic: Hysteresis & Guidance
+# 6. Logic: Hysteresis & Guidance
 # ==========================================
 
 class HysteresisState:
     def __init__(self, enter_threshold, clear_threshold, k_confirm=5):
-        self._enter_threshold = enter_threshold
-        self._clear_threshold = clear_threshold
-        self._k_confirm = k_confirm
+        self.set_thresholds(enter_threshold, clear_threshold, k_confirm)
         self._enter_counter = 0
         self._clear_counter = 0
         self.is_warning = False
 
+    def set_thresholds(self, enter_threshold, clear_threshold, k_confirm=5):
+        # Takes effect from the next update(); the counters and the current warning are kept
+        self._enter_threshold = enter_threshold
+        self._clear_threshold = clear_threshold
+        self._k_confirm = k_confirm
+
     def update(self, value):
         if not self.is_warning:
             if value >= self._enter_threshold: self._enter_counter += 1
@@ -101,131 +795,719 @@ class HysteresisState:
                 self.is_warning = False
                 self._clear_counter = 0
 
+class OpticalFlowEngine:
+    # Sparse pyramidal LK tracker, tracks filtered on the status flag.
+    # fb_thresh enables a forward-backward consistency check: a second, backward pass from the tracked
+    # points, seeded with the original ones and solved at full resolution only (maxLevel=0); a track that
+    # does not return within FB_THRESH px is dropped. It rejects drifting tracks on low-texture enamel,
+    # but costs ~20% more per frame than the single pass (benchmark.py --suite flow), so it is opt-in.
+    def __init__(self, max_corners=100, min_corners=40, win_size=(15, 15), max_level=2, fb_thresh=None):
+        self.MAX_CORNERS = max_corners
+        self.MIN_CORNERS = min_corners
+        self.WIN_SIZE = win_size
+        self.MAX_LEVEL = max_level
+        self.FB_THRESH = fb_thresh
+        self.CRITERIA = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03)
+        self._prev_gray = None
+        self._pts = None
+        self._flow_seed = np.zeros((1, 1, 2), np.float32)
+        self.detections = 0
+        self.fb_rejected = 0
+
+    def reset(self):
+        self._prev_gray, self._pts = None, None
+        self._flow_seed[:] = 0
+
+    def needs_features(self):
+        return self._prev_gray is None or self._pts is None or len(self._pts) < self.MIN_CORNERS
+
+    def detect(self, gray):
+        self._pts = cv2.goodFeaturesToTrack(gray, self.MAX_CORNERS, 0.01, 8, blockSize=3)
+        self._flow_seed[:] = 0
+        self._prev_gray = gray
+        self.detections += 1
+
+    def track(self, gray):
+        # -> (good_new, good_old) as (N, 2) arrays, or None when too few tracks survive (forces a re-detect)
+        prev_gray, prev_pts = self._prev_gray, self._pts
+        self._prev_gray = gray
+        next_pts, status, _ = cv2.calcOpticalFlowPyrLK(prev_gray, gray, prev_pts, prev_pts + self._flow_seed,
+                                                       winSize=self.WIN_SIZE, maxLevel=self.MAX_LEVEL,
+                                                       criteria=self.CRITERIA, flags=cv2.OPTFLOW_USE_INITIAL_FLOW)
+        if next_pts is None:
+            self._pts = None
+            return None
+        ok = status.ravel() == 1
+        if self.FB_THRESH is not None:
+            back_pts, back_status, _ = cv2.calcOpticalFlowPyrLK(gray, prev_gray, next_pts, prev_pts.copy(),
+                                                                winSize=self.WIN_SIZE, maxLevel=0, criteria=self.CRITERIA,
+                                                                flags=cv2.OPTFLOW_USE_INITIAL_FLOW)
+            fb_err = np.abs(back_pts - prev_pts).reshape(-1, 2).max(axis=1)
+            tracked = ok & (back_status.ravel() == 1)
+            ok = tracked & (fb_err < self.FB_THRESH)
+            self.fb_rejected += int(np.count_nonzero(tracked & ~ok))
+        good_new = next_pts.reshape(-1, 2)[ok]
+        good_old = prev_pts.reshape(-1, 2)[ok]
+        if len(good_new) < self.MIN_CORNERS:
+            self._pts = None
+            self._flow_seed[:] = 0
+            return None
+        self._flow_seed[0, 0] = np.median(good_new - good_old, axis=0)
+        self._pts = good_new.reshape(-1, 1, 2)
+        return good_new, good_old
+
+class MotionEstimator:
+    # Backend interface for GuidanceSystem: estimate(gray) -> (mu, sigma, dx, dy) in downscaled-ROI pixels
+    # between this frame and the previous one it was given, or None while (re)initialising.
+    # (dx, dy) is the dominant image shift, used for odometry.
+    name = "base"
+    resets = 0 # times the backend lost its reference and had to start over
+
+    def reset(self):
+        pass
+
+    def estimate(self, gray):
+        return None
+
+class LKMotionEstimator(MotionEstimator):
+    # Sparse corners: mu is the mean track length, sigma the spread of track lengths
+    name = "lk"
+    FB_THRESH = None
+
+    def __init__(self):
+        self.flow = OpticalFlowEngine(max_corners=100, min_corners=40, fb_thresh=self.FB_THRESH)
+        # Scratch for the per-track statistics, sized for the most tracks the engine can return
+        self._vec = np.empty((self.flow.MAX_CORNERS, 2), np.float32)
+        self._dist = np.empty(self.flow.MAX_CORNERS, np.float32)
+
+    @property
+    def resets(self):
+        return self.flow.detections
+
+    def reset(self):
+        self.flow.reset()
+
+    def estimate(self, gray):
+        if self.flow.needs_features():
+            self.flow.detect(gray)
+            return None
+        tracked = self.flow.track(gray)
+        if tracked is None: return None
+        good_new, good_old = tracked
+        n = len(good_new)
+        flow, dists = self._vec[:n], self._dist[:n]
+        np.subtract(good_new, good_old, out=flow)
+        dx, dy = np.median(flow, axis=0)
+        np.hypot(flow[:, 0], flow[:, 1], out=dists)
+        mu = float(dists.sum()) / n
+        # Population std in place: dists is scratch from here on
+        np.subtract(dists, mu, out=dists)
+        sigma = float(np.sqrt(np.dot(dists, dists) / n)) if n > 1 else 0.0
+        return mu, sigma, float(dx), float(dy)
+
+class LKForwardBackwardEstimator(LKMotionEstimator):
+    # "lk" plus the forward-backward check, which drops drifting tracks at the cost of a second LK pass
+    name = "lk-fb"
+    FB_THRESH = 1.0
+
+class PhaseCorrelationEstimator(MotionEstimator):
+    # Global FFT phase correlation on a Hann-windowed copy of the ROI, so low-texture enamel/gum never
+    # runs out of corners. mu is the global shift; sigma is the spread of the shifts of 2x2 tiles, which
+    # rises with rotation, zoom and shake just like the LK track-length spread.
+    name = "phase"
+
+    def __init__(self, scale=0.5, min_response=0.05):
+        self.SCALE = scale
+        self.MIN_RESPONSE = min_response
+        self._prev = None
+        self._windows = {}
+        self._bufs = {} # shape -> (uint8 resize target, two float32 buffers used alternately)
+        self._next = 0
+
+    def reset(self):
+        self._prev = None
+
+    def _window(self, shape):
+        win = self._windows.get(shape)
+        if win is None: win = self._windows[shape] = cv2.createHanningWindow((shape[1], shape[0]), cv2.CV_32F)
+        return win
+
+    def _prepare(self, gray):
+        # Into preallocated buffers; the other float buffer still holds the previous frame
+        h, w = gray.shape
+        size = (w, h) if self.SCALE == 1.0 else (int(round(w * self.SCALE)), int(round(h * self.SCALE)))
+        bufs = self._bufs.get(size)
+        if bufs is None:
+            bufs = self._bufs[size] = (np.empty((size[1], size[0]), np.uint8), [np.empty((size[1], size[0]), np.float32) for _ in range(2)])
+        small, floats = bufs
+        out = floats[self._next]
+        self._next ^= 1
+        if self.SCALE == 1.0: np.copyto(out, gray)
+        else: np.copyto(out, cv2.resize(gray, size, dst=small, interpolation=cv2.INTER_AREA))
+        return out
+
+    def estimate(self, gray):
+        cur = self._prepare(gray)
+        prev, self._prev = self._prev, cur
+        if prev is None or prev.shape != cur.shape:
+            self.resets += 1
+            return None
+        (dx, dy), response = cv2.phaseCorrelate(prev, cur, self._window(cur.shape))
+        if response < self.MIN_RESPONSE:
+            self.resets += 1
+            return None
+        h, w = cur.shape
+        th, tw = h // 2, w // 2
+        tile_win = self._window((th, tw))
+        mags = []
+        for y in (0, th):
+            for x in (0, tw):
+                (tx, ty), _ = cv2.phaseCorrelate(prev[y:y+th, x:x+tw], cur[y:y+th, x:x+tw], tile_win)
+                mags.append(np.hypot(tx, ty))
+        inv = 1.0 / self.SCALE
+        return float(np.hypot(dx, dy)) * inv, float(np.std(mags)) * inv, dx * inv, dy * inv
+
+MOTION_BACKENDS = {"lk": LKMotionEstimator, "lk-fb": LKForwardBackwardEstimator, "phase": PhaseCorrelationEstimator}
+
+class MotionScheduler:
+    # Decides which frames the motion worker analyses and at what width, so that its average cost per
+    # camera frame stays within BUDGET_MS. Over budget it first analyses less often, then shrinks the
+    # image; with headroom it restores the width first, then the cadence, then spends the rest on detail.
+    # Fast motion caps the cadence, because long gaps break tracking exactly when it matters.
+    def __init__(self, budget_ms=5.0, width=480, min_width=320, max_width=640, max_every_n=4, fast_motion=8.0):
+        self.BUDGET_MS = budget_ms
+        self.MAX_EVERY_N = max_every_n
+        self.FAST_MOTION = fast_motion
+        self.ADJUST_EVERY = 10 # analysed frames between adjustments
+        self.widths = list(range(min_width, max_width + 1, 80))
+        if width not in self.widths: self.widths = sorted(set(self.widths + [width]))
+        self._default_idx = self.widths.index(width)
+        self.width_idx = self._default_idx
+        self.every_n = 1
+        self.cost_ms = None
+        self.pinned = False
+        self._since_analysed = 0
+        self._since_adjust = 0
+
+    def pin(self):
+        # Every frame at the starting width from now on, whatever it costs (reproducible offline replays)
+        self.width_idx, self.every_n, self.pinned = self._default_idx, 1, True
+
+    @property
+    def width(self):
+        return self.widths[self.width_idx]
+
+    def should_analyse(self):
+        self._since_analysed += 1
+        if self._since_analysed >= self.every_n:
+            self._since_analysed = 0
+            return True
+        return False
+
+    def record(self, cost_s, mu):
+        ms = cost_s * 1000.0
+        self.cost_ms = ms if self.cost_ms is None else 0.8 * self.cost_ms + 0.2 * ms
+        if self.pinned: return False
+        cap = 1 if mu > self.FAST_MOTION else self.MAX_EVERY_N
+        if self.every_n > cap:
+            self.every_n = cap
+            self._since_adjust = 0
+        self._since_adjust += 1
+        if self._since_adjust < self.ADJUST_EVERY: return False
+        self._since_adjust = 0
+
+        per_frame = self.cost_ms / self.every_n
+        if per_frame > self.BUDGET_MS:
+            if self.every_n < cap: self.every_n += 1
+            elif self.width_idx > 0: self.width_idx -= 1
+            else: return False
+            return True
+        if per_frame < 0.5 * self.BUDGET_MS:
+            if self.width_idx < self._default_idx: self.width_idx += 1
+            elif self.every_n > 1: self.every_n -= 1
+            elif self.width_idx < len(self.widths) - 1: self.width_idx += 1
+            else: return False
+            return True
+        return False
+
+def focus_score(gray, lap=None):
+    # Variance of the Laplacian: cheap, monotonic in sharpness for a fixed scene. lap: optional int16 scratch buffer
+    lap = cv2.Laplacian(gray, cv2.CV_16S, dst=lap, ksize=3)
+    _, std = cv2.meanStdDev(lap)
+    return float(std[0, 0]) ** 2
+
+class QualityMeter:
+    # Exposure and specular glare from one 256-bin histogram of the small motion gray; together with
+    # focus_score this is the whole image-quality stage (well under 0.1 ms at 480px).
+    GLARE_LEVEL = 250 # gray level counted as saturated (LED reflections on wet enamel)
+
+    def __init__(self):
+        self._hist = np.empty((256, 1), np.float32)
+        self._levels = np.arange(256, dtype=np.float32)
+
+    def measure(self, gray):
+        # -> (mean gray level, fraction of saturated pixels)
+        hist = cv2.calcHist([gray], [0], None, [256], [0, 256], hist=self._hist)[:, 0]
+        n = float(gray.size)
+        return float(np.dot(self._levels, hist)) / n, float(hist[self.GLARE_LEVEL:].sum()) / n
+
+class MotionPreprocessor:
+    # Frame -> small gray motion ROI through buffers allocated once per (frame size, width) and kept, so the
+    # scheduler switching widths back and forth does not reallocate. The ROI is nearest-resized in BGR and
+    # then converted: nearest sampling picks the same pixels either way, and converting after the resize
+    # touches ~4x fewer pixels than gray-first. Gray outputs alternate between two buffers, so the estimator
+    # may keep the previous gray while the next one is written.
+    ROI = (0.2, 0.8, 0.15, 0.85) # y0, y1, x0, x1 as fractions of the frame
+
+    def __init__(self):
+        self._sets = {} # (h, w, width) -> [small BGR, [gray, gray], Laplacian scratch, next gray index]
+        self.lap = None # Laplacian scratch for focus_score, matching the last returned gray
+
+    @property
+    def allocations(self):
+        return len(self._sets)
+
+    def process(self, frame, width):
+        # Returned gray is an internal buffer: valid until the call after next at the same width
+        h, w = frame.shape[:2]
+        y0, y1, x0, x1 = int(h*self.ROI[0]), int(h*self.ROI[1]), int(w*self.ROI[2]), int(w*self.ROI[3])
+        bufs = self._sets.get((h, w, width))
+        if bufs is None:
+            out_h = int((y1 - y0) * width / (x1 - x0))
+            bufs = self._sets[(h, w, width)] = [np.empty((out_h, width, 3), np.uint8),
+                                                [np.empty((out_h, width), np.uint8) for _ in range(2)],
+                                                np.empty((out_h, width), np.int16), 0]
+        small, grays, self.lap, i = bufs
+        bufs[3] = i ^ 1
+        cv2.resize(frame[y0:y1, x0:x1], (width, small.shape[0]), dst=small, interpolation=cv2.INTER_NEAREST)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY, dst=grays[i])
+
+class WorkerPool:
+    # Bounded set of threads shared by every GuidanceSystem in the process. A client that has work is
+    # queued once (repeat signals coalesce), never runs on two threads at once, and goes to the back of
+    # the queue after each step, so cameras are served round-robin and one busy scope cannot starve another.
+    # Clients implement _pool_step() -> True if more work is already pending.
+    def __init__(self, workers=2, name="GuidancePool"):
+        self.workers = workers
+        self.name = name
+        self._cond = threading.Condition()
+        self._ready = deque()
+        self._clients = {} # client -> per-client scheduling state and stats
+        self._threads = []
+        self._closed = False
+
+    def start(self):
+        with self._cond:
+            if self._threads: return
+            self._closed = False
+            self._threads = [threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True) for i in range(self.workers)]
+        for t in self._threads: t.start()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for t in self._threads: t.join(timeout=2.0)
+        self._threads = []
+
+    def register(self, client):
+        self.start()
+        with self._cond:
+            self._clients[client] = {"queued": False, "running": False, "again": False, "signalled_at": 0.0,
+                                     "steps": 0, "busy_s": 0.0, "wait_s": 0.0, "max_wait_s": 0.0}
+
+    def unregister(self, client, timeout=2.0):
+        # Returns once the client's in-flight step (if any) has finished
+        with self._cond:
+            st = self._clients.get(client)
+            if st is None: return
+            self._cond.wait_for(lambda: not st["running"], timeout)
+            del self._clients[client]
+            if client in self._ready: self._ready.remove(client)
+
+    def signal(self, client):
+        with self._cond:
+            st = self._clients.get(client)
+            if st is None: return
+            if st["running"]: st["again"] = True
+            elif not st["queued"]: self._enqueue(client, st)
+
+    def _enqueue(self, client, st):
+        st["queued"] = True
+        st["signalled_at"] = time.perf_counter()
+        self._ready.append(client)
+        self._cond.notify()
+
+    def stats(self, client=None):
+        with self._cond:
+            if client is not None:
+                st = self._clients.get(client)
+                if st is None: return None
+                n = max(1, st["steps"])
+                return {"steps": st["steps"], "busy_s": st["busy_s"], "mean_wait_ms": st["wait_s"] / n * 1000.0,
+                        "max_wait_ms": st["max_wait_s"] * 1000.0}
+            return {"workers": self.workers, "clients": len(self._clients), "ready": len(self._ready)}
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._ready or self._closed)
+                if self._closed: return
+                client = self._ready.popleft()
+                st = self._clients[client]
+                st["queued"], st["running"] = False, True
+                wait = time.perf_counter() - st["signalled_at"]
+                st["wait_s"] += wait
+                st["max_wait_s"] = max(st["max_wait_s"], wait)
+            t0 = time.perf_counter()
+            try: more = client._pool_step()
+            except Exception as e:
+                print(f"[POOL] {type(client).__name__} step failed, dropping it: {e!r}")
+                more, st["again"] = False, False
+                with self._cond: self._clients.pop(client, None)
+            with self._cond:
+                st["running"] = False
+                st["steps"] += 1
+                st["busy_s"] += time.perf_counter() - t0
+                if client in self._clients and (more or st["again"]):
+                    st["again"] = False
+                    self._enqueue(client, st)
+                self._cond.notify_all()
+
+class ArchOdometry:
+    # Running 2D position of the scanner along one arch, integrated from the per-frame image shift.
+    # Units are pixels of the ROI at the guidance motion_width, so one ROI width == motion_width.
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.x, self.y = 0.0, 0.0
+            self._capture_xy = None     # position of the last capture, None before the first one
+            self.last_step = None       # scanner movement between the last two captures
+            self.covered = 0.0          # path length between successive captures
+            self.captures = 0
+
+    def update(self, dx, dy):
+        # The scene moves opposite to the scanner
+        with self._lock:
+            self.x -= dx
+            self.y -= dy
+
+    def travel(self):
+        # Straight-line distance since the last capture; inf before the first so it fires immediately
+        with self._lock:
+            if self._capture_xy is None: return float("inf")
+            return float(np.hypot(self.x - self._capture_xy[0], self.y - self._capture_xy[1]))
+
+    def mark_capture(self):
+        with self._lock:
+            if self._capture_xy is not None:
+                self.last_step = (self.x - self._capture_xy[0], self.y - self._capture_xy[1])
+                self.covered += float(np.hypot(*self.last_step))
+            self._capture_xy = (self.x, self.y)
+            self.captures += 1
+
+    def progress(self, span):
+        # Fraction of the expected arch length covered so far (captured stretch + current travel)
+        t = self.travel()
+        with self._lock:
+            return min(1.0, (self.covered + (0.0 if t == float("inf") else t)) / span) if span > 0 else 0.0
+
 class GuidanceSystem:
-    def __init__(self, asset_manager):
+    # motion_width: width the motion thresholds, odometry and capture spacing are expressed in.
+    # best_frame_window: analysed frames kept pinned as capture candidates (sizes the frame ring).
+    # Both are fixed for the life of the instance; the uppercase parameters below may change at runtime.
+    def __init__(self, asset_manager, pool=None, motion_width=480, best_frame_window=5):
         self.assets = asset_manager
+        # Shared WorkerPool (several scopes per process); None runs on a private single-thread pool
+        self.pool = pool
+        self._own_pool = None
+        self._final_pool_stats = None
         
         # --- Parameters ---
-        self.MOTION_TARGET_WIDTH = 480
-        self.LK_EVERY_N = 3
+        self.MOTION_BACKEND = "lk" # see MOTION_BACKENDS, switchable at runtime
+        self.MOTION_BUDGET_MS = 5.0 # average motion-worker CPU per camera frame, read by the scheduler every frame
         self.CAPTURE_SPEED_THRESH = 4.0
         self.CAPTURE_STAB_THRESH = 3.0
+        self.CAPTURE_MODE = "distance" # "distance": one capture per CAPTURE_OVERLAP step along the arch, "time": legacy delay/cooldown
+        self.CAPTURE_OVERLAP = 0.6 # overlap between consecutive captures, as a fraction of the ROI width
+        self.CAPTURE_SETTLE_S = 0.2 # "distance" mode: stable this long before firing
+        self.ARCH_SPAN = 8.0 # expected arch length in ROI widths, for the progress readout
         self.CAPTURE_DELAY_S = 0.5
         self.CAPTURE_COOLDOWN_S = 1.5
+        self.SMOOTH_ALPHA = 0.8 # EMA weight of the previous smoothed motion value
+        self.SPEED_WARN_ENTER, self.SPEED_WARN_CLEAR = 15.0, 12.0
+        self.STAB_WARN_ENTER, self.STAB_WARN_CLEAR = 10.0, 8.0
+        self.WARN_CONFIRM = 5 # consecutive steps before a warning is raised or cleared
+        self.QUALITY_GATING = True # no capture while an exposure, glare or blur warning is up
+        self.EXPOSURE_MIN, self.EXPOSURE_MAX = 45.0, 210.0 # acceptable mean gray level of the motion ROI
+        self.EXPOSURE_MARGIN = 10.0 # levels back inside that band before the warning clears
+        self.GLARE_WARN_ENTER, self.GLARE_WARN_CLEAR = 0.04, 0.02 # fraction of saturated ROI pixels
+        self.FOCUS_WARN_ENTER, self.FOCUS_WARN_CLEAR = 30.0, 40.0 # focus_score at the motion width; below is blurred
+        
+        # --- Fixed at construction ---
+        self.motion_width = motion_width
+        self.best_frame_window = best_frame_window
         
         # --- State ---
         self._stop_event = threading.Event()
-        self._frame_lock = threading.Lock()
-        self._latest_frame = None
-        self._new_frame_event = threading.Event()
+        self._motion_task = None
+        self._state_task = None
+        self.frame_ring = FrameRing(best_frame_window + 3)
         self._motion_state_lock = threading.Lock()
         self._motion_state = MotionState()
-        self._motion_updated_event = threading.Event()
         self._is_processing_active = False
+        self._candidates_lock = threading.Lock()
+        self._candidates = deque() # (seq, focus), each holding a ring borrow
+        self.scheduler = MotionScheduler(self.MOTION_BUDGET_MS, motion_width)
+        self.preprocessor = MotionPreprocessor()
+        self._capture_window = (-1, -1) # first/last frame seq of the stable interval that fired the capture
         
+        self.clock = SystemClock() # drives capture timing; ReplayClock for lockstep replays
+        self.trace_recorder = None # optional MotionTraceRecorder
+        self._odometry = {}
+        self.odometry = self.select_odometry("default")
         self.on_guidance_updated = None
         self.on_capture_triggered = None
+        self.profiler = StageProfiler()
+        self.on_stage_timing = None # (stage_name, seconds), called from worker threads
+        self.on_stopped = None # called once no more pool steps will run
+        self.on_step_failed = None # (exception), from the pool thread; the pool drops this system afterwards
 
     def start(self):
-        if not self._stop_event.is_set():
-            self._stop_event.clear()
-            threading.Thread(target=self._motion_worker, daemon=True).start()
-            threading.Thread(target=self._state_worker, daemon=True).start()
+        if self._motion_task is not None or self._stop_event.is_set(): return
+        if self.pool is None: self.pool = self._own_pool = WorkerPool(1, name="Guidance")
+        self._state_task = self._state_worker()
+        next(self._state_task)
+        self._motion_task = self._motion_worker()
+        self.pool.register(self)
+        self.frame_ring.on_commit = lambda seq: self.pool.signal(self)
+        self.pool.signal(self)
 
     def stop(self):
         self._stop_event.set()
-        self._new_frame_event.set()
-        self._motion_updated_event.set()
+        self.frame_ring.on_commit = None
+        self.frame_ring.wake()
+        # Let an in-flight step (and its capture callback) finish before anyone flushes its output
+        if self.pool:
+            self._final_pool_stats = self.pool.stats(self)
+            self.pool.unregister(self)
+        if self._own_pool: self._own_pool.close()
+        with self._candidates_lock:
+            while self._candidates: self.frame_ring.release(self._candidates.popleft()[0])
+        if self.on_stopped: self.on_stopped()
 
     def set_processing_active(self, is_active):
         self._is_processing_active = is_active
 
-    def process_frame(self, frame):
-        if self._stop_event.is_set(): return
-        with self._frame_lock:
-            self._latest_frame = frame.copy()
-        self._new_frame_event.set()
+    def select_odometry(self, name):
+        # Subsequent motion is integrated into (and captures spaced along) this track, e.g. per arch
+        track = self._odometry.get(name)
+        if track is None: track = self._odometry[name] = ArchOdometry(name)
+        self.odometry = track
+        if self.trace_recorder is not None: self.trace_recorder.begin_segment(name)
+        return track
+
+    def capture_spacing(self):
+        return (1.0 - self.CAPTURE_OVERLAP) * self.motion_width
+
+    def progress(self):
+        return self.odometry.progress(self.ARCH_SPAN * self.motion_width)
+
+    def set_motion_backend(self, name):
+        # Picked up by the motion worker on its next iteration
+        if name not in MOTION_BACKENDS: raise ValueError(f"Unknown motion backend: {name}")
+        self.MOTION_BACKEND = name
+        print(f"[GUIDANCE] Motion backend: {name}")
+
+    def process_frame(self, frame, flip=None, stamp=None):
+        # Single pass into the ring; pass flip=1 to mirror on the way in. Returns the frame's sequence ID.
+        if self._stop_event.is_set(): return -1
+        return self.frame_ring.write(frame, flip, stamp)
+
+    def pool_stats(self):
+        # Scheduling stats on the pool (kept after stop())
+        live = self.pool.stats(self) if self.pool else None
+        return live or self._final_pool_stats
+
+    def _pool_step(self):
+        # One scheduling quantum: analyse the newest frame, if there is one, and update guidance from it
+        if self._stop_event.is_set(): return False
+        try: return next(self._motion_task)
+        except Exception as e:
+            if self.on_step_failed: self.on_step_failed(e)
+            raise
+
+    def _record(self, stage, seconds, seq=-1):
+        self.profiler.record(stage, seconds, seq)
+        if self.on_stage_timing: self.on_stage_timing(stage, seconds)
+
+    def borrow_latest_frame(self):
+        # Zero-copy read-only view; the caller must release_frame(seq)
+        return self.frame_ring.borrow_latest()
+
+    def release_frame(self, seq):
+        self.frame_ring.release(seq)
 
     def get_latest_frame(self):
-        with self._frame_lock:
-            return self._latest_frame.copy() if self._latest_frame is not None else None
+        seq, frame = self.frame_ring.borrow_latest()
+        if frame is None: return None
+        try: return frame.copy()
+        finally: self.frame_ring.release(seq)
+
+    def motion_state(self):
+        # Latest smoothed MotionState, from any thread
+        with self._motion_state_lock: return self._motion_state
+
+    def get_best_frame(self, first_seq=None, last_seq=None):
+        # Sharpest pinned candidate measured inside [first_seq, last_seq] (default: the stable interval
+        # that fired the current capture), else exactly last_seq. Frames after the interval are never
+        # used, so motion that resumed while the capture was being handled cannot leak in. Scores are
+        # taken at motion_width, so frames analysed at different scheduler widths compare fairly.
+        # Returns (frame_copy, focus, seq); (None, None, -1) if none of those frames is still retained.
+        if first_seq is None: first_seq, last_seq = self._capture_window
+        with self._candidates_lock:
+            pool = [c for c in self._candidates if first_seq <= c[0] <= last_seq]
+            for seq, focus in sorted(pool, key=lambda c: c[1], reverse=True):
+                frame = self.frame_ring.borrow(seq)
+                if frame is None: continue
+                try: return frame.copy(), focus, seq
+                finally: self.frame_ring.release(seq)
+        frame = self.frame_ring.borrow(last_seq)
+        if frame is None: return None, None, -1
+        try: return frame.copy(), None, last_seq
+        finally: self.frame_ring.release(last_seq)
+
+    def _add_candidate(self, seq, focus):
+        with self._candidates_lock:
+            self._candidates.append((seq, focus))
+            while len(self._candidates) > self.best_frame_window:
+                self.frame_ring.release(self._candidates.popleft()[0])
 
     def _motion_worker(self):
-        MAX_CORNERS, MIN_CORNERS = 100, 40
-        prev_gray, prev_pts = None, None
+        # Generator driven by _pool_step(); yields after each frame, True if a newer one is already waiting
+        estimator = MOTION_BACKENDS[self.MOTION_BACKEND]()
+        scheduler = self.scheduler
+        preprocessor = self.preprocessor
+        last_seq, ref_seq, ref_width = -1, -1, None
+        ref_ts = 0.0
         mu_smooth, sigma_smooth = None, None
         last_mu_raw, last_sigma_raw = 0, 0
-        iteration = 0
-        sp_state = HysteresisState(15.0, 12.0)
-        sb_state = HysteresisState(10.0, 8.0)
+        sp_state = HysteresisState(self.SPEED_WARN_ENTER, self.SPEED_WARN_CLEAR, self.WARN_CONFIRM)
+        sb_state = HysteresisState(self.STAB_WARN_ENTER, self.STAB_WARN_CLEAR, self.WARN_CONFIRM)
+        # Quality warnings only advance on analysed frames; exposure is the distance outside the band and
+        # blur is fed negated, so both fit the "raise at >= enter" form
+        meter = QualityMeter()
+        brightness, glare, focus = 0.0, 0.0, 0.0
+        ex_state = HysteresisState(0.0, -self.EXPOSURE_MARGIN, self.WARN_CONFIRM)
+        gl_state = HysteresisState(self.GLARE_WARN_ENTER, self.GLARE_WARN_CLEAR, self.WARN_CONFIRM)
+        bl_state = HysteresisState(-self.FOCUS_WARN_ENTER, -self.FOCUS_WARN_CLEAR, self.WARN_CONFIRM)
+
+        while True:
+            if self.frame_ring.latest_seq <= last_seq:
+                yield False
+                continue
+            t_start = time.perf_counter()
 
-        while not self._stop_event.is_set():
-            self._new_frame_event.wait()
-            self._new_frame_event.clear()
-            if self._stop_event.is_set(): break
-            
-            with self._frame_lock:
-                if self._latest_frame is None: continue
-                frame = self._latest_frame.copy()
-
-            # ROI & Resize
-            h, w = frame.shape[:2]
-            crop = frame[int(h*0.2):int(h*0.8), int(w*0.15):int(w*0.85)]
-            scale = self.MOTION_TARGET_WIDTH / crop.shape[1]
-            ds = cv2.resize(crop, (self.MOTION_TARGET_WIDTH, int(crop.shape[0]*scale)), interpolation=cv2.INTER_NEAREST)
-            gray = cv2.cvtColor(ds, cv2.COLOR_BGR2GRAY)
-
-            # Optical Flow Logic
-            mu_raw, sigma_raw = 0, 0
-            if prev_gray is None or prev_pts is None or len(prev_pts) < MIN_CORNERS:
-                prev_pts = cv2.goodFeaturesToTrack(gray, MAX_CORNERS, 0.01, 8, blockSize=3)
+            odx, ody = 0.0, 0.0
+            if not scheduler.should_analyse():
+                # Skipped frame: no pixels touched, the last per-frame rate still holds
+                last_seq = self.frame_ring.latest_seq
+                mu_raw, sigma_raw = last_mu_raw, last_sigma_raw
             else:
-                if iteration % self.LK_EVERY_N == 0:
-                    next_pts, status, _ = cv2.calcOpticalFlowPyrLK(prev_gray, gray, prev_pts, None, winSize=(15,15), maxLevel=2)
-                    if next_pts is not None:
-                        good_new = next_pts[status == 1]
-                        good_old = prev_pts[status == 1]
-                        if len(good_new) >= MIN_CORNERS:
-                            dists = np.sqrt(np.sum((good_new - good_old)**2, axis=1))
-                            mu_raw = np.mean(dists)
-                            sigma_raw = np.std(dists) if len(dists) > 1 else 0
-                            prev_pts = good_new.reshape(-1, 1, 2)
-                        else:
-                            prev_pts = None # Reset
-                else:
-                    mu_raw, sigma_raw = last_mu_raw, last_sigma_raw
-
-            prev_gray = gray
+                seq, frame = self.frame_ring.borrow_latest(last_seq)
+                if frame is None:
+                    yield False
+                    continue
+                last_seq = seq
+                frame_ts = self.frame_ring.stamp(seq)
+                width = scheduler.width
+
+                # ROI -> small gray, read from the borrowed slot in place into reused buffers
+                try: gray = preprocessor.process(frame, width)
+                except Exception:
+                    self.frame_ring.release(seq)
+                    raise
+
+                # Image quality from the same gray. Focus is always taken at motion_width: the Laplacian
+                # variance of one scene changes ~8x across the scheduler's widths
+                brightness, glare = meter.measure(gray)
+                focus_gray = gray if width == self.motion_width else preprocessor.process(frame, self.motion_width)
+                focus = focus_score(focus_gray, preprocessor.lap)
+
+                ex_state.set_thresholds(0.0, -self.EXPOSURE_MARGIN, self.WARN_CONFIRM)
+                gl_state.set_thresholds(self.GLARE_WARN_ENTER, self.GLARE_WARN_CLEAR, self.WARN_CONFIRM)
+                bl_state.set_thresholds(-self.FOCUS_WARN_ENTER, -self.FOCUS_WARN_CLEAR, self.WARN_CONFIRM)
+                ex_state.update(max(self.EXPOSURE_MIN - brightness, brightness - self.EXPOSURE_MAX))
+                gl_state.update(glare)
+                bl_state.update(-focus)
+
+                # The slot stays pinned as a capture candidate, ranked on that width-independent score
+                self._add_candidate(seq, focus)
+
+                # Motion Estimation against the last analysed frame (backend/width may have changed)
+                if estimator.name != self.MOTION_BACKEND:
+                    estimator = MOTION_BACKENDS[self.MOTION_BACKEND]()
+                elif width != ref_width:
+                    estimator.reset()
+                mu_raw, sigma_raw = 0, 0
+                measured = estimator.estimate(gray)
+                if measured is not None:
+                    # Per camera frame, in motion_width pixels, whatever the real gap and width were
+                    to_ref = self.motion_width / width
+                    norm = to_ref / max(1, seq - ref_seq)
+                    mu_raw, sigma_raw = measured[0] * norm, measured[1] * norm
+                    # Odometry integrates the whole shift since the last analysed frame (no per-frame split)
+                    if self._is_processing_active:
+                        odx, ody = measured[2] * to_ref, measured[3] * to_ref
+                        self.odometry.update(odx, ody)
+                ref_seq, ref_width, ref_ts = seq, width, frame_ts
+
             last_mu_raw, last_sigma_raw = mu_raw, sigma_raw
+            quality_ok = not (ex_state.is_warning or gl_state.is_warning or bl_state.is_warning)
+            if self.trace_recorder is not None:
+                self.trace_recorder.record(self.clock.now(), last_seq, mu_raw, sigma_raw, odx, ody, self._is_processing_active, quality_ok)
 
             # Smoothing
             if mu_smooth is None: mu_smooth, sigma_smooth = mu_raw, sigma_raw
             else:
-                mu_smooth = 0.8 * mu_smooth + 0.2 * mu_raw
-                sigma_smooth = 0.8 * sigma_smooth + 0.2 * sigma_raw
+                a = self.SMOOTH_ALPHA
+                mu_smooth = a * mu_smooth + (1 - a) * mu_raw
+                sigma_smooth = a * sigma_smooth + (1 - a) * sigma_raw
 
+            # Thresholds are re-read every step, so the parameters can be tuned while running
+            sp_state.set_thresholds(self.SPEED_WARN_ENTER, self.SPEED_WARN_CLEAR, self.WARN_CONFIRM)
+            sb_state.set_thresholds(self.STAB_WARN_ENTER, self.STAB_WARN_CLEAR, self.WARN_CONFIRM)
             sp_state.update(mu_smooth)
             sb_state.update(sigma_smooth)
             
-            with self._motion_state_lock:
-                self._motion_state = MotionState(mu_smooth, sigma_smooth, sp_state.is_warning, sb_state.is_warning)
-            self._motion_updated_event.set()
-            iteration += 1
+            ms = MotionState(mu_smooth, sigma_smooth, sp_state.is_warning, sb_state.is_warning, ref_ts, ref_seq, self.odometry.travel(),
+                             brightness, glare, focus, ex_state.is_warning, gl_state.is_warning, bl_state.is_warning)
+            with self._motion_state_lock: self._motion_state = ms
+            cost = time.perf_counter() - t_start
+            scheduler.BUDGET_MS = self.MOTION_BUDGET_MS
+            if ref_seq == last_seq and scheduler.record(cost, mu_smooth):
+                print(f"[GUIDANCE] Motion schedule: every {scheduler.every_n} frame(s) at {scheduler.width}px ({scheduler.cost_ms:.1f} ms)")
+            self._state_task.send(ms)
+            # Reported after the state step, so a "motion" timing means this frame is fully handled
+            self._record("motion", cost, last_seq)
+            yield self.frame_ring.latest_seq > last_seq
 
     def _state_worker(self):
+        # Generator fed each new MotionState by the motion step (same pool quantum)
         c_green = (60, 200, 60)
         c_amber = (0, 180, 255)
         c_red = (60, 60, 255)
         c_cyan = (255, 200, 80)
-        stable_since = None
-        last_capture_time = 0
-
-        while not self._stop_event.is_set():
-            self._motion_updated_event.wait()
-            self._motion_updated_event.clear()
-            if self._stop_event.is_set(): break
+        stable_since, stable_since_seq = None, -1
+        last_capture_time = float("-inf")
 
-            with self._motion_state_lock: ms = self._motion_state
+        while True:
+            ms = yield
+            t_start = time.perf_counter()
 
             if not self._is_processing_active:
                 if self.on_guidance_updated:
@@ -234,14 +1516,23 @@ class GuidanceSystem:
 
             # Capture Logic
             is_stable = (ms.mu < self.CAPTURE_SPEED_THRESH) and (ms.sigma < self.CAPTURE_STAB_THRESH)
+            gated = self.QUALITY_GATING and not ms.quality_ok
             is_arming = False
-            now = time.time()
+            now = self.clock.now()
+
+            if self.CAPTURE_MODE == "distance":
+                settle, cooldown, far_enough = self.CAPTURE_SETTLE_S, 0.0, ms.travel >= self.capture_spacing()
+            else:
+                settle, cooldown, far_enough = self.CAPTURE_DELAY_S, self.CAPTURE_COOLDOWN_S, True
 
-            if is_stable:
-                if stable_since is None: stable_since = now
-                if (now - stable_since) >= self.CAPTURE_DELAY_S:
+            if is_stable and not gated:
+                if stable_since is None: stable_since, stable_since_seq = now, ms.frame_seq
+                if far_enough and (now - stable_since) >= settle:
                     is_arming = True
-                    if (now - last_capture_time) >= self.CAPTURE_COOLDOWN_S:
+                    if (now - last_capture_time) >= cooldown:
+                        # Bind the capture to the frames that were actually measured as stable
+                        self._capture_window = (stable_since_seq, ms.frame_seq)
+                        self.odometry.mark_capture()
                         if self.on_capture_triggered: self.on_capture_triggered()
                         last_capture_time = now
                         stable_since = None
@@ -253,183 +1544,1096 @@ class GuidanceSystem:
             if ms.speed_warning and ms.stability_warning: prompt, color = "Slow down & keep steady", c_red
             elif ms.speed_warning: prompt, color = "Slow down", c_amber
             elif ms.stability_warning: prompt, color = "Keep steady", c_amber
+            elif gated and ms.exposure_warning:
+                dark = ms.brightness < (self.EXPOSURE_MIN + self.EXPOSURE_MAX) / 2
+                prompt, color = ("Too dark: move closer" if dark else "Too bright: move back"), c_amber
+            elif gated and ms.glare_warning: prompt, color = "Glare: tilt the scope", c_amber
+            elif gated: prompt, color = "Out of focus", c_amber
             elif is_arming: prompt, color = "Hold steady to capture...", c_cyan
+            elif is_stable and not far_enough: prompt, color = "Keep moving", c_green
             else: prompt, color = "Ready to capture", c_green
 
             if self.on_guidance_updated:
-                self.on_guidance_updated(GuidanceResult(prompt, color, ms))
+                self.on_guidance_updated(GuidanceResult(prompt, color, ms, ms.frame_seq))
+            self._record("state", time.perf_counter() - t_start)
+            # Frame arrival -> matching GuidanceResult delivered
+            if ms.frame_ts: self._record("e2e", time.monotonic() - ms.frame_ts)
 
 # ==========================================
-# 4. UI Drawing
+# 7. UI Drawing
 # ==========================================
 
+class OverlayLayer:
+    # Pre-rendered RGBA patch stored premultiplied: out = frame * inv_alpha / 255 + premult
+    def __init__(self, x, y, color, alpha):
+        self.x, self.y = x, y
+        self.premult = np.clip(color + 0.5, 0, 255).astype(np.uint8)
+        self.inv_alpha = cv2.merge([np.clip((1.0 - alpha) * 255.0 + 0.5, 0, 255).astype(np.uint8)] * 3)
+
+    def blend(self, frame, x=None, y=None):
+        # Only the layer's own rectangle (clipped to the frame) is touched
+        x = self.x if x is None else x
+        y = self.y if y is None else y
+        h_fg, w_fg = self.premult.shape[:2]
+        h_bg, w_bg = frame.shape[:2]
+        x0, y0 = max(0, x), max(0, y)
+        x1, y1 = min(w_bg, x + w_fg), min(h_bg, y + h_fg)
+        if x1 <= x0 or y1 <= y0: return
+        fx, fy = x0 - x, y0 - y
+        roi = frame[y0:y1, x0:x1]
+        inv = self.inv_alpha[fy:fy + (y1 - y0), fx:fx + (x1 - x0)]
+        pm = self.premult[fy:fy + (y1 - y0), fx:fx + (x1 - x0)]
+        roi[...] = cv2.add(cv2.multiply(roi, inv, scale=1.0 / 255.0), pm)
+
+def fit_display(frame_w, frame_h, window=None):
+    # Largest size with the frame's aspect ratio that fits the window's image area, never above capture
+    # resolution -> ((w, h), scale). window None (size unknown) renders at capture resolution.
+    if window is None: return (frame_w, frame_h), 1.0
+    scale = min(1.0, window[0] / frame_w, window[1] / frame_h)
+    if scale >= 1.0: return (frame_w, frame_h), 1.0
+    return (max(1, int(round(frame_w * scale))), max(1, int(round(frame_h * scale)))), scale
+
+class DisplayScaler:
+    # Private display canvas for the overlay, in reused buffers: drawing, blending and imshow then all work on
+    # display pixels. INTER_AREA is only fast for an exact 2x (9-18 ms at other 1080p ratios), so the frame is
+    # area-halved while it stays at least twice the target, and the last (<2x) step is bilinear.
+    def __init__(self):
+        self.frame = None # last rendered canvas
+        self.scale = 1.0  # display pixels per capture pixel
+        self._halves = {} # (h, w) -> scratch for one halving step
+
+    def _buffer(self, h, w):
+        buf = self._halves.get((h, w))
+        if buf is None: buf = self._halves[(h, w)] = np.empty((h, w, 3), np.uint8)
+        return buf
+
+    def render(self, frame, window=None):
+        (w, h), self.scale = fit_display(frame.shape[1], frame.shape[0], window)
+        if self.frame is None or self.frame.shape[:2] != (h, w): self.frame = np.empty((h, w, 3), np.uint8)
+        if self.scale == 1.0:
+            np.copyto(self.frame, frame)
+            return self.frame
+        src = frame
+        while src.shape[0] >= 2 * h and src.shape[1] >= 2 * w:
+            hh, hw = src.shape[0] // 2, src.shape[1] // 2
+            dst = self.frame if (hh, hw) == (h, w) else self._buffer(hh, hw)
+            src = cv2.resize(src[:2 * hh, :2 * hw], (hw, hh), dst=dst, interpolation=cv2.INTER_AREA)
+        if src is not self.frame: cv2.resize(src, (w, h), dst=self.frame, interpolation=cv2.INTER_LINEAR)
+        return self.frame
+
 class OverlayDrawer:
+    # Layout constants are in capture-resolution pixels (1080p); set_scale() draws them on a display-sized frame
+    PANEL_W, PANEL_H = 300, 260
+    PANEL_PAD_X, PANEL_PAD_Y = 50, 80
+    FLASH_RADIUS = 150
+    ICON_H = 100
+    MAX_CACHED_LAYERS = 32
+    STRIP_MARGIN, STRIP_BOTTOM = 40, 70 # gallery strip: gap right of the panel / to the window edge, above the bottom
+    STRIP_GAP, STRIP_PAD, STRIP_LABEL_H, STRIP_ARROW_W = 8, 8, 24, 24
+
     def __init__(self, asset_manager):
         self.assets = asset_manager
-        self.btn_main_rect = None
+        self.scale = 1.0
+        self.btn_main_rect = None # in the coordinates of the frame last drawn on
         self.btn_recapture_rect = None
         self.flash_frames = 0
+        self._layer_cache = {} # (state, btn_text, progress_text, frame size) -> (OverlayLayer, main rect, recapture rect)
+        self._flash_layer = None
+        self._preview_src, self._preview_scaled = None, None
+        self.gallery_rect = self.gallery_prev_rect = self.gallery_next_rect = None
+        self._gallery_label, self._gallery_first, self._gallery_follow = None, 0, True
+        self._gallery_scroll, self._gallery_visible = 0, 1
+        self._strip_key, self._strip = None, None
+
+    def set_scale(self, scale):
+        # Display pixels per capture pixel; cached layers are rebuilt at the new size
+        if scale == self.scale: return
+        self.scale = scale
+        self._layer_cache.clear()
+        self._flash_layer = None
+        self._preview_src, self._preview_scaled = None, None
+
+    def _px(self, v):
+        return int(round(v * self.scale))
+
+    def _th(self, thickness):
+        return max(1, int(round(thickness * self.scale)))
+
+    def prewarm(self):
+        # The first draw in a process pays OpenCV's lazy drawing/font setup (~30 ms); do it off the first frame
+        canvas = np.zeros((self.PANEL_H + 2 * self.PANEL_PAD_Y, self.PANEL_W + 2 * self.PANEL_PAD_X, 3), np.uint8)
+        self.draw_ui(canvas, ScanningState.READY_TO_SCAN_LOWER, None, "", "START", "")
+        self._layer_cache.clear()
 
     def trigger_flash(self):
         self.flash_frames = 8 
 
-    def draw_ui(self, frame, session_state, guidance_result, ui_text_main, ui_btn_text, progress_text):
+    def scroll_gallery(self, steps, page=False):
+        # Positive: towards newer captures, by thumbnails or by pages of what fits; applied at the next draw
+        self._gallery_scroll += steps * (self._gallery_visible if page else 1)
+
+    def draw_ui(self, frame, session_state, guidance_result, ui_text_main, ui_btn_text, progress_text, mosaic_preview=None,
+                gallery=None):
         h, w = frame.shape[:2]
+        s, px, th = self.scale, self._px, self._th
 
         # 1. Status Bar (Only if ACTIVE scanning)
         if guidance_result is not None:
-            bar_h = 50
+            bar_h = px(50)
             bar_color = guidance_result.color
             cv2.rectangle(frame, (0, h - bar_h), (w, h), bar_color, -1)
             status_text = guidance_result.prompt
-            cv2.putText(frame, status_text, (30, h - 15), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255, 255, 255), 2)
+            cv2.putText(frame, status_text, (px(30), h - px(15)), cv2.FONT_HERSHEY_SIMPLEX, 1.0 * s, (255, 255, 255), th(2))
             
             # Target Box
             cx, cy = w // 2, h // 2
-            box_sz = 300
-            cv2.rectangle(frame, (cx-box_sz//2, cy-box_sz//2), (cx+box_sz//2, cy+box_sz//2), (255, 255, 100), 2)
+            half = px(150)
+            cv2.rectangle(frame, (cx-half, cy-half), (cx+half, cy+half), (255, 255, 100), th(2))
 
         # 2. Top Instruction
-        cv2.putText(frame, ui_text_main, (60, 80), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0,0,0), 4)
-        cv2.putText(frame, ui_text_main, (60, 80), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255,255,255), 2)
+        cv2.putText(frame, ui_text_main, (px(60), px(80)), cv2.FONT_HERSHEY_SIMPLEX, 1.0 * s, (0,0,0), th(4))
+        cv2.putText(frame, ui_text_main, (px(60), px(80)), cv2.FONT_HERSHEY_SIMPLEX, 1.0 * s, (255,255,255), th(2))
+
+        # 3. Control Panel (Bottom Left), rendered once per state/text/size and blended in its own ROI
+        key = (session_state, ui_btn_text, progress_text, w, h)
+        cached = self._layer_cache.get(key)
+        if cached is None:
+            if len(self._layer_cache) >= self.MAX_CACHED_LAYERS: self._layer_cache.clear()
+            cached = self._layer_cache[key] = self._render_panel(session_state, ui_btn_text, progress_text, h)
+        layer, self.btn_main_rect, self.btn_recapture_rect = cached
+        layer.blend(frame)
+
+        # 4. Arch mosaic preview, just above the panel (rescaled once per new preview)
+        if mosaic_preview is not None:
+            if s != 1.0:
+                if mosaic_preview is not self._preview_src:
+                    self._preview_src = mosaic_preview
+                    self._preview_scaled = cv2.resize(mosaic_preview, None, fx=s, fy=s, interpolation=cv2.INTER_AREA)
+                mosaic_preview = self._preview_scaled
+            ph, pw = mosaic_preview.shape[:2]
+            x, y = px(self.PANEL_PAD_X), h - px(self.PANEL_H) - px(self.PANEL_PAD_Y) - ph - px(10)
+            if y >= 0 and x + pw <= w:
+                frame[y:y + ph, x:x + pw] = mosaic_preview
+                cv2.rectangle(frame, (x - 1, y - 1), (x + pw, y + ph), (255, 255, 255), 1)
+
+        # 5. Capture gallery strip (bottom right)
+        self.gallery_rect = self.gallery_prev_rect = self.gallery_next_rect = None
+        if gallery is not None: self._draw_gallery(frame, *gallery)
+
+        # 6. Handle Capture Flash
+        if self.flash_frames > 0:
+            self._draw_corner_flash(frame)
+            self.flash_frames -= 1
+
+    def _draw_gallery(self, frame, label, paths, thumbs):
+        # Scrollable row of ThumbnailCache entries; follows the newest capture until scrolled back. The strip is
+        # composed once per change of what it shows and copied in opaque, so a steady frame costs one ROI copy.
+        if label != self._gallery_label:
+            self._gallery_label, self._gallery_follow, self._gallery_scroll = label, True, 0
+        n = len(paths)
+        if n == 0: return
+        h, w = frame.shape[:2]
+        px = self._px
+        slot_w, slot_h, gap = px(ThumbnailCache.THUMB_W), px(ThumbnailCache.THUMB_H), px(self.STRIP_GAP)
+        pad, label_h, arrow_w = px(self.STRIP_PAD), px(self.STRIP_LABEL_H), px(self.STRIP_ARROW_W)
+        x0, x1 = px(self.PANEL_PAD_X + self.PANEL_W + self.STRIP_MARGIN), w - px(self.STRIP_MARGIN)
+        fit = (x1 - x0 - 2 * (pad + arrow_w) + gap) // (slot_w + gap)
+        if fit < 1: return
+
+        # Scroll position, clamped to what exists now
+        self._gallery_visible = fit
+        last_first = max(0, n - fit)
+        if self._gallery_scroll:
+            first = (last_first if self._gallery_follow else self._gallery_first) + self._gallery_scroll
+            self._gallery_scroll = 0
+            self._gallery_first = min(max(0, first), last_first)
+            self._gallery_follow = self._gallery_first == last_first
+        if self._gallery_follow: self._gallery_first = last_first
+        first = self._gallery_first = min(self._gallery_first, last_first)
+        tiles = [thumbs.get(p) for p in paths[first:first + fit]]
+
+        strip_w = 2 * (pad + arrow_w) + len(tiles) * (slot_w + gap) - gap
+        strip_h = label_h + slot_h + 2 * pad
+        y1 = h - px(self.STRIP_BOTTOM)
+        y0 = y1 - strip_h
+        if y0 < 0: return
+        more_before, more_after = first > 0, first + len(tiles) < n
+        key = (label, first, n, tuple(0 if t is None else id(t) for t in tiles), strip_w, strip_h)
+        if key != self._strip_key:
+            s, th = self.scale, self._th
+            strip = np.full((strip_h, strip_w, 3), (35, 30, 30), np.uint8)
+            cv2.putText(strip, f"{label}  {first + 1}-{first + len(tiles)} of {n}", (pad + arrow_w, pad + label_h - px(8)),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.55 * s, (220, 220, 220), th(1))
+            ty = pad + label_h
+            for i, tile in enumerate(tiles):
+                tx = pad + arrow_w + i * (slot_w + gap)
+                if tile is None: # not decoded yet
+                    cv2.rectangle(strip, (tx, ty), (tx + slot_w - 1, ty + slot_h - 1), (90, 90, 90), 1)
+                    continue
+                if tile.shape[:2] != (slot_h, slot_w): tile = cv2.resize(tile, (slot_w, slot_h), interpolation=cv2.INTER_AREA)
+                strip[ty:ty + slot_h, tx:tx + slot_w] = tile
+            cy = ty + slot_h // 2
+            for show, ax, d in ((more_before, pad + arrow_w // 2, -1), (more_after, strip_w - pad - arrow_w // 2, 1)):
+                if not show: continue
+                pts = np.array([(ax + d * px(7), cy), (ax - d * px(7), cy - px(12)), (ax - d * px(7), cy + px(12))], np.int32)
+                cv2.fillConvexPoly(strip, pts, (220, 220, 220), cv2.LINE_AA)
+            self._strip_key, self._strip = key, strip
+        frame[y0:y1, x0:x0 + strip_w] = self._strip
+        self.gallery_rect = (x0, y0, x0 + strip_w, y1)
+        if more_before: self.gallery_prev_rect = (x0, y0, x0 + pad + arrow_w, y1)
+        if more_after: self.gallery_next_rect = (x0 + strip_w - pad - arrow_w, y0, x0 + strip_w, y1)
+
+    def draw_hud(self, frame, lines):
+        # Latency overlay (top right); darkens only its own ROI
+        if not lines: return
+        px = self._px
+        line_h, pad = px(22), px(10)
+        box_w, box_h = px(330), line_h * len(lines) + 2 * pad
+        x0, y0 = max(0, frame.shape[1] - box_w - px(20)), px(20)
+        roi = frame[y0:y0 + box_h, x0:x0 + box_w]
+        np.right_shift(roi, 1, out=roi)
+        for i, line in enumerate(lines):
+            cv2.putText(frame, line, (x0 + pad, y0 + pad + px(15) + i * line_h), cv2.FONT_HERSHEY_PLAIN, 1.2 * self.scale, (200, 255, 200), 1)
+
+    def _render_panel(self, session_state, ui_btn_text, progress_text, h):
+        s, px, th = self.scale, self._px, self._th
+        panel_w, panel_h = px(self.PANEL_W), px(self.PANEL_H)
+        panel_x, panel_y = px(self.PANEL_PAD_X), h - panel_h - px(self.PANEL_PAD_Y)
+
+        # Layout (panel-relative)
+        btn_h = px(50)
+        btn_y = px(180)
+        btn_x = px(20)
+        btn_w = panel_w - px(40)
+        r_btn_h = px(40)
+        r_btn_y = btn_y + btn_h + px(15)
+        show_recapture = session_state in [ScanningState.READY_TO_SCAN_UPPER, ScanningState.COMPLETE]
+        # cv2.rectangle corners are inclusive, hence the +1s
+        layer_w = panel_w + 1
+        layer_h = max(panel_h, r_btn_y + r_btn_h) + 1 if show_recapture else panel_h + 1
+
+        # Premultiplied colour + coverage, composited back to front
+        color = np.zeros((layer_h, layer_w, 3), np.float32)
+        alpha = np.zeros((layer_h, layer_w), np.float32)
 
-        # 3. Control Panel (Bottom Left)
-        panel_w, panel_h = 300, 260
-        pad_x, pad_y = 50, 80 
-        panel_x, panel_y = pad_x, h - panel_h - pad_y
-        
         # Dark Card Background
-        overlay = frame.copy()
-        cv2.rectangle(overlay, (panel_x, panel_y), (panel_x + panel_w, panel_y + panel_h), (30, 30, 35), -1)
-        cv2.addWeighted(overlay, 0.9, frame, 0.1, 0, frame)
+        color[:panel_h + 1] = (30 * 0.9, 30 * 0.9, 35 * 0.9)
+        alpha[:panel_h + 1] = 0.9
 
-        # Arch Icon Logic (Updated)
+        # Arch Icon
         icon = None
         if "LOWER" in session_state.name: 
             icon = self.assets.icon_lower
         elif "UPPER" in session_state.name: 
             icon = self.assets.icon_upper
-        
         if icon is not None:
-            icon_sz = 100
-            ix = panel_x + (panel_w - icon_sz) // 2
-            iy = panel_y + 30
-            # Resize
             try:
-                # Maintain aspect ratio
-                ratio = icon.shape[1] / icon.shape[0]
-                new_w = int(icon_sz * ratio)
-                icon_resized = cv2.resize(icon, (new_w, icon_sz))
-                
-                # Re-calculate center with new width
-                ix = panel_x + (panel_w - new_w) // 2
-                
-                # Draw
-                self._overlay_image(frame, icon_resized, ix, iy)
+                icon_color, icon_alpha = self.assets.premultiplied_icon(icon, px(self.ICON_H))
+                ih, iw = icon_alpha.shape
+                ix = max(0, (panel_w - iw) // 2)
+                iy = px(30)
+                iw, ih = min(iw, layer_w - ix), min(ih, layer_h - iy)
+                a = icon_alpha[:ih, :iw, None]
+                color[iy:iy+ih, ix:ix+iw] = icon_color[:ih, :iw] + (1.0 - a) * color[iy:iy+ih, ix:ix+iw]
+                alpha[iy:iy+ih, ix:ix+iw] = icon_alpha[:ih, :iw] + (1.0 - a[..., 0]) * alpha[iy:iy+ih, ix:ix+iw]
             except Exception as e:
                 print(f"[DRAW ERR] Icon draw failed: {e}")
 
+        # Opaque text and buttons go into an 8-bit ink layer plus a coverage mask
+        ink = np.zeros((layer_h, layer_w, 3), np.uint8)
+        ink_mask = np.zeros((layer_h, layer_w), np.uint8)
+        def opaque(draw, col):
+            draw(ink, col)
+            draw(ink_mask, 255)
+
         # "1/2" Text
-        text_sz = cv2.getTextSize(progress_text, cv2.FONT_HERSHEY_SIMPLEX, 1.0, 2)[0]
-        tx = panel_x + (panel_w - text_sz[0]) // 2
-        ty = panel_y + 160
-        cv2.putText(frame, progress_text, (tx, ty), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255, 255, 255), 2)
+        text_sz = cv2.getTextSize(progress_text, cv2.FONT_HERSHEY_SIMPLEX, 1.0 * s, th(2))[0]
+        tx = (panel_w - text_sz[0]) // 2
+        opaque(lambda img, c: cv2.putText(img, progress_text, (tx, px(160)), cv2.FONT_HERSHEY_SIMPLEX, 1.0 * s, c, th(2)), (255, 255, 255))
 
         # MAIN ACTION BUTTON
-        btn_h = 50
-        btn_y = panel_y + 180
-        btn_x = panel_x + 20
-        btn_w = panel_w - 40
-        
         btn_color = (230, 80, 80)
-        cv2.rectangle(frame, (btn_x, btn_y), (btn_x + btn_w, btn_y + btn_h), btn_color, -1)
-        
-        b_sz = cv2.getTextSize(ui_btn_text, cv2.FONT_HERSHEY_SIMPLEX, 0.7, 2)[0]
+        opaque(lambda img, c: cv2.rectangle(img, (btn_x, btn_y), (btn_x + btn_w, btn_y + btn_h), c, -1), btn_color)
+        b_sz = cv2.getTextSize(ui_btn_text, cv2.FONT_HERSHEY_SIMPLEX, 0.7 * s, th(2))[0]
         bx = btn_x + (btn_w - b_sz[0]) // 2
         by = btn_y + (btn_h + b_sz[1]) // 2
-        cv2.putText(frame, ui_btn_text, (bx, by), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-        
-        self.btn_main_rect = (btn_x, btn_y, btn_x + btn_w, btn_y + btn_h)
+        opaque(lambda img, c: cv2.putText(img, ui_btn_text, (bx, by), cv2.FONT_HERSHEY_SIMPLEX, 0.7 * s, c, th(2)), (255, 255, 255))
+        main_rect = (panel_x + btn_x, panel_y + btn_y, panel_x + btn_x + btn_w, panel_y + btn_y + btn_h)
 
         # RECAPTURE BUTTON
-        self.btn_recapture_rect = None 
-        show_recapture = session_state in [ScanningState.READY_TO_SCAN_UPPER, ScanningState.COMPLETE]
-        
+        recapture_rect = None
         if show_recapture:
-            r_btn_h = 40
-            r_btn_y = btn_y + btn_h + 15
-            
-            # Draw Outline
-            cv2.rectangle(frame, (btn_x, r_btn_y), (btn_x + btn_w, r_btn_y + r_btn_h), (50,50,50), -1)
-            cv2.rectangle(frame, (btn_x, r_btn_y), (btn_x + btn_w, r_btn_y + r_btn_h), (150,150,150), 1)
-            
+            r_box = ((btn_x, r_btn_y), (btn_x + btn_w, r_btn_y + r_btn_h))
+            opaque(lambda img, c: cv2.rectangle(img, r_box[0], r_box[1], c, -1), (50, 50, 50))
+            opaque(lambda img, c: cv2.rectangle(img, r_box[0], r_box[1], c, 1), (150, 150, 150))
             r_text = "Recapture"
-            r_sz = cv2.getTextSize(r_text, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 1)[0]
+            r_sz = cv2.getTextSize(r_text, cv2.FONT_HERSHEY_SIMPLEX, 0.6 * s, 1)[0]
             rx = btn_x + (btn_w - r_sz[0]) // 2
             ry = r_btn_y + (r_btn_h + r_sz[1]) // 2
-            cv2.putText(frame, r_text, (rx, ry), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (200, 200, 200), 1)
-            
-            self.btn_recapture_rect = (btn_x, r_btn_y, btn_x + btn_w, r_btn_y + r_btn_h)
+            opaque(lambda img, c: cv2.putText(img, r_text, (rx, ry), cv2.FONT_HERSHEY_SIMPLEX, 0.6 * s, c, 1), (200, 200, 200))
+            recapture_rect = (panel_x + btn_x, panel_y + r_btn_y, panel_x + btn_x + btn_w, panel_y + r_btn_y + r_btn_h)
 
-        # 4. Handle Capture Flash
-        if self.flash_frames > 0:
-            self._draw_corner_flash(frame)
-            self.flash_frames -= 1
+        # The ink was drawn over black, so it is already premultiplied by its (possibly anti-aliased) coverage
+        m = ink_mask.astype(np.float32) / 255.0
+        color = ink.astype(np.float32) + (1.0 - m[..., None]) * color
+        alpha = m + (1.0 - m) * alpha
+        return OverlayLayer(panel_x, panel_y, color, alpha), main_rect, recapture_rect
 
     def _draw_corner_flash(self, frame):
         h, w = frame.shape[:2]
-        overlay = frame.copy()
-        r = 150 
-        cv2.circle(overlay, (0, 0), r, (255, 255, 255), -1)
-        cv2.circle(overlay, (w, 0), r, (255, 255, 255), -1)
-        cv2.circle(overlay, (0, h), r, (255, 255, 255), -1)
-        cv2.circle(overlay, (w, h), r, (255, 255, 255), -1)
-        cv2.addWeighted(overlay, 0.4, frame, 0.6, 0, frame)
-
-    def _overlay_image(self, bg, fg, x, y):
-        # FIX: Clipping logic added to ensure icons render even if slightly off-screen
-        h_fg, w_fg = fg.shape[:2]
-        h_bg, w_bg = bg.shape[:2]
-
-        if x >= w_bg or y >= h_bg: return # Totally out of bounds
-        
-        # Calculate clipping
-        x_start = max(0, x)
-        y_start = max(0, y)
-        x_end = min(w_bg, x + w_fg)
-        y_end = min(h_bg, y + h_fg)
-        
-        # Calculate overlap in foreground terms
-        fg_x_start = x_start - x
-        fg_y_start = y_start - y
-        fg_x_end = fg_x_start + (x_end - x_start)
-        fg_y_end = fg_y_start + (y_end - y_start)
-
-        if (x_end - x_start) <= 0 or (y_end - y_start) <= 0: return
-
-        # Case 1: 4 Channels (Transparent PNG)
-        if fg.shape[2] == 4:
-            fg_crop = fg[fg_y_start:fg_y_end, fg_x_start:fg_x_end]
-            bg_crop = bg[y_start:y_end, x_start:x_end]
-            
-            alpha_fg = fg_crop[:, :, 3] / 255.0
-            alpha_bg = 1.0 - alpha_fg
-            
-            for c in range(3):
-                bg_crop[:, :, c] = (alpha_fg * fg_crop[:,:,c] + alpha_bg * bg_crop[:,:,c])
-                
-            bg[y_start:y_end, x_start:x_end] = bg_crop
+        r = self._px(self.FLASH_RADIUS)
+        if self._flash_layer is None:
+            mask = np.zeros((2 * r + 1, 2 * r + 1), np.float32)
+            cv2.circle(mask, (r, r), r, 1.0, -1)
+            self._flash_layer = OverlayLayer(0, 0, cv2.merge([mask * (0.4 * 255.0)] * 3), mask * 0.4)
+        # Each corner only blends the quarter disc that lands inside the frame
+        for cx, cy in ((0, 0), (w, 0), (0, h), (w, h)):
+            self._flash_layer.blend(frame, cx - r, cy - r)
+
+# ==========================================
+# 8. Capture Persistence
+# ==========================================
+
+class CaptureWriter:
+    # Bounded pool that encodes and writes captures off the guidance thread.
+    # submit() blocks for at most SUBMIT_TIMEOUT_S when the queue is full (backpressure), then rejects.
+    # Files are written to <path>.tmp, synced and renamed, so a crash never leaves a truncated capture.
+    ENCODE_PARAMS = {
+        "jpg": lambda q: [cv2.IMWRITE_JPEG_QUALITY, int(q)],
+        "png": lambda q: [cv2.IMWRITE_PNG_COMPRESSION, 3],
+        "webp": lambda q: [cv2.IMWRITE_WEBP_QUALITY, int(q)],
+    }
+
+    def __init__(self, workers=2, max_queue=8, fmt="jpg", quality=95):
+        # --- Parameters ---
+        self.FORMAT = fmt
+        self.QUALITY = quality
+        self.SUBMIT_TIMEOUT_S = 0.5
+        if fmt not in self.ENCODE_PARAMS: raise ValueError(f"Unsupported capture format: {fmt}")
+
+        # --- State ---
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._workers = workers
+        self._threads = []
+        self._stats_lock = threading.Lock()
+        self._pending = set()   # paths queued or being encoded
+        self._cancelled = set() # pending paths discarded before they reached disk
+        self._encode_ms = deque(maxlen=256)
+        self._write_ms = deque(maxlen=256)
+        self.written = 0
+        self.failed = 0
+        self.rejected = 0
+        self.max_depth = 0
+
+        self.on_written = None      # (path), called from a writer thread once the file is in place
+        self.on_write_failed = None # (path), called from a writer thread
+
+    def start(self):
+        if self._threads: return
+        for _ in range(self._workers):
+            t = threading.Thread(target=self._worker, daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def path_for(self, stem):
+        return f"{stem}.{self.FORMAT}"
+
+    def submit(self, frame, path):
+        # The writer takes ownership of `frame`; pass a private copy
+        if not self._threads: self.start()
+        with self._stats_lock: self._pending.add(path)
+        try:
+            self._queue.put((frame, path), timeout=self.SUBMIT_TIMEOUT_S)
+        except queue.Full:
+            with self._stats_lock:
+                self.rejected += 1
+                self._pending.discard(path)
+            print(f"[ERR] Capture queue full, dropped {os.path.basename(path)}")
+            return False
+        with self._stats_lock: self.max_depth = max(self.max_depth, self._queue.qsize())
+        return True
+
+    def owns(self, path):
+        # True while `path` is queued or being encoded/written
+        with self._stats_lock: return path in self._pending
+
+    def discard(self, path):
+        # Cancel a capture still in the writer: skipped if not encoded yet, deleted as soon as its rename lands
+        # otherwise, and reported to neither callback. -> False if the writer no longer has it (it is on disk,
+        # or failed): the caller deletes it then.
+        with self._stats_lock:
+            if path not in self._pending: return False
+            self._cancelled.add(path)
+            return True
+
+    def _remove(self, path):
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+                print(f"[DISK] Deleted {os.path.basename(path)}")
+        except Exception as e:
+            print(f"[ERR] Could not delete {path}: {e}")
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                self._queue.task_done()
+                break
+            frame, path = job
+            with self._stats_lock:
+                if path in self._cancelled:
+                    self._cancelled.discard(path)
+                    self._pending.discard(path)
+                    self._queue.task_done()
+                    continue
+            try:
+                t0 = time.perf_counter()
+                ok, buf = cv2.imencode("." + self.FORMAT, frame, self.ENCODE_PARAMS[self.FORMAT](self.QUALITY))
+                t1 = time.perf_counter()
+                if not ok: raise RuntimeError("encode failed")
+                tmp = path + ".tmp"
+                try:
+                    with open(tmp, "wb") as f:
+                        buf.tofile(f)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(tmp, path)
+                except OSError:
+                    if os.path.exists(tmp): os.remove(tmp)
+                    raise
+                t2 = time.perf_counter()
+                with self._stats_lock:
+                    self.written += 1
+                    self._encode_ms.append((t1 - t0) * 1000.0)
+                    self._write_ms.append((t2 - t1) * 1000.0)
+                ok = True
+            except Exception as e:
+                with self._stats_lock: self.failed += 1
+                print(f"[ERR] Could not write {path}: {e}")
+                ok = False
+            with self._stats_lock:
+                self._pending.discard(path)
+                discarded = path in self._cancelled
+                self._cancelled.discard(path)
+            # Callbacks only after the path has left _pending, so owns() is False by the time they run
+            if discarded: self._remove(path) # discarded while in flight: the late arrival goes straight away
+            elif ok:
+                print(f"[DISK] Saved {os.path.basename(path)}")
+                if self.on_written: self.on_written(path)
+            elif self.on_write_failed: self.on_write_failed(path)
+            self._queue.task_done()
+
+    def flush(self, timeout=None):
+        # Wait until every submitted capture is on disk
+        with self._queue.all_tasks_done:
+            return self._queue.all_tasks_done.wait_for(lambda: self._queue.unfinished_tasks == 0, timeout)
+
+    @property
+    def pending(self):
+        # Captures submitted but not yet written (or failed), queued or in flight
+        with self._queue.mutex: return self._queue.unfinished_tasks
+
+    def close(self, timeout=5.0):
+        if not self._threads: return
+        self.flush(timeout)
+        for _ in self._threads: self._queue.put(None)
+        for t in self._threads: t.join(timeout)
+        self._threads = []
+        m = self.metrics()
+        print(f"[DISK] Writer closed: {m['written']} written, {m['failed']} failed, {m['rejected']} rejected")
+
+    def metrics(self):
+        with self._stats_lock:
+            enc, wr = list(self._encode_ms), list(self._write_ms)
+            return {
+                "queue_depth": self._queue.qsize(), "max_queue_depth": self.max_depth,
+                "written": self.written, "failed": self.failed, "rejected": self.rejected,
+                "encode_ms_mean": float(np.mean(enc)) if enc else 0.0,
+                "encode_ms_max": float(np.max(enc)) if enc else 0.0,
+                "write_ms_mean": float(np.mean(wr)) if wr else 0.0,
+            }
+
+def dhash(frame, hash_size=8):
+    # 64-bit difference hash; two INTER_AREA steps keep the full-res reduction at ~2 ms
+    small = cv2.resize(frame, (64, 36), interpolation=cv2.INTER_AREA)
+    if small.ndim == 3: small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(small, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int(np.packbits(bits).view(">u8")[0])
+
+class PerceptualHashIndex:
+    # In-memory dHash index of one arch's captures, used to suppress near-duplicate views
+    def __init__(self, max_distance=6):
+        self.max_distance = max_distance
+        self._hashes = np.zeros(0, dtype=np.uint64)
+        self._paths = []
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._paths)
+
+    def nearest(self, h):
+        # -> (path, hamming distance) of the closest indexed capture, or (None, None)
+        if not self._paths: return None, None
+        xor = np.bitwise_xor(self._hashes, np.uint64(h))
+        dist = np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+        i = int(np.argmin(dist))
+        return self._paths[i], int(dist[i])
+
+    def match(self, h):
+        path, dist = self.nearest(h)
+        if path is not None and dist <= self.max_distance:
+            self.hits += 1
+            return path
+        self.misses += 1
+        return None
+
+    def add(self, h, path):
+        self._hashes = np.append(self._hashes, np.uint64(h))
+        self._paths.append(path)
+
+    def remove(self, path):
+        if path not in self._paths: return
+        i = self._paths.index(path)
+        self._hashes = np.delete(self._hashes, i)
+        del self._paths[i]
+
+    def clear(self):
+        self._hashes = np.zeros(0, dtype=np.uint64)
+        self._paths = []
+
+    def stats(self):
+        return {"entries": len(self._paths), "hits": self.hits, "misses": self.misses}
+
+def try_lock_file(f):
+    # Non-blocking exclusive lock on an open file, released when it is closed (or its process dies)
+    # -> False if another open handle, in this process or another, holds it
+    try:
+        if platform.system() == "Windows":
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+class SessionStore:
+    # One directory per session under the capture root, described by an append-only index.jsonl:
+    #   begin | capture {file, arch, gen, kind, metrics} | written | failed | discard {file}
+    #   invalidate {arch, gen} | gc {files} | recovered | close {reason}
+    # Recapture is one "invalidate" line: it bumps the arch's generation, and files of older generations
+    # stay on disk until collect_garbage(). A session without a "close" line was interrupted; recover()
+    # finishes it on the next start. "failed" and "discarded" are terminal: a late writer callback cannot revive them.
+    # The writing store holds LOCK for the session's lifetime, so recover() never touches another instance's
+    # live session (a second main.py on the same Captures/ root).
+    INDEX = "index.jsonl"
+    LOCK = "session.lock"
+    ARCHES = ("LOWER", "UPPER")
+
+    def __init__(self, root):
+        self.root = root
+        self.id = None
+        self.dir = None
+        self._lock = threading.Lock()
+        self._index = None
+        self._lock_file = None
+        self.in_flight = None # (path) -> True while the writer still owns the file (CaptureWriter.owns); GC leaves those
+        self._reset()
+
+    def _reset(self):
+        self.gen = {arch: 0 for arch in self.ARCHES}
+        self.records = {} # file name -> capture record, in capture order
+
+    def begin(self):
+        # Start a new session; its directory and index appear with the first record
+        with self._lock:
+            self._close_index()
+            self._reset()
+            stamp = time.strftime("%Y%m%d_%H%M%S")
+            self.id, i = f"session_{stamp}", 1
+            while os.path.exists(os.path.join(self.root, self.id)):
+                i += 1
+                self.id = f"session_{stamp}_{i}"
+            self.dir = os.path.join(self.root, self.id)
+
+    def path(self, name):
+        return os.path.join(self.dir, name)
+
+    def _append(self, record, sync=False):
+        # Caller holds the lock. Flushed per line; fsync'd where losing the line would resurrect files
+        if self._index is None:
+            os.makedirs(self.dir, exist_ok=True)
+            if self._lock_file is None:
+                self._lock_file = open(os.path.join(self.dir, self.LOCK), "a+b")
+                if not try_lock_file(self._lock_file): print(f"[WARN] {self.id} is locked by another process")
+            path = os.path.join(self.dir, self.INDEX)
+            self._index = open(path, "a", encoding="utf-8")
+            if self._index.tell() == 0:
+                self._index.write(json.dumps({"op": "begin", "session": self.id, "t": time.time(), "pid": os.getpid()}) + "\n")
+            else:
+                with open(path, "rb") as f:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n": self._index.write("\n") # keep a torn last line on its own
+        self._index.write(json.dumps(record) + "\n")
+        self._index.flush()
+        if sync: os.fsync(self._index.fileno())
+
+    def add(self, path, arch, kind="capture", **meta):
+        # Record a file before it is submitted to the writer, so written()/failed() always find it
+        name = os.path.basename(path)
+        with self._lock:
+            rec = {"op": "capture", "file": name, "arch": arch, "gen": self.gen[arch], "kind": kind, "t": time.time(), **meta}
+            self._append(rec)
+            self.records[name] = dict(rec, state="pending")
+
+    def _mark(self, path, state, op):
+        # -> the record's state afterwards (None if unknown); terminal states are never left
+        name = os.path.basename(path)
+        with self._lock:
+            rec = self.records.get(name)
+            if rec is None: return None
+            if rec["state"] == state or rec["state"] in ("failed", "discarded"): return rec["state"]
+            rec["state"] = state
+            self._append({"op": op, "file": name})
+            return state
+
+    def written(self, path):
+        # A discarded capture that still landed (the writer did not know) is deleted on arrival
+        if self._mark(path, "written", "written") == "discarded":
+            try: os.remove(path)
+            except OSError: pass
+
+    def failed(self, path):
+        self._mark(path, "failed", "failed")
+
+    def discard(self, path):
+        # Logical delete (a replaced near-duplicate); the file goes with the next collect_garbage()
+        self._mark(path, "discarded", "discard")
+
+    def invalidate(self, arch):
+        # O(1) recapture: everything this arch has so far becomes garbage
+        with self._lock:
+            self.gen[arch] += 1
+            self._append({"op": "invalidate", "arch": arch, "gen": self.gen[arch]}, sync=True)
+
+    def _live(self, rec):
+        return rec["gen"] == self.gen[rec["arch"]] and rec["state"] in ("pending", "written")
+
+    def files(self, arch, kind="capture"):
+        with self._lock:
+            return [os.path.join(self.dir, name) for name, rec in self.records.items()
+                    if rec["arch"] == arch and rec["kind"] == kind and self._live(rec)]
+
+    def collect_garbage(self):
+        # Delete superseded files. Pending ones and any the writer still owns are left for a later pass.
+        with self._lock:
+            busy = self.in_flight or (lambda path: False)
+            dead = [name for name, rec in self.records.items()
+                    if not self._live(rec) and rec["state"] != "pending" and not rec.get("collected")
+                    and not busy(os.path.join(self.dir, name))]
+            removed = []
+            for name in dead:
+                path = os.path.join(self.dir, name)
+                try:
+                    if os.path.exists(path):
+                        os.remove(path)
+                        removed.append(name)
+                    self.records[name]["collected"] = True
+                except OSError as e:
+                    print(f"[ERR] Could not delete {path}: {e}")
+            if removed:
+                self._append({"op": "gc", "files": removed})
+                print(f"[DISK] Removed {len(removed)} superseded file(s) from {self.id}")
+            return len(removed)
+
+    def counts(self):
+        with self._lock:
+            return {arch: sum(1 for rec in self.records.values() if rec["arch"] == arch and rec["kind"] == "capture" and self._live(rec))
+                    for arch in self.ARCHES}
+
+    def close(self, reason="closed"):
+        counts = self.counts()
+        with self._lock:
+            if self._index is None: return
+            self._append({"op": "close", "reason": reason, "t": time.time(), "captures": counts}, sync=True)
+            self._close_index()
+
+    def _close_index(self):
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+        self._release_lock()
+
+    def _release_lock(self):
+        # After the "close" line: a recoverer that grabs the lock in between finds the session closed
+        if self._lock_file is None: return
+        self._lock_file.close()
+        self._lock_file = None
+        try: os.remove(os.path.join(self.dir, self.LOCK))
+        except OSError: pass
+
+    def load(self, session_dir):
+        # Replay an existing index (a torn last line is ignored) -> False if the session was closed cleanly
+        self._reset()
+        self.dir, self.id = session_dir, os.path.basename(session_dir)
+        with open(os.path.join(session_dir, self.INDEX), encoding="utf-8") as f:
+            for line in f:
+                try: rec = json.loads(line)
+                except ValueError: continue
+                op = rec.get("op")
+                if op == "close": return False
+                if op == "capture": self.records[rec["file"]] = dict(rec, state="pending")
+                elif op == "invalidate": self.gen[rec["arch"]] = rec["gen"]
+                elif op in ("written", "failed", "discard") and rec.get("file") in self.records:
+                    self.records[rec["file"]]["state"] = {"written": "written", "failed": "failed", "discard": "discarded"}[op]
+                elif op == "gc":
+                    for name in rec["files"]:
+                        if name in self.records: self.records[name]["collected"] = True
+        return True
+
+    def recover(self):
+        # Finish every interrupted session under the root: drop partial (.tmp) writes, settle captures whose
+        # "written" line was lost (the rename is atomic, so a present file is complete), collect garbage, close.
+        summaries = []
+        if not os.path.isdir(self.root): return summaries
+        for session_dir in sorted(glob.glob(os.path.join(self.root, "session_*"))):
+            if session_dir == self.dir or not os.path.exists(os.path.join(session_dir, self.INDEX)): continue
+            old = SessionStore(self.root)
+            try:
+                # A session another store is still writing (same or other process) is live, not interrupted
+                old._lock_file = open(os.path.join(session_dir, self.LOCK), "a+b")
+                if not try_lock_file(old._lock_file):
+                    old._lock_file.close()
+                    continue
+                old.dir = session_dir
+                if not old.load(session_dir):
+                    old._release_lock()
+                    continue
+            except OSError as e:
+                print(f"[ERR] Could not read {session_dir}: {e}")
+                if old._lock_file is not None: old._lock_file.close()
+                continue
+            for tmp in glob.glob(os.path.join(session_dir, "*.tmp")): os.remove(tmp)
+            lost = 0
+            with old._lock:
+                for name, rec in old.records.items():
+                    if rec["state"] != "pending": continue
+                    if os.path.exists(os.path.join(session_dir, name)): rec["state"] = "written"
+                    else:
+                        rec["state"] = "failed"
+                        lost += 1
+                old._append({"op": "recovered", "t": time.time(), "lost": lost}, sync=True)
+            old.collect_garbage()
+            counts = old.counts()
+            old.close("recovered")
+            print(f"[SESSION] Recovered interrupted {old.id}: {counts['LOWER']} lower, {counts['UPPER']} upper capture(s), {lost} lost")
+            summaries.append({"session": old.id, "captures": counts, "lost": lost})
+        return summaries
+
+class ThumbnailCache:
+    # Capture thumbnails for the overlay's gallery strip, in a byte-bounded LRU. add() hands the in-memory
+    # capture to a background thread (the full frame is never re-read); a miss in get() schedules a reduced
+    # decode of the file (IMREAD_REDUCED_*: the JPEG is decoded at 1/4 size) for entries evicted or written by
+    # an earlier session. Every thumbnail is letterboxed into THUMB_W x THUMB_H (capture px at 1080p).
+    THUMB_W, THUMB_H = 160, 90
+    MAX_QUEUE = 16
+    RETRY_S = 1.0 # a failed load (file still in the writer, or gone) is not asked for again before this
+
+    def __init__(self, max_bytes=16 << 20):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._thumbs = OrderedDict() # path -> thumbnail, least recently used first
+        self._bytes = 0
+        self._requested = {} # path -> time.monotonic() of the last load request
+        self._jobs = queue.Queue(self.MAX_QUEUE)
+        self._thread = None
+        self.hits = self.misses = self.loads = self.evicted = self.dropped = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="Thumbnails", daemon=True)
+            self._thread.start()
+
+    def close(self):
+        if self._thread is None: return
+        self._jobs.put((None, None))
+        self._thread.join(timeout=5.0)
+        self._thread = None
+
+    def add(self, path, frame):
+        # frame must not be modified afterwards (a capture copy is fine)
+        try: self._jobs.put_nowait((path, frame))
+        except queue.Full: self.dropped += 1 # reloaded from disk when first shown
+
+    def get(self, path):
+        # Thumbnail or None (not ready yet; a disk load is queued if nothing is on the way)
+        with self._lock:
+            thumb = self._thumbs.get(path)
+            if thumb is not None:
+                self._thumbs.move_to_end(path)
+                self.hits += 1
+                return thumb
+            self.misses += 1
+            now = time.monotonic()
+            if now - self._requested.get(path, float("-inf")) < self.RETRY_S: return None
+            self._requested[path] = now
+        try: self._jobs.put_nowait((path, None))
+        except queue.Full: pass
+        return None
 
-        # Case 2: 3 Channels (Standard JPG/PNG without alpha)
-        elif fg.shape[2] == 3:
-            bg[y_start:y_end, x_start:x_end] = fg[fg_y_start:fg_y_end, fg_x_start:fg_x_end]
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._thumbs), "kb": self._bytes // 1024, "hits": self.hits, "misses": self.misses,
+                    "loads": self.loads, "evicted": self.evicted, "dropped": self.dropped}
+
+    def _fit(self, img):
+        # Letterbox into one uniform slot, so the strip composes without per-thumbnail layout
+        h, w = img.shape[:2]
+        scale = min(self.THUMB_W / w, self.THUMB_H / h)
+        tw, th = max(1, int(w * scale)), max(1, int(h * scale))
+        thumb = np.zeros((self.THUMB_H, self.THUMB_W, 3), np.uint8)
+        y, x = (self.THUMB_H - th) // 2, (self.THUMB_W - tw) // 2
+        thumb[y:y + th, x:x + tw] = cv2.resize(img, (tw, th), interpolation=cv2.INTER_AREA)
+        return thumb
+
+    def _run(self):
+        while True:
+            path, frame = self._jobs.get()
+            if path is None: return
+            with self._lock:
+                if path in self._thumbs: continue
+            if frame is None:
+                frame = cv2.imread(path, cv2.IMREAD_REDUCED_COLOR_4)
+                if frame is None: continue
+                self.loads += 1
+            thumb = self._fit(frame)
+            with self._lock:
+                self._thumbs[path] = thumb
+                self._bytes += thumb.nbytes
+                self._requested.pop(path, None)
+                while self._bytes > self.max_bytes and len(self._thumbs) > 1:
+                    _, old = self._thumbs.popitem(last=False)
+                    self._bytes -= old.nbytes
+                    self.evicted += 1
 
 # ==========================================
-# 5. Session Manager
+# 9. Arch Mosaic
+# ==========================================
+
+class ArchMosaic:
+    # Panorama of one arch at WIDTH px per capture ROI. Each new capture is registered against the
+    # previous one only (ORB + partial affine, constrained by the odometry step) and warped into its own
+    # bounding box on the canvas, so adding a frame costs the same however long the arch gets.
+    WIDTH = 480
+    MAX_CANVAS = 6000 # px, either side
+    SEED_RADIUS = 0.25 # match must land within this fraction of WIDTH of the odometry prediction
+    MIN_INLIERS = 15
+
+    def __init__(self, name):
+        self.name = name
+        self._orb = cv2.ORB_create(nfeatures=600)
+        self._matcher = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
+        self.reset()
+
+    def reset(self):
+        self.canvas = None
+        self._used = None # (x0, y0, x1, y1) of painted pixels on the canvas
+        self._origin = np.zeros(2)   # canvas position of the first image's (0, 0)
+        self._to_world = np.eye(3)   # last image -> first image
+        self._prev = None            # (keypoints xy, descriptors) of the last image
+        self.frames = 0
+        self.registered = 0
+        self.seeded_only = 0 # placed from odometry alone, registration failed
+        self.rejected = 0
+        self.version = 0
+
+    def _prepare(self, frame):
+        # Same ROI as the motion worker
+        h, w = frame.shape[:2]
+        crop = frame[int(h*0.2):int(h*0.8), int(w*0.15):int(w*0.85)]
+        small = cv2.resize(crop, (self.WIDTH, int(crop.shape[0] * self.WIDTH / crop.shape[1])), interpolation=cv2.INTER_AREA)
+        kps, desc = self._orb.detectAndCompute(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), None)
+        pts = np.float32([k.pt for k in kps]).reshape(-1, 2)
+        return small, pts, desc
+
+    def _register(self, pts, desc, seed):
+        # -> 3x3 transform mapping this image into the previous one, or None
+        prev_pts, prev_desc = self._prev
+        if desc is None or prev_desc is None or len(pts) < self.MIN_INLIERS: return None
+        matches = self._matcher.match(desc, prev_desc)
+        if len(matches) < self.MIN_INLIERS: return None
+        src = pts[[m.queryIdx for m in matches]]
+        dst = prev_pts[[m.trainIdx for m in matches]]
+        if seed is not None:
+            near = np.hypot(*(dst - src - seed).T) < self.SEED_RADIUS * self.WIDTH
+            src, dst = src[near], dst[near]
+            if len(src) < self.MIN_INLIERS: return None
+        A, inliers = cv2.estimateAffinePartial2D(src, dst, method=cv2.RANSAC, ransacReprojThreshold=3.0)
+        if A is None or int(inliers.sum()) < self.MIN_INLIERS: return None
+        scale = np.hypot(A[0, 0], A[1, 0])
+        if not 0.8 < scale < 1.25: return None
+        return np.vstack([A, [0, 0, 1]])
+
+    def add(self, frame, seed=None):
+        # seed: expected (dx, dy) of this capture relative to the previous one, in mosaic px. Returns True if placed.
+        small, pts, desc = self._prepare(frame)
+        self.frames += 1
+        if self._prev is None:
+            step = np.eye(3)
+        else:
+            step = self._register(pts, desc, None if seed is None else np.float32(seed))
+            if step is not None: self.registered += 1
+            elif seed is not None:
+                step = np.array([[1, 0, seed[0]], [0, 1, seed[1]], [0, 0, 1]], np.float64)
+                self.seeded_only += 1
+            else:
+                self.rejected += 1
+                return False
+        to_world = self._to_world @ step
+        if not self._paint(small, to_world):
+            self.rejected += 1
+            return False
+        self._to_world = to_world
+        self._prev = (pts, desc)
+        self.version += 1
+        return True
+
+    def _paint(self, img, to_world):
+        h, w = img.shape[:2]
+        world = cv2.transform(np.float32([[[0, 0], [w, 0], [0, h], [w, h]]]), to_world[:2])[0]
+        lo, hi = np.floor(world.min(axis=0)), np.ceil(world.max(axis=0))
+        if not self._ensure(*(lo + self._origin).astype(int), *(hi + self._origin).astype(int)): return False
+        x0, y0 = (lo + self._origin).astype(int)
+        x1, y1 = (hi + self._origin).astype(int)
+        M = to_world[:2].copy()
+        M[:, 2] += self._origin - (x0, y0)
+        size = (int(x1 - x0), int(y1 - y0))
+        warped = cv2.warpAffine(img, M, size, flags=cv2.INTER_LINEAR)
+        mask = cv2.warpAffine(np.full((h, w), 255, np.uint8), M, size, flags=cv2.INTER_NEAREST)
+        mask = cv2.erode(mask, None) # drop the interpolated black border
+        np.copyto(self.canvas[y0:y1, x0:x1], warped, where=mask[..., None] > 0)
+        u = self._used
+        self._used = (x0, y0, x1, y1) if u is None else (min(u[0], x0), min(u[1], y0), max(u[2], x1), max(u[3], y1))
+        return True
+
+    def _ensure(self, x0, y0, x1, y1):
+        # Grow the canvas (with slack, so this is rare) until it holds the box; False past MAX_CANVAS
+        if self.canvas is None:
+            self.canvas = np.zeros((max(1, y1 - y0) * 2, max(1, x1 - x0) * 3, 3), np.uint8)
+            self._origin = self._origin + (self.canvas.shape[1] // 3 - x0, self.canvas.shape[0] // 4 - y0)
+            return True
+        ch, cw = self.canvas.shape[:2]
+        if x0 >= 0 and y0 >= 0 and x1 <= cw and y1 <= ch: return True
+        pad_l = max(0, -x0) + (self.WIDTH if x0 < 0 else 0)
+        pad_t = max(0, -y0) + (self.WIDTH // 2 if y0 < 0 else 0)
+        pad_r = max(0, x1 - cw) + (self.WIDTH if x1 > cw else 0)
+        pad_b = max(0, y1 - ch) + (self.WIDTH // 2 if y1 > ch else 0)
+        if cw + pad_l + pad_r > self.MAX_CANVAS or ch + pad_t + pad_b > self.MAX_CANVAS: return False
+        grown = np.zeros((ch + pad_t + pad_b, cw + pad_l + pad_r, 3), np.uint8)
+        grown[pad_t:pad_t + ch, pad_l:pad_l + cw] = self.canvas
+        self.canvas = grown
+        self._origin = self._origin + (pad_l, pad_t)
+        if self._used is not None:
+            u = self._used
+            self._used = (u[0] + pad_l, u[1] + pad_t, u[2] + pad_l, u[3] + pad_t)
+        return True
+
+    def image(self):
+        # Painted region of the canvas (a view), or None before the first frame
+        if self._used is None: return None
+        x0, y0, x1, y1 = self._used
+        return self.canvas[y0:y1, x0:x1]
+
+class MosaicBuilder:
+    # Registers and composites captures on one background thread, so a capture only pays for a queue put.
+    # Keeps a small preview per arch for the overlay, refreshed after every frame placed.
+    # Control messages wait at most PUT_TIMEOUT_S for queue space, so no caller blocks on a stuck builder.
+    MAX_QUEUE = 4
+    PUT_TIMEOUT_S = 1.0
+
+    def __init__(self, arches=("LOWER", "UPPER"), preview_size=(300, 90)):
+        self.mosaics = {a: ArchMosaic(a) for a in arches}
+        self.preview_size = preview_size
+        self._previews = {}
+        self._lock = threading.Lock()
+        self._jobs = queue.Queue(self.MAX_QUEUE)
+        self.dropped = 0
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="MosaicBuilder", daemon=True)
+            self._thread.start()
+
+    def add(self, arch, frame, seed=None):
+        # frame must not be modified afterwards (a capture copy is fine)
+        try: self._jobs.put_nowait((arch, frame, seed))
+        except queue.Full: self.dropped += 1
+
+    def reset(self, arch):
+        try: self._jobs.put(("reset", arch, None), timeout=self.PUT_TIMEOUT_S)
+        except queue.Full:
+            print(f"[MOSAIC] Builder busy, {arch} reset dropped")
+            return False
+        return True
+
+    def flush(self, timeout=5.0):
+        # -> True once everything queued before the call has been placed, within timeout seconds overall
+        done = threading.Event()
+        deadline = time.monotonic() + timeout
+        try: self._jobs.put(("flush", done, None), timeout=min(timeout, self.PUT_TIMEOUT_S))
+        except queue.Full: return False
+        return done.wait(max(0.0, deadline - time.monotonic()))
+
+    def close(self):
+        if self._thread is None: return
+        try: self._jobs.put((None, None, None), timeout=self.PUT_TIMEOUT_S)
+        except queue.Full: print("[MOSAIC] Builder busy at close, leaving it to exit with the process")
+        self._thread.join(timeout=5.0)
+        self._thread = None
+
+    def preview(self, arch):
+        with self._lock: return self._previews.get(arch)
+
+    def snapshot(self, arch):
+        # Private copy of the finished panorama (None if empty), for the capture writer; call flush() first
+        img = self.mosaics[arch].image()
+        return None if img is None else img.copy()
+
+    def _run(self):
+        while True:
+            arch, frame, seed = self._jobs.get()
+            if arch is None: return
+            if arch == "flush":
+                frame.set()
+                continue
+            if arch == "reset":
+                self.mosaics[frame].reset()
+                with self._lock: self._previews.pop(frame, None)
+                continue
+            mosaic = self.mosaics[arch]
+            try: placed = mosaic.add(frame, seed)
+            except cv2.error as e:
+                print(f"[MOSAIC] {arch} registration failed: {e}")
+                continue
+            if not placed: continue
+            img = mosaic.image()
+            pw, ph = self.preview_size
+            scale = min(pw / img.shape[1], ph / img.shape[0])
+            preview = cv2.resize(img, (max(1, int(img.shape[1] * scale)), max(1, int(img.shape[0] * scale))), interpolation=cv2.INTER_AREA)
+            with self._lock: self._previews[arch] = preview
+
+# ==========================================
+# 10. Session Manager
 # ==========================================
 
 class SessionManager:
-    def __init__(self, guidance_system, asset_manager, drawer):
+    def __init__(self, guidance_system, asset_manager, drawer, save_dir=None):
         self.guidance = guidance_system
         self.assets = asset_manager
         self.drawer = drawer
@@ -438,16 +2642,63 @@ class SessionManager:
         self.btn_text = ""
         self.progress_text = ""
         
-        self.save_dir = os.path.join(os.getcwd(), "Captures")
+        self.save_dir = save_dir or os.path.join(os.getcwd(), "Captures")
         if not os.path.exists(self.save_dir): os.makedirs(self.save_dir)
         
-        # File Tracking for Deletion
-        self.files_lower = []
-        self.files_upper = []
+        # Every session gets its own directory and index; file lists come from the index
+        self.store = SessionStore(self.save_dir)
+        self.store.begin()
+
+        # Encoding/IO happens on the writer pool, never on the guidance thread
+        self.capture_writer = CaptureWriter(workers=2, max_queue=8, fmt="jpg", quality=95)
+        self.capture_writer.on_written = self.store.written
+        self.capture_writer.on_write_failed = self.store.failed
+        self.store.in_flight = self.capture_writer.owns
+        self.FLUSH_TIMEOUT_S = 5.0 # longest the UI thread waits for the writer (end of scan, reset)
+
+        # Near-duplicate suppression: "skip" keeps the older view, "replace" swaps in the new one
+        self.DEDUP_POLICY = "skip"
+        self.DEDUP_MAX_DISTANCE = 6
+        self.hash_index = {"LOWER": PerceptualHashIndex(self.DEDUP_MAX_DISTANCE),
+                           "UPPER": PerceptualHashIndex(self.DEDUP_MAX_DISTANCE)}
+
+        # Live per-arch panorama; saved as MOSAIC_<arch>_<ts> when the session completes
+        self.mosaic = MosaicBuilder()
+        self.mosaic_files = {}
+        self._saver = None # thread finishing a completed scan (mosaics, writer flush, trace)
+
+        # Thumbnails for the overlay's gallery strip, made from the capture in memory
+        self.thumbnails = ThumbnailCache()
         
         self.guidance.on_capture_triggered = self.on_internal_capture
+        self.guidance.on_stopped = self._shutdown
+        self.on_event = None # (kind, dict) for remote viewers; called from the UI and guidance threads
+
+    def _emit(self, kind, **data):
+        if self.on_event: self.on_event(kind, data)
+
+    @property
+    def btn_text(self):
+        # The action button is inert while a completed scan is still being saved
+        return "Saving..." if self.saving() else self._btn_text
+
+    @btn_text.setter
+    def btn_text(self, text):
+        self._btn_text = text
+
+    @property
+    def files_lower(self):
+        return self.store.files("LOWER")
+
+    @property
+    def files_upper(self):
+        return self.store.files("UPPER")
 
     def start_session(self):
+        self.store.recover()
+        self.capture_writer.start()
+        self.mosaic.start()
+        self.thumbnails.start()
         self.guidance.start()
         self.state = ScanningState.READY_TO_SCAN_LOWER
         self.update_ui_state()
@@ -455,61 +2706,149 @@ class SessionManager:
     def action_button_click(self):
         if self.state == ScanningState.READY_TO_SCAN_LOWER:
             self.state = ScanningState.SCANNING_LOWER
+            self.guidance.select_odometry("LOWER").reset()
+            self.mosaic.reset("LOWER")
             self.guidance.set_processing_active(True)
         elif self.state == ScanningState.SCANNING_LOWER:
             self.state = ScanningState.READY_TO_SCAN_UPPER
             self.guidance.set_processing_active(False)
         elif self.state == ScanningState.READY_TO_SCAN_UPPER:
             self.state = ScanningState.SCANNING_UPPER
+            self.guidance.select_odometry("UPPER").reset()
+            self.mosaic.reset("UPPER")
             self.guidance.set_processing_active(True)
         elif self.state == ScanningState.SCANNING_UPPER:
             self.state = ScanningState.COMPLETE
             self.guidance.set_processing_active(False)
+            # Mosaic and writer flushes can take seconds: done off the UI thread, the button waits for them
+            self._saver = threading.Thread(target=self._finish_scan, name="SessionSaver", daemon=True)
+            self._saver.start()
+        elif self.state == ScanningState.COMPLETE and self.saving():
+            print("[SESSION] Still saving the scan")
+            return
         elif self.state == ScanningState.COMPLETE:
-            # Full Reset
-            self.files_lower = []
-            self.files_upper = []
-            self.state = ScanningState.READY_TO_SCAN_LOWER
+            # Full Reset: close this session's index and start the next session in a new directory.
+            # With captures still being written the session stays open, so their index lines are not lost.
+            if self.flush_captures():
+                self.store.collect_garbage()
+                self.store.close("finished")
+                self.store.begin()
+                self.mosaic_files = {}
+                for index in self.hash_index.values(): index.clear()
+                self.state = ScanningState.READY_TO_SCAN_LOWER
             
         self.update_ui_state()
 
     def recapture_click(self):
         # --- FIX: RECAPTURE LOGIC UPDATE ---
+        # Invalidation is one index line; the files (even ones still queued) go at the next garbage collection
         
         # Scenario 1: User just finished Lower scan, hasn't started Upper.
         # Action: Undo Lower scan.
         if self.state == ScanningState.READY_TO_SCAN_UPPER:
-            print("[SESSION] Recapturing Lower Arch... Deleting lower files.")
-            self._delete_files(self.files_lower)
-            self.files_lower = []
+            print("[SESSION] Recapturing Lower Arch... Invalidating lower files.")
+            self.store.invalidate("LOWER")
+            self._emit("recapture", arch="LOWER")
+            self.hash_index["LOWER"].clear()
             self.state = ScanningState.READY_TO_SCAN_LOWER
             self.guidance.set_processing_active(False)
             
         # Scenario 2: User finished Upper scan (Session Complete).
         # Action: Undo Upper scan only. Go back to start of Upper.
+        elif self.state == ScanningState.COMPLETE and self.saving():
+            print("[SESSION] Still saving the scan")
+            return
         elif self.state == ScanningState.COMPLETE:
-            print("[SESSION] Recapturing Upper Arch... Deleting upper files.")
-            self._delete_files(self.files_upper)
-            self.files_upper = []
+            print("[SESSION] Recapturing Upper Arch... Invalidating upper files.")
+            self.mosaic_files.pop("UPPER", None) # same arch and generation, so invalidated with the captures
+            self.store.invalidate("UPPER")
+            self._emit("recapture", arch="UPPER")
+            self.hash_index["UPPER"].clear()
             self.state = ScanningState.READY_TO_SCAN_UPPER  # Go back to start of Upper
             self.guidance.set_processing_active(False)
             
         self.update_ui_state()
 
-    def _delete_files(self, file_list):
-        for fpath in file_list:
-            try:
-                if os.path.exists(fpath):
-                    os.remove(fpath)
-                    print(f"[DISK] Deleted {os.path.basename(fpath)}")
-            except Exception as e:
-                print(f"[ERR] Could not delete {fpath}: {e}")
+    def saving(self):
+        return self._saver is not None and self._saver.is_alive()
+
+    def wait_saved(self, timeout=None):
+        # -> True once the completed scan's mosaics, captures and trace are out (or nothing was saving)
+        if self._saver is not None: self._saver.join(timeout)
+        return not self.saving()
+
+    def _finish_scan(self):
+        self.save_mosaics()
+        self.flush_captures()
+        self.export_trace()
+        if self.state == ScanningState.COMPLETE:
+            self._emit("state", state=self.state.name, text=self.main_text, progress=self.progress_text, saving=False)
+
+    def flush_captures(self):
+        # Bounded wait (UI or saver thread); -> False (and reported) if the writer is still busy
+        if self.capture_writer.flush(self.FLUSH_TIMEOUT_S): return True
+        pending = self.capture_writer.pending
+        print(f"[WARN] {pending} capture(s) still being written after {self.FLUSH_TIMEOUT_S:g} s")
+        self._emit("save_pending", pending=pending)
+        return False
+
+    def save_mosaics(self):
+        # Arches already saved (lower, after an upper recapture) are not written again
+        self.mosaic.flush()
+        ts = int(time.time() * 1000)
+        for arch in self.mosaic.mosaics:
+            if arch in self.mosaic_files: continue
+            img = self.mosaic.snapshot(arch)
+            if img is None: continue
+            path = self.capture_writer.path_for(self.store.path(f"MOSAIC_{arch}_{ts}"))
+            self.store.add(path, arch, kind="mosaic")
+            if self.capture_writer.submit(img, path): self.mosaic_files[arch] = path
+            else: self.store.failed(path)
+
+    def review_arch(self):
+        # Arch being scanned or just finished, shown by the mosaic preview and the gallery strip
+        if self.state in (ScanningState.SCANNING_LOWER, ScanningState.READY_TO_SCAN_UPPER): return "LOWER"
+        if self.state in (ScanningState.SCANNING_UPPER, ScanningState.COMPLETE): return "UPPER"
+        return None
+
+    def mosaic_preview(self):
+        arch = self.review_arch()
+        return None if arch is None else self.mosaic.preview(arch)
+
+    def gallery(self):
+        # (label, capture paths oldest first, ThumbnailCache) for OverlayDrawer, or None
+        arch = self.review_arch()
+        return None if arch is None else (arch, self.store.files(arch), self.thumbnails)
+
+    def _shutdown(self):
+        if not self.wait_saved(2 * self.FLUSH_TIMEOUT_S): print("[WARN] Scan still saving at shutdown")
+        self.mosaic.close()
+        self.thumbnails.close()
+        self.capture_writer.close()
+        self.store.collect_garbage()
+        self.store.close("stopped")
+
+    def export_trace(self):
+        # Dump this session's stage latencies next to the captures and start a fresh trace
+        base = self.store.path(f"trace_{int(time.time() * 1000)}")
+        try:
+            os.makedirs(self.store.dir, exist_ok=True)
+            self.guidance.profiler.export(base)
+            recorder = self.guidance.trace_recorder
+            if recorder is not None and len(recorder):
+                recorder.save(base + "_motion.npz", target_width=self.guidance.motion_width)
+                recorder.clear()
+        except OSError as e: print(f"[ERR] Trace export failed: {e}")
+        self.guidance.profiler.reset()
 
     def on_internal_capture(self):
         self.drawer.trigger_flash()
         
-        frame = self.guidance.get_latest_frame()
-        if frame is None: return
+        # Sharpest frame of the stable period, as a private copy for the writer pool
+        frame, focus, seq = self.guidance.get_best_frame()
+        if frame is None:
+            print("[CAPTURE] Stable frames no longer retained, capture dropped")
+            return
         ts = int(time.time() * 1000)
         
         # Determine Arch and save to correct list
@@ -519,17 +2858,62 @@ class SessionManager:
         else:
             arch = "UPPER"
             
-        filename = f"{arch}_{ts}.jpg"
-        full_path = os.path.join(self.save_dir, filename)
-        
-        cv2.imwrite(full_path, frame)
-        print(f"[DISK] Saved {filename}")
+        full_path = self.capture_writer.path_for(self.store.path(f"{arch}_{ts}"))
+        if focus is not None: print(f"[CAPTURE] {arch} frame #{seq}, best of stable window, focus {focus:.0f}")
+
+        # Every capture goes to the mosaic (even a duplicate view), seeded with the odometry step in mosaic px
+        step = self.guidance.odometry.last_step
+        seed = None if step is None else (step[0] * ArchMosaic.WIDTH / self.guidance.motion_width,
+                                          step[1] * ArchMosaic.WIDTH / self.guidance.motion_width)
+        self.mosaic.add(arch, frame, seed)
+
+        # Same view as an earlier capture of this arch?
+        index = self.hash_index[arch]
+        frame_hash = dhash(frame)
+        duplicate = index.match(frame_hash)
+        if duplicate is not None:
+            if self.DEDUP_POLICY == "skip":
+                print(f"[CAPTURE] Skipped near-duplicate of {os.path.basename(duplicate)}")
+                self._emit("capture_skipped", arch=arch, seq=seq, duplicate_of=os.path.basename(duplicate))
+                return
+            print(f"[CAPTURE] Replacing near-duplicate {os.path.basename(duplicate)}")
+            index.remove(duplicate)
+            # Terminal in the index first, then out of the writer if it is still there (else GC deletes it)
+            self.store.discard(duplicate)
+            self.capture_writer.discard(duplicate)
         
-        # Add to tracking list
-        if arch == "LOWER":
-            self.files_lower.append(full_path)
-        else:
-            self.files_upper.append(full_path)
+        # Index it before submitting, so the writer's written/failed callbacks always find the record
+        ms = self.guidance.motion_state()
+        finite = lambda v: round(float(v), 3) if np.isfinite(v) else None
+        self.store.add(full_path, arch, seq=seq, focus=finite(focus) if focus is not None else None,
+                       mu=finite(ms.mu), sigma=finite(ms.sigma), travel=finite(ms.travel), dhash=f"{frame_hash:016x}")
+        if not self.capture_writer.submit(frame, full_path):
+            self.store.failed(full_path)
+            return
+        index.add(frame_hash, full_path)
+        self.thumbnails.add(full_path, frame)
+        self._emit("capture", arch=arch, file=os.path.basename(full_path), seq=seq,
+                   focus=None if focus is None else round(float(focus), 1), count=len(self.store.files(arch)))
+
+    def refresh_progress(self):
+        # Coverage readout while scanning, from the arch odometry; 10% steps keep the panel cache warm
+        if self.state == ScanningState.SCANNING_LOWER: step = "1/2"
+        elif self.state == ScanningState.SCANNING_UPPER: step = "2/2"
+        else: return
+        self.progress_text = f"{step}  {int(self.guidance.progress() * 10) * 10}%"
+
+    def metrics(self):
+        # Per-session health, comparable across scopes sharing one machine
+        stages = self.guidance.profiler.summary()
+        return {"state": self.state.name, "session": self.store.id, "captures": sum(self.store.counts().values()),
+                "ring_dropped": self.guidance.frame_ring.dropped, "ring_overruns": self.guidance.frame_ring.overruns,
+                "motion_every_n": self.guidance.scheduler.every_n, "motion_width": self.guidance.scheduler.width,
+                "motion": stages.get("motion"), "e2e": stages.get("e2e"), "pool": self.guidance.pool_stats(),
+                "writer": self.capture_writer.metrics(), "mosaic_dropped": self.mosaic.dropped, "dedup": self.dedup_stats(),
+                "thumbnails": self.thumbnails.stats()}
+
+    def dedup_stats(self):
+        return {arch: index.stats() for arch, index in self.hash_index.items()}
 
     def update_ui_state(self):
         if self.state == ScanningState.READY_TO_SCAN_LOWER:
@@ -562,77 +2946,277 @@ class SessionManager:
             self.progress_text = "Done"
             self.assets.play_voice("Ins5.wav")
 
+        self._emit("state", state=self.state.name, text=self.main_text, progress=self.progress_text, saving=self.saving())
+
 # ==========================================
-# 6. Main Entry Point
+# 11. Main Entry Point
 # ==========================================
 
-g_session = None
-g_drawer = None
-
 def mouse_callback(event, x, y, flags, param):
+    # param is the ScopeView that owns the window
+    # x, y are in the coordinates of the image last shown, i.e. the display-sized frame the rects were drawn on
+    session, drawer = param.session, param.drawer
+    if event == cv2.EVENT_MOUSEWHEEL:
+        # Wheel scrolls the gallery strip (up: older captures)
+        drawer.scroll_gallery(-1 if cv2.getMouseWheelDelta(flags) > 0 else 1)
+        return
     if event == cv2.EVENT_LBUTTONDOWN:
-        if g_drawer and g_session:
-            # Main Button
-            r1 = g_drawer.btn_main_rect
-            if r1 and r1[0] <= x <= r1[2] and r1[1] <= y <= r1[3]:
-                g_session.action_button_click()
+        # Main Button
+        r1 = drawer.btn_main_rect
+        if r1 and r1[0] <= x <= r1[2] and r1[1] <= y <= r1[3]:
+            session.action_button_click()
+            return
+        # Recapture Button
+        r2 = drawer.btn_recapture_rect
+        if r2 and r2[0] <= x <= r2[2] and r2[1] <= y <= r2[3]:
+            session.recapture_click()
+            return
+        # Gallery strip arrows page through the arch's captures
+        for rect, pages in ((drawer.gallery_prev_rect, -1), (drawer.gallery_next_rect, 1)):
+            if rect and rect[0] <= x <= rect[2] and rect[1] <= y <= rect[3]:
+                drawer.scroll_gallery(pages, page=True)
                 return
-            # Recapture Button
-            r2 = g_drawer.btn_recapture_rect
-            if r2 and r2[0] <= x <= r2[2] and r2[1] <= y <= r2[3]:
-                g_session.recapture_click()
-
-def main():
-    global g_session, g_drawer
-    
-    cap = cv2.VideoCapture(0)
-    # High Res attempt
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1920)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 1080)
-    
-    if not cap.isOpened():
-        print("Error: No camera.")
-        return
 
-    assets = AssetManager()
-    drawer = OverlayDrawer(assets)
-    guidance = GuidanceSystem(assets)
-    g_session = SessionManager(guidance, assets, drawer)
-    g_drawer = drawer
-    
-    latest_result = None
-    def on_update(res): nonlocal latest_result; latest_result = res
-    guidance.on_guidance_updated = on_update
-    
-    g_session.start_session()
-    
-    window_name = "Dental Scanner"
-    cv2.namedWindow(window_name, cv2.WINDOW_NORMAL)
-    cv2.setWindowProperty(window_name, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN)
-    cv2.setMouseCallback(window_name, mouse_callback)
+class ScopeView:
+    # One camera with its own session, guidance, grabber, overlay and window; nothing is shared
+    # with other scopes except the assets and the guidance WorkerPool.
+    HUD_STAGES = ["read", "publish", "display_copy", "draw_ui", "imshow", "waitKey", "motion", "state", "e2e", "display_age"]
+
+    def __init__(self, index, source, assets, pool, save_dir=None, window_name="Dental Scanner", startup=None, motion_width=480):
+        self.index = index
+        self.source = source
+        self.window_name = window_name
+        self.startup = startup # StartupTimer for TTFF / TTFG, or None
+        self.drawer = OverlayDrawer(assets)
+        self.guidance = GuidanceSystem(assets, pool, motion_width)
+        self.session = SessionManager(self.guidance, assets, self.drawer, save_dir)
+        self.profiler = self.guidance.profiler
+        self.latest_result = None
+        self.guidance.on_guidance_updated = self._on_update
+        # Capture runs on its own thread; the display only ever shows the newest frame
+        self.grabber = FrameGrabber(source, self.guidance.frame_ring, flip=1)
+        self.grabber.profiler = self.profiler
+        self.display = DisplayScaler() # display-sized canvas; full resolution stays in the ring for captures
+        self.display_frame = None
+        self.window_size = None   # (w, h) of the window's image area, None until known
+        self.last_seq, self.display_skipped = -1, 0
+        self.frames_rendered = 0
+        self.guidance_updates = 0
+        self.t_arrival = 0.0
+        self.hud_lines, self.hud_at = [], 0.0
+        self.stream = None # StreamServer the overlay and guidance are published to, if any
+
+    def attach_stream(self, stream):
+        # Remote viewers get this scope's overlay frames, guidance, state changes and captures
+        self.stream = stream
+        self.session.on_event = lambda kind, data: stream.publish_event(kind, dict(data, scope=self.index))
+
+    def _on_update(self, res):
+        # The first update is the first motion decision (None while no arch is being scanned)
+        if self.guidance_updates == 0 and self.startup is not None: self.startup.mark(f"scope{self.index} first_guidance")
+        self.guidance_updates += 1
+        self.latest_result = res
+        if self.stream is not None: self.stream.publish_guidance(self.index, res)
 
-    while True:
-        ret, frame = cap.read()
-        if not ret: break
+    def start(self):
+        self.session.start_session()
+        self.grabber.start()
+
+    def finished(self):
+        return self.grabber.finished.is_set() and self.guidance.frame_ring.latest_seq <= self.last_seq
+
+    def fit_window(self):
+        # Follow the window's image area (fullscreen, user resize); unknown on builds without a GUI backend
+        try: _, _, w, h = cv2.getWindowImageRect(self.window_name)
+        except cv2.error: return
+        if w > 0 and h > 0: self.window_size = (w, h)
+
+    def render(self, show_hud=False, timeout=0.0):
+        # Newest frame with the overlay drawn on it, or None if nothing new arrived
+        t0 = time.perf_counter()
+        seq, shown = self.grabber.next_frame(self.last_seq, timeout)
+        if shown is None: return None
+        if self.last_seq >= 0: self.display_skipped += seq - self.last_seq - 1
+        self.last_seq = seq
+        self.t_arrival = self.guidance.frame_ring.stamp(seq) or time.monotonic()
+        t1 = time.perf_counter()
+
+        # Scaled straight from the (already mirrored) ring slot; full resolution never leaves the ring
+        self.display_frame = self.display.render(shown, self.window_size)
+        self.guidance.release_frame(seq)
+        self.drawer.set_scale(self.display.scale)
+        t3 = time.perf_counter()
+
+        session = self.session
+        session.refresh_progress()
+        self.drawer.draw_ui(self.display_frame, session.state, self.latest_result,
+                            session.main_text, session.btn_text, session.progress_text, session.mosaic_preview(),
+                            session.gallery())
+        if show_hud:
+            # Percentiles are recomputed a few times a second, not per frame
+            if t3 - self.hud_at > 0.25:
+                self.hud_lines, self.hud_at = self.profiler.hud_lines(self.HUD_STAGES), t3
+                pool = self.guidance.pool_stats() or {}
+                self.hud_lines.append(f"grabbed {self.grabber.frames_grabbed}  skipped {self.display_skipped}  dropped {self.guidance.frame_ring.dropped}")
+                self.hud_lines.append(f"display {self.display_frame.shape[1]}x{self.display_frame.shape[0]} of {shown.shape[1]}x{shown.shape[0]}")
+                self.hud_lines.append(f"pool wait {pool.get('mean_wait_ms', 0.0):.1f} ms (max {pool.get('max_wait_ms', 0.0):.1f})")
+                ms = self.guidance.motion_state()
+                self.hud_lines.append(f"quality lum {ms.brightness:.0f}  glare {ms.glare:.1%}  focus {ms.focus:.0f}"
+                                      f"{'' if ms.quality_ok else '  (gated)'}")
+            self.drawer.draw_hud(self.display_frame, self.hud_lines)
+        if self.stream is not None: self.stream.publish_frame(self.index, self.display_frame)
+        t4 = time.perf_counter()
+        self.profiler.record("frame_wait", t1 - t0, seq)
+        self.profiler.record("display_copy", t3 - t1, seq)
+        self.profiler.record("draw_ui", t4 - t3, seq)
+        if self.frames_rendered == 0 and self.startup is not None: self.startup.mark(f"scope{self.index} first_frame")
+        self.frames_rendered += 1
+        return self.display_frame
+
+    def metrics(self):
+        m = self.session.metrics()
+        m.update({"scope": self.index, "source": getattr(self.source, "name", "?"), "frames_grabbed": self.grabber.frames_grabbed,
+                  "grab_refused": self.grabber.frames_refused, "display_skipped": self.display_skipped,
+                  "startup": dict(self.startup.marks) if self.startup is not None else None})
+        return m
 
-        # Mirror view
-        frame = cv2.flip(frame, 1)
+    def stop(self):
+        self.grabber.stop()
+        self.guidance.stop()
+        m = self.metrics()
+        print(f"[MAIN] Scope {self.index} ({m['source']}): grabbed {m['frames_grabbed']}, refused {m['grab_refused']}, "
+              f"not displayed {m['display_skipped']}, never analysed or shown {m['ring_dropped']}, captures {m['captures']}")
+        self.session.export_trace()
+        self.source.release()
+
+def open_scopes(specs, open_source, audio_sink=None, startup=None, while_opening=None, parallel=True):
+    # Camera negotiation (seconds on some UVC scopes) overlaps everything else: each source opens on its own
+    # thread while the assets load and the icons are pre-scaled here, then while_opening() runs (window setup).
+    # -> (sources, assets); sources is None if any failed to open (the others are released).
+    startup = startup or StartupTimer(verbose=False)
+    startup.mark("imports")
+    sources = [None] * len(specs)
+    def open_one(i):
+        try: sources[i] = open_source(specs[i])
+        except Exception as e: print(f"[ERR] Opening {specs[i]} failed: {e}")
+        startup.mark(f"source {i + 1} open")
+    threads = [threading.Thread(target=open_one, args=(i,), name=f"Open-{i + 1}", daemon=True) for i in range(len(specs))]
+    if parallel:
+        for t in threads: t.start()
+    else:
+        for i in range(len(specs)): open_one(i)
+    assets = AssetManager(audio_sink)
+    assets.prewarm_icons([OverlayDrawer.ICON_H])
+    OverlayDrawer(assets).prewarm()
+    startup.mark("assets")
+    if while_opening is not None: while_opening()
+    if parallel:
+        for t in threads: t.join()
+    startup.mark("sources")
+
+    failed = [spec for spec, src in zip(specs, sources) if src is None or not src.is_opened()]
+    if failed:
+        for spec in failed: print(f"Error: Could not open source {spec}.")
+        for src in sources:
+            if src is not None: src.release()
+        return None, assets
+    return sources, assets
 
-        guidance.process_frame(frame)
+def main():
+    parser = argparse.ArgumentParser(description="Guided intraoral auto-capture")
+    parser.add_argument("--source", action="append", default=None,
+                        help="camera index, video file or image directory; repeat for several scopes (default 0)")
+    parser.add_argument("--loop", action="store_true", help="loop recorded sources")
+    parser.add_argument("--motion", choices=sorted(MOTION_BACKENDS), default="lk", help="motion estimator backend ('m' toggles)")
+    parser.add_argument("--motion-budget", type=float, default=5.0, metavar="MS", help="average motion-estimation CPU per camera frame")
+    parser.add_argument("--motion-width", type=int, default=480, help="motion ROI width the guidance thresholds are tuned at")
+    parser.add_argument("--mute", action="store_true", help="no voice prompts")
+    parser.add_argument("--workers", type=int, default=None, help="guidance threads shared by all scopes (default: one per scope, max 4)")
+    parser.add_argument("--record-motion", action="store_true", help="save the raw MotionState stream with each trace (for sweep.py)")
+    parser.add_argument("--stream", type=int, default=None, metavar="PORT", help="serve the preview and guidance on http://127.0.0.1:PORT/")
+    parser.add_argument("--stream-width", type=int, default=640, help="width of the streamed preview")
+    args = parser.parse_args()
+    specs = args.source or ["0"]
+    startup = StartupTimer()
+    multi = len(specs) > 1
+    # Window titles come from the spec, so the windows can be created while the cameras negotiate
+    names = [f"Dental Scanner [{i + 1}] {os.path.basename(os.path.normpath(spec))}" if multi else "Dental Scanner" for i, spec in enumerate(specs)]
+
+    def create_windows():
+        for name in names:
+            cv2.namedWindow(name, cv2.WINDOW_NORMAL)
+            if not multi: cv2.setWindowProperty(name, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN)
+        startup.mark("windows")
+
+    sources, assets = open_scopes(specs, lambda spec: open_frame_source(spec, realtime=True, loop=args.loop),
+                                  NullSink() if args.mute else None, startup, create_windows)
+    if sources is None:
+        assets.close()
+        cv2.destroyAllWindows()
+        return
 
-        display_frame = frame.copy()
-        g_drawer.draw_ui(display_frame, g_session.state, latest_result, 
-                         g_session.main_text, g_session.btn_text, g_session.progress_text)
-        
-        cv2.imshow(window_name, display_frame)
+    pool = WorkerPool(args.workers or min(len(sources), 4))
+    stream = None
+    if args.stream is not None:
+        from stream_server import StreamServer
+        stream = StreamServer(port=args.stream, width=args.stream_width)
+        if not stream.start(): stream = None
+    views = []
+    for i, cap in enumerate(sources):
+        save_dir = os.path.join(os.getcwd(), "Captures", f"scope{i + 1}") if multi else None
+        view = ScopeView(i + 1, cap, assets, pool, save_dir, names[i], startup, args.motion_width)
+        view.guidance.set_motion_backend(args.motion)
+        view.guidance.MOTION_BUDGET_MS = args.motion_budget
+        if args.record_motion: view.guidance.trace_recorder = MotionTraceRecorder()
+        if stream is not None: view.attach_stream(stream)
+        views.append(view)
+
+    for view in views:
+        cv2.setMouseCallback(view.window_name, mouse_callback, view)
+        view.start()
+
+    # Keys act on one scope at a time; 1..9 picks it (the mouse always acts on the window clicked)
+    active = views[0]
+    show_hud = False
+    fitted_at = 0.0
+    while True:
+        # Render at the windows' current size, re-read a few times a second
+        if time.monotonic() - fitted_at > 0.5:
+            for view in views: view.fit_window()
+            fitted_at = time.monotonic()
+        shown = []
+        for view in views:
+            frame = view.render(show_hud, timeout=0.0 if multi else 0.1)
+            if frame is None: continue
+            shown.append(view)
+            t4 = time.perf_counter()
+            cv2.imshow(view.window_name, frame)
+            view.profiler.record("imshow", time.perf_counter() - t4, view.last_seq)
+        if all(view.finished() for view in views): break
+
+        t5 = time.perf_counter()
+        key = cv2.waitKey(1 if shown or not multi else 5) & 0xFF
+        for view in shown:
+            view.profiler.record("waitKey", time.perf_counter() - t5, view.last_seq)
+            view.profiler.record("display_age", time.monotonic() - view.t_arrival, view.last_seq) # frame arrival -> on screen
 
-        key = cv2.waitKey(1) & 0xFF
         if key == ord('q'): break
-        elif key == ord(' '): g_session.action_button_click()
-        elif key == ord('r'): g_session.recapture_click()
-
-    guidance.stop()
-    cap.release()
+        elif key == ord(' '): active.session.action_button_click()
+        elif key == ord('r'): active.session.recapture_click()
+        elif key == ord('h'): show_hud = not show_hud
+        elif key == ord('['): active.drawer.scroll_gallery(-1, page=True)
+        elif key == ord(']'): active.drawer.scroll_gallery(1, page=True)
+        elif ord('1') <= key <= ord('9') and key - ord('1') < len(views):
+            active = views[key - ord('1')]
+            print(f"[MAIN] Keyboard controls scope {active.index}")
+        elif key == ord('m'):
+            backends = sorted(MOTION_BACKENDS)
+            active.guidance.set_motion_backend(backends[(backends.index(active.guidance.MOTION_BACKEND) + 1) % len(backends)])
+
+    for view in views: view.stop()
+    if stream is not None: stream.close()
+    pool.close()
+    assets.close()
     cv2.destroyAllWindows()
 
 if __name__ == "__main__":
@@ -0,0 +1,309 @@
+import cv2
+import json
+import math
+import time
+import asyncio
+import threading
+import numpy as np
+from collections import deque
+from dataclasses import asdict
+from urllib.parse import urlsplit, parse_qs
+
+# ==========================================
+# 1. Payloads
+# ==========================================
+
+def guidance_payload(res):
+    # GuidanceResult (None while no arch is being scanned) -> JSON-safe dict; non-finite numbers become null
+    if res is None: return {"active": False}
+    b, g, r = res.color
+    motion = {k: (None if isinstance(v, float) and not math.isfinite(v) else v) for k, v in asdict(res.motion).items()}
+    motion["quality_ok"] = res.motion.quality_ok
+    return {"active": True, "prompt": res.prompt, "color": f"#{r:02x}{g:02x}{b:02x}", "frame_seq": res.frame_seq, "motion": motion}
+
+INDEX_HTML = """<!doctype html>
+<html><head><meta charset="utf-8"><title>Dental Scanner</title>
+<style>body{background:#111;color:#ddd;font:14px sans-serif;margin:12px}img{max-width:100%%;display:block}
+#prompt{font-size:22px;margin:8px 0}pre{height:12em;overflow:auto;background:#000;padding:6px}</style></head>
+<body><img src="/stream.mjpg?scope=%(scope)d"><div id="prompt">-</div><pre id="log"></pre>
+<script>
+const es = new EventSource("/events"), log = document.getElementById("log"), prompt = document.getElementById("prompt");
+es.addEventListener("guidance", e => { const d = JSON.parse(e.data); if (d.scope != %(scope)d) return;
+  prompt.textContent = d.active ? d.prompt : "-"; prompt.style.color = d.active ? d.color : "#ddd"; });
+for (const kind of ["state", "capture", "capture_skipped", "recapture", "save_pending"])
+  es.addEventListener(kind, e => { log.textContent = kind + " " + e.data + "\\n" + log.textContent; });
+</script></body></html>
+"""
+
+# ==========================================
+# 2. Clients
+# ==========================================
+
+class StreamClient:
+    # One HTTP viewer, owned by the server's event loop. Frames are never queued: a frame not yet sent when the
+    # next one arrives is dropped, so a slow viewer sees a lower frame rate and nobody else notices. Events are
+    # queued up to a bound; coalesced ones (guidance) keep only their newest message per key.
+    def __init__(self, writer, kind, max_events=64):
+        self.writer = writer
+        self.kind = kind # "mjpeg" or "events"
+        self.peer = writer.get_extra_info("peername")
+        self.frame = None
+        self.events = deque(maxlen=max_events)
+        self.latest = {}
+        self.wake = asyncio.Event()
+        self.sent = self.dropped = 0
+
+    def push_frame(self, part):
+        if self.frame is not None: self.dropped += 1
+        self.frame = part
+        self.wake.set()
+
+    def push_event(self, msg, key=None):
+        if key is not None:
+            if key in self.latest: self.dropped += 1
+            self.latest[key] = msg
+        else:
+            if len(self.events) == self.events.maxlen: self.dropped += 1
+            self.events.append(msg)
+        self.wake.set()
+
+    def take(self):
+        out = []
+        if self.frame is not None: out.append(self.frame)
+        out.extend(self.events)
+        out.extend(self.latest.values())
+        self.frame = None
+        self.events.clear()
+        self.latest.clear()
+        self.sent += len(out)
+        return out
+
+    def stats(self):
+        return {"kind": self.kind, "peer": f"{self.peer[0]}:{self.peer[1]}" if self.peer else "?", "sent": self.sent, "dropped": self.dropped}
+
+# ==========================================
+# 3. Server
+# ==========================================
+
+class StreamServer:
+    # Optional local viewer for the scan: GET /stream.mjpg?scope=N (MJPEG of the overlay as shown), GET /events
+    # (server-sent events: guidance, state, capture, recapture), GET /status (JSON) and GET / (a small page).
+    # asyncio on its own thread; the UI loop only ever pays for copying a frame that is due into a reused
+    # buffer. One encoder thread downscales and JPEG-encodes each frame once for all of a scope's viewers.
+    REQUEST_TIMEOUT_S = 5.0
+    WRITE_TIMEOUT_S = 10.0 # a viewer that cannot take anything for this long is disconnected
+    GUIDANCE_HZ = 10.0     # guidance events per scope, unless the prompt changes
+    BOUNDARY = b"frame"
+
+    def __init__(self, host="127.0.0.1", port=8080, width=640, quality=70, max_fps=15.0):
+        # --- Parameters ---
+        self.host, self.port = host, port # port 0 picks a free one (see .port after start())
+        self.WIDTH = width
+        self.QUALITY = quality
+        self.MAX_FPS = max_fps
+
+        # --- State ---
+        self._loop = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._stopping = None # asyncio.Event, created on the loop
+        self._viewers = {}    # scope -> set of mjpeg StreamClients (loop thread only)
+        self._viewer_count = {} # scope -> len(viewers), read by publish_frame from the UI thread
+        self._listeners = set() # event-stream StreamClients
+        self._last_part = {}  # scope -> newest encoded part, sent to a viewer as soon as it connects
+        self._frame_due, self._guidance_at, self._guidance_prompt = {}, {}, {}
+
+        self._cond = threading.Condition()
+        self._pending = {} # scope -> frame copy waiting for the encoder
+        self._spare = {}   # scope -> buffer the encoder has finished with
+        self._encoder = None
+        self._closed = False
+        self.frames_published = self.frames_replaced = self.frames_encoded = 0
+        self._encode_ms = deque(maxlen=256)
+
+    # --- Lifecycle ---
+    def start(self, timeout=5.0):
+        if self._thread is not None: return True
+        self._encoder = threading.Thread(target=self._encode_loop, name="StreamEncoder", daemon=True)
+        self._encoder.start()
+        self._thread = threading.Thread(target=lambda: asyncio.run(self._serve()), name="StreamServer", daemon=True)
+        self._thread.start()
+        if not self._ready.wait(timeout) or self._loop is None:
+            print(f"[STREAM] Could not listen on {self.host}:{self.port}")
+            return False
+        print(f"[STREAM] Serving on http://{self.host}:{self.port}/")
+        return True
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._loop is not None and self._stopping is not None:
+            try: self._loop.call_soon_threadsafe(self._stopping.set)
+            except RuntimeError: pass # loop already gone
+        for t in (self._thread, self._encoder):
+            if t is not None: t.join(timeout=5.0)
+        self._thread = self._encoder = None
+
+    # --- Publishing (any thread) ---
+    def publish_frame(self, scope, frame):
+        # Called by the UI loop with the frame it just drew. Nothing is done without viewers or before the
+        # next frame is due; otherwise one copy into a reused buffer. Returns True if the frame was taken.
+        if not self._viewer_count.get(scope): return False
+        # Due times advance by the interval (a quarter of it early is fine), so camera-frame jitter around the
+        # interval cannot halve the rate, and a stall is not made up with a burst
+        now, interval = time.monotonic(), 1.0 / self.MAX_FPS
+        due = self._frame_due.get(scope, now)
+        if now < due - 0.25 * interval: return False
+        self._frame_due[scope] = max(due, now - interval) + interval
+        with self._cond:
+            if self._closed: return False
+            buf = self._pending.get(scope)
+            if buf is not None: self.frames_replaced += 1 # encoder behind: overwrite the frame it has not taken
+            else: buf = self._spare.pop(scope, None)
+            if buf is None or buf.shape != frame.shape or buf.dtype != frame.dtype: buf = np.empty_like(frame)
+            np.copyto(buf, frame)
+            self._pending[scope] = buf
+            self.frames_published += 1
+            self._cond.notify()
+        return True
+
+    def publish_event(self, kind, data, key=None):
+        # data: JSON-serialisable dict. key: coalesce, i.e. a listener only gets the newest message with that key
+        if self._loop is None or not self._listeners: return
+        msg = f"event: {kind}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+        try: self._loop.call_soon_threadsafe(self._broadcast, msg, key)
+        except RuntimeError: pass # closing
+
+    def publish_guidance(self, scope, res):
+        # From the guidance thread on every update; rate-limited to GUIDANCE_HZ except when the prompt changes
+        if not self._listeners: return
+        prompt = None if res is None else res.prompt
+        now = time.monotonic()
+        if prompt == self._guidance_prompt.get(scope, "") and now - self._guidance_at.get(scope, float("-inf")) < 1.0 / self.GUIDANCE_HZ: return
+        self._guidance_prompt[scope], self._guidance_at[scope] = prompt, now
+        self.publish_event("guidance", dict(guidance_payload(res), scope=scope), key=("guidance", scope))
+
+    def stats(self):
+        enc = list(self._encode_ms)
+        clients = [c.stats() for viewers in list(self._viewers.values()) for c in list(viewers)] + [c.stats() for c in list(self._listeners)]
+        return {"clients": clients, "frames_published": self.frames_published, "frames_replaced": self.frames_replaced,
+                "frames_encoded": self.frames_encoded, "encode_ms_mean": sum(enc) / len(enc) if enc else 0.0,
+                "encode_ms_max": max(enc) if enc else 0.0}
+
+    # --- Encoder thread ---
+    def _shrink(self, frame):
+        # Area-halve while at least twice the target width, then one bilinear step (cf. DisplayScaler)
+        h, w = frame.shape[:2]
+        if w <= self.WIDTH: return frame
+        out_h = max(1, int(round(h * self.WIDTH / w)))
+        while frame.shape[1] >= 2 * self.WIDTH:
+            frame = cv2.resize(frame, (frame.shape[1] // 2, frame.shape[0] // 2), interpolation=cv2.INTER_AREA)
+        return cv2.resize(frame, (self.WIDTH, out_h), interpolation=cv2.INTER_LINEAR)
+
+    def _encode_loop(self):
+        params = [cv2.IMWRITE_JPEG_QUALITY, int(self.QUALITY)]
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed: self._cond.wait()
+                if self._closed: return
+                # Oldest pending scope first: popitem() is LIFO and would starve a scope while another keeps
+                # publishing. Overwriting a pending frame keeps its slot, so a busy scope cannot jump the queue
+                scope = next(iter(self._pending))
+                buf = self._pending.pop(scope)
+            t0 = time.perf_counter()
+            ok, jpeg = cv2.imencode(".jpg", self._shrink(buf), params)
+            with self._cond: self._spare[scope] = buf
+            if not ok: continue
+            self._encode_ms.append((time.perf_counter() - t0) * 1000.0)
+            self.frames_encoded += 1
+            # Multipart framing is built once too; every viewer of the scope gets the same bytes object
+            part = (b"--" + self.BOUNDARY + b"\r\nContent-Type: image/jpeg\r\nContent-Length: " +
+                    str(len(jpeg)).encode() + b"\r\n\r\n" + jpeg.tobytes() + b"\r\n")
+            try: self._loop.call_soon_threadsafe(self._fanout, scope, part)
+            except RuntimeError: return
+
+    # --- Event loop ---
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        try: server = await asyncio.start_server(self._handle, self.host, self.port)
+        except OSError as e:
+            print(f"[STREAM] {e}")
+            self._loop = None
+            self._ready.set()
+            return
+        self.port = server.sockets[0].getsockname()[1]
+        self._ready.set()
+        await self._stopping.wait()
+        server.close()
+        clients = [c for viewers in self._viewers.values() for c in viewers] + list(self._listeners)
+        for c in clients:
+            c.writer.close()
+            c.wake.set()
+        await server.wait_closed()
+
+    def _fanout(self, scope, part):
+        self._last_part[scope] = part
+        for client in self._viewers.get(scope, ()): client.push_frame(part)
+
+    def _broadcast(self, msg, key):
+        for client in self._listeners: client.push_event(msg, key)
+
+    async def _handle(self, reader, writer):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.REQUEST_TIMEOUT_S)
+            request = head.split(b"\r\n", 1)[0].decode("latin-1").split()
+            if len(request) < 2 or request[0] != "GET":
+                return await self._respond(writer, "405 Method Not Allowed", "text/plain", b"GET only\n")
+            url = urlsplit(request[1])
+            query = parse_qs(url.query)
+            try: scope = int(query.get("scope", ["1"])[0])
+            except ValueError: scope = 1
+            if url.path == "/stream.mjpg": await self._stream(writer, scope)
+            elif url.path == "/events": await self._events(writer)
+            elif url.path == "/status":
+                await self._respond(writer, "200 OK", "application/json", json.dumps(self.stats(), indent=2).encode("utf-8"))
+            elif url.path == "/":
+                await self._respond(writer, "200 OK", "text/html; charset=utf-8", (INDEX_HTML % {"scope": scope}).encode("utf-8"))
+            else: await self._respond(writer, "404 Not Found", "text/plain", b"not found\n")
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, ctype, body):
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {ctype}\r\nContent-Length: {len(body)}\r\n"
+                     f"Cache-Control: no-cache\r\nConnection: close\r\n\r\n".encode("latin-1") + body)
+        await asyncio.wait_for(writer.drain(), self.WRITE_TIMEOUT_S)
+
+    async def _stream(self, writer, scope):
+        client = StreamClient(writer, "mjpeg")
+        viewers = self._viewers.setdefault(scope, set())
+        viewers.add(client)
+        self._viewer_count[scope] = len(viewers)
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: multipart/x-mixed-replace; boundary=" + self.BOUNDARY +
+                     b"\r\nCache-Control: no-cache\r\nConnection: close\r\n\r\n")
+        if scope in self._last_part: client.push_frame(self._last_part[scope])
+        try: await self._pump(client)
+        finally:
+            viewers.discard(client)
+            self._viewer_count[scope] = len(viewers)
+
+    async def _events(self, writer):
+        client = StreamClient(writer, "events")
+        self._listeners.add(client)
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\nConnection: close\r\n\r\n")
+        client.push_event(b": connected\n\n")
+        try: await self._pump(client)
+        finally: self._listeners.discard(client)
+
+    async def _pump(self, client):
+        # Write whatever is pending, then wait for the socket to accept it; anything published meanwhile
+        # replaces (frames) or queues behind (events) the data in flight
+        while not self._stopping.is_set():
+            await client.wake.wait()
+            client.wake.clear()
+            if self._stopping.is_set(): return
+            client.writer.write(b"".join(client.take()))
+            await asyncio.wait_for(client.writer.drain(), self.WRITE_TIMEOUT_S)
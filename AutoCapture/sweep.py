@@ -0,0 +1,197 @@
+import os
+import csv
+import glob
+import time
+import argparse
+import itertools
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from main import GuidanceSystem, MotionTraceRecorder
+
+# Parameters the replay understands, with the live defaults from GuidanceSystem
+SWEEPABLE = ["SMOOTH_ALPHA", "SPEED_WARN_ENTER", "SPEED_WARN_CLEAR", "STAB_WARN_ENTER", "STAB_WARN_CLEAR", "WARN_CONFIRM",
+             "CAPTURE_SPEED_THRESH", "CAPTURE_STAB_THRESH", "CAPTURE_MODE", "CAPTURE_OVERLAP", "CAPTURE_SETTLE_S",
+             "CAPTURE_DELAY_S", "CAPTURE_COOLDOWN_S", "QUALITY_GATING"]
+
+def live_defaults():
+    guidance = GuidanceSystem(None)
+    return {name: getattr(guidance, name) for name in SWEEPABLE}
+
+# ==========================================
+# 1. Replay Engine
+# ==========================================
+
+def replay(trace, configs, target_width=480, capture_steps=False):
+    # Re-runs _motion_worker smoothing/hysteresis and _state_worker capture decisions over a recorded
+    # MotionTraceRecorder stream for C configurations at once: one Python step per motion step, numpy across configs.
+    # configs: dict of parameter -> array of length C. Returns per-config arrays (captures are C x segments);
+    # capture_steps=True adds, per config, the trace step indices that fired (test_sweep.py checks them against live).
+    t, mu_raw, sigma_raw = trace["t"], trace["mu_raw"], trace["sigma_raw"]
+    dx, dy, active, segment = trace["dx"], trace["dy"], trace["active"] > 0, trace["segment"].astype(int)
+    quality = trace["quality"] > 0 # recorded live gate; its own thresholds are not swept
+    C = len(configs["SMOOTH_ALPHA"])
+    n_segments = int(segment.max()) + 1 if len(segment) else 1
+    f = lambda name: np.asarray(configs[name], np.float64)
+    alpha = f("SMOOTH_ALPHA")
+    sp_enter, sp_clear, sb_enter, sb_clear = f("SPEED_WARN_ENTER"), f("SPEED_WARN_CLEAR"), f("STAB_WARN_ENTER"), f("STAB_WARN_CLEAR")
+    confirm = f("WARN_CONFIRM")
+    speed_thresh, stab_thresh = f("CAPTURE_SPEED_THRESH"), f("CAPTURE_STAB_THRESH")
+    distance_mode = np.asarray(configs["CAPTURE_MODE"]) == "distance"
+    spacing = (1.0 - f("CAPTURE_OVERLAP")) * target_width
+    settle = np.where(distance_mode, f("CAPTURE_SETTLE_S"), f("CAPTURE_DELAY_S"))
+    cooldown = np.where(distance_mode, 0.0, f("CAPTURE_COOLDOWN_S"))
+    gating = f("QUALITY_GATING") > 0
+
+    mu_s, sg_s = np.zeros(C), np.zeros(C)
+    sp_warn, sb_warn = np.zeros(C, bool), np.zeros(C, bool)
+    sp_enter_n, sp_clear_n, sb_enter_n, sb_clear_n = (np.zeros(C) for _ in range(4))
+    stable_since = np.full(C, np.nan)
+    last_capture = np.full(C, -np.inf)
+    cap_x, cap_y, has_cap = np.zeros(C), np.zeros(C), np.zeros(C, bool)
+    captures = np.zeros((C, n_segments), np.int64)
+    n_active = 0
+    sp_count, sb_count, stable_count = np.zeros(C), np.zeros(C), np.zeros(C)
+    x = y = 0.0
+    current_segment = -1
+    steps = [[] for _ in range(C)] if capture_steps else None
+
+    def hysteresis(value, warn, enter_n, clear_n, enter, clear):
+        # Vectorised HysteresisState.update
+        enter_n = np.where(warn, enter_n, np.where(value >= enter, enter_n + 1, 0))
+        clear_n = np.where(warn, np.where(value <= clear, clear_n + 1, 0), clear_n)
+        raise_ = ~warn & (enter_n >= confirm)
+        drop = warn & (clear_n >= confirm)
+        enter_n[raise_] = 0
+        clear_n[drop] = 0
+        return (warn | raise_) & ~drop, enter_n, clear_n
+
+    for i in range(len(t)):
+        if i == 0: mu_s[:], sg_s[:] = mu_raw[0], sigma_raw[0]
+        else:
+            mu_s = alpha * mu_s + (1 - alpha) * mu_raw[i]
+            sg_s = alpha * sg_s + (1 - alpha) * sigma_raw[i]
+        sp_warn, sp_enter_n, sp_clear_n = hysteresis(mu_s, sp_warn, sp_enter_n, sp_clear_n, sp_enter, sp_clear)
+        sb_warn, sb_enter_n, sb_clear_n = hysteresis(sg_s, sb_warn, sb_enter_n, sb_clear_n, sb_enter, sb_clear)
+
+        if segment[i] != current_segment:
+            # SessionManager resets the arch odometry when its scan starts
+            current_segment = segment[i]
+            x = y = 0.0
+            has_cap[:] = False
+        x -= dx[i]
+        y -= dy[i]
+        if not active[i]: continue
+
+        n_active += 1
+        stable = (mu_s < speed_thresh) & (sg_s < stab_thresh)
+        ready = stable & (quality[i] | ~gating)
+        travel = np.where(has_cap, np.hypot(x - cap_x, y - cap_y), np.inf)
+        far = ~distance_mode | (travel >= spacing)
+        stable_since = np.where(ready, np.where(np.isnan(stable_since), t[i], stable_since), np.nan)
+        fire = ready & far & (t[i] - stable_since >= settle) & (t[i] - last_capture >= cooldown)
+        captures[fire, current_segment] += 1
+        if steps is not None:
+            for c in np.flatnonzero(fire): steps[c].append(i)
+        last_capture[fire] = t[i]
+        stable_since[fire] = np.nan
+        cap_x[fire], cap_y[fire] = x, y
+        has_cap |= fire
+        sp_count += sp_warn
+        sb_count += sb_warn
+        stable_count += stable
+
+    n = max(1, n_active)
+    out = {"captures": captures, "speed_warning_rate": sp_count / n, "stability_warning_rate": sb_count / n,
+           "stable_rate": stable_count / n, "active_steps": n_active}
+    if steps is not None: out["capture_steps"] = steps
+    return out
+
+# ==========================================
+# 2. Grid Sweep
+# ==========================================
+
+def parse_grid(assignments, defaults):
+    # ["CAPTURE_OVERLAP=0.5,0.6,0.7", ...] -> list of config dicts (cartesian product over the live defaults)
+    axes = {}
+    for item in assignments:
+        name, _, values = item.partition("=")
+        name = name.strip().upper()
+        if name not in defaults: raise SystemExit(f"Unknown parameter {name}; sweepable: {', '.join(SWEEPABLE)}")
+        cast = str if isinstance(defaults[name], str) else float
+        axes[name] = [cast(v) for v in values.split(",") if v.strip()]
+    names = list(axes)
+    return names, [dict(defaults, **dict(zip(names, combo))) for combo in itertools.product(*axes.values())] or [dict(defaults)]
+
+def sweep_trace(path, configs):
+    # One trace, a chunk of configs; runs in a worker process
+    trace, segments, meta = MotionTraceRecorder.load(path)
+    columns = {name: np.array([c[name] for c in configs]) for name in SWEEPABLE}
+    t0 = time.perf_counter()
+    result = replay(trace, columns, meta.get("target_width", 480))
+    elapsed = time.perf_counter() - t0
+    duration = float(trace["t"][-1] - trace["t"][0]) if len(trace["t"]) > 1 else 0.0
+    return path, segments, result, elapsed, duration
+
+def find_traces(paths):
+    out = []
+    for path in paths:
+        if os.path.isdir(path): out.extend(sorted(glob.glob(os.path.join(path, "**", "*.npz"), recursive=True)))
+        else: out.append(path)
+    return out
+
+# ==========================================
+# 3. Entry Point
+# ==========================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded MotionState traces over a grid of guidance thresholds")
+    parser.add_argument("traces", nargs="+", help="motion trace .npz files (batch.py / main.py --record-motion) or directories")
+    parser.add_argument("--set", dest="grid", action="append", default=[], metavar="NAME=v1,v2,...",
+                        help="parameter values to sweep (repeatable); others keep the live defaults")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--chunk", type=int, default=256, help="configs per task")
+    parser.add_argument("--out", default="sweep.csv", help="one row per configuration")
+    args = parser.parse_args()
+
+    defaults = live_defaults()
+    names, configs = parse_grid(args.grid, defaults)
+    traces = find_traces(args.traces)
+    if not traces: raise SystemExit("No traces found")
+    chunks = [(i, configs[i:i + args.chunk]) for i in range(0, len(configs), args.chunk)]
+    print(f"[SWEEP] {len(configs)} configuration(s) x {len(traces)} trace(s)")
+
+    # Per config, summed over traces: captures per arch name, warning rates averaged over traces
+    totals = [{"captures": {}, "speed": 0.0, "stability": 0.0, "stable": 0.0} for _ in configs]
+    media_s = compute_s = 0.0
+    t_begin = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.jobs or os.cpu_count()) as executor:
+        futures = [(start, executor.submit(sweep_trace, path, chunk)) for path in traces for start, chunk in chunks]
+        for start, future in futures:
+            path, segments, result, elapsed, duration = future.result()
+            media_s += duration * len(result["stable_rate"])
+            compute_s += elapsed
+            for j in range(len(result["stable_rate"])):
+                tot = totals[start + j]
+                for s, name in enumerate(segments):
+                    if name == "default": continue
+                    tot["captures"][name] = tot["captures"].get(name, 0) + int(result["captures"][j, s])
+                tot["speed"] += result["speed_warning_rate"][j]
+                tot["stability"] += result["stability_warning_rate"][j]
+                tot["stable"] += result["stable_rate"][j]
+    wall = time.perf_counter() - t_begin
+
+    arches = sorted({a for tot in totals for a in tot["captures"]})
+    n = len(traces)
+    with open(args.out, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(names + [f"captures_{a.lower()}_per_trace" for a in arches] +
+                        ["speed_warning_rate", "stability_warning_rate", "stable_rate"])
+        for config, tot in zip(configs, totals):
+            writer.writerow([config[k] for k in names] + [tot["captures"].get(a, 0) / n for a in arches] +
+                            [round(tot["speed"] / n, 4), round(tot["stability"] / n, 4), round(tot["stable"] / n, 4)])
+    print(f"[SWEEP] Replayed {media_s / 3600.0:.2f} config-hours in {wall:.2f}s "
+          f"({media_s / max(compute_s, 1e-9):.0f}x realtime per core), wrote {args.out}")
+
+if __name__ == "__main__":
+    main()
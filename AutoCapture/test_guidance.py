@@ -0,0 +1,69 @@
+import threading
+import cv2
+import numpy as np
+
+from main import GuidanceSystem
+
+# Checks that guidance measurements do not move with the motion scheduler's analysis width (run with pytest)
+
+def textured_frame(seed=0, blur=0.0):
+    rng = np.random.default_rng(seed)
+    noise = rng.integers(0, 255, (90, 160, 3), dtype=np.uint8)
+    frame = cv2.GaussianBlur(cv2.resize(noise, (1280, 720), interpolation=cv2.INTER_CUBIC), (5, 5), 0)
+    return cv2.GaussianBlur(frame, (0, 0), blur) if blur else frame
+
+def motion_state_at(width, frame):
+    # One frame through a GuidanceSystem whose scheduler is held at `width`
+    guidance = GuidanceSystem(None)
+    guidance.scheduler.pin()
+    guidance.scheduler.width_idx = guidance.scheduler.widths.index(width)
+    done = threading.Event()
+    guidance.on_stage_timing = lambda stage, dt: stage == "motion" and done.set()
+    guidance.start()
+    try:
+        guidance.process_frame(frame)
+        assert done.wait(5.0)
+        return guidance.motion_state()
+    finally: guidance.stop()
+
+def test_focus_is_measured_at_motion_width():
+    sharp, blurred = textured_frame(), textured_frame(blur=3.0)
+    focus = {width: motion_state_at(width, sharp).focus for width in (320, 480, 640)}
+    assert focus[320] == focus[480] == focus[640]
+    assert motion_state_at(320, blurred).focus < 0.5 * focus[480]
+
+def test_best_frame_ranks_across_analysis_widths():
+    # A sharp frame analysed at 640 px must beat a blurred one analysed at 320 px
+    guidance = GuidanceSystem(None)
+    scheduler = guidance.scheduler
+    scheduler.pin()
+    done = threading.Event()
+    guidance.on_stage_timing = lambda stage, dt: stage == "motion" and done.set()
+    guidance.start()
+    try:
+        for width, frame in ((640, textured_frame()), (320, textured_frame(1, blur=3.0))):
+            scheduler.width_idx = scheduler.widths.index(width)
+            done.clear()
+            guidance.process_frame(frame)
+            assert done.wait(5.0)
+        _, _, seq = guidance.get_best_frame(0, 1)
+        assert seq == 0
+    finally: guidance.stop()
+
+def test_warning_thresholds_apply_while_running():
+    guidance = GuidanceSystem(None)
+    done = threading.Event()
+    guidance.on_stage_timing = lambda stage, dt: stage == "motion" and done.set()
+    guidance.start()
+    try:
+        frame = textured_frame()
+        guidance.process_frame(frame)
+        assert done.wait(5.0)
+        assert not guidance.motion_state().blur_warning
+        guidance.FOCUS_WARN_ENTER, guidance.FOCUS_WARN_CLEAR = 1e12, 2e12 # everything counts as blurred
+        guidance.WARN_CONFIRM = 1
+        done.clear()
+        guidance.process_frame(frame)
+        assert done.wait(5.0)
+        assert guidance.motion_state().blur_warning
+    finally: guidance.stop()
@@ -0,0 +1,95 @@
+import os
+import threading
+import numpy as np
+
+from main import CaptureWriter, SessionStore
+
+# Regression checks for discarding a capture the writer has not finished (run with pytest)
+
+def make_store(tmp_path):
+    store = SessionStore(str(tmp_path))
+    store.begin()
+    return store
+
+def test_discarded_record_is_not_revived_by_a_late_write(tmp_path):
+    store = make_store(tmp_path)
+    path = store.path("LOWER_1.jpg")
+    store.add(path, "LOWER")
+    store.discard(path)
+    with open(path, "wb") as f: f.write(b"late") # the writer's rename landed after the discard
+    store.written(path)
+    assert store.files("LOWER") == []
+    assert not os.path.exists(path)
+
+def test_failed_is_terminal(tmp_path):
+    store = make_store(tmp_path)
+    path = store.path("LOWER_1.jpg")
+    store.add(path, "LOWER")
+    store.failed(path)
+    store.written(path)
+    assert store.files("LOWER") == []
+
+def test_gc_leaves_files_the_writer_still_owns(tmp_path):
+    store = make_store(tmp_path)
+    path = store.path("LOWER_1.jpg")
+    store.add(path, "LOWER")
+    with open(path, "wb") as f: f.write(b"jpeg")
+    store.written(path)
+    store.invalidate("LOWER")
+    store.in_flight = lambda p: p == path
+    assert store.collect_garbage() == 0
+    store.in_flight = None
+    assert store.collect_garbage() == 1
+    assert not os.path.exists(path)
+
+def test_discard_before_write(tmp_path):
+    store = make_store(tmp_path)
+    writer = CaptureWriter(workers=1)
+    store.in_flight = writer.owns
+    written, release = [], threading.Event()
+    def on_written(path):
+        written.append(path)
+        release.wait(5.0) # holds the only worker, so the next capture stays queued
+        store.written(path)
+    writer.on_written = on_written
+    writer.on_write_failed = store.failed
+    frame = np.zeros((32, 32, 3), np.uint8)
+    first, second = store.path("LOWER_1.jpg"), store.path("LOWER_2.jpg")
+    for path in (first, second):
+        store.add(path, "LOWER")
+        assert writer.submit(frame.copy(), path)
+
+    store.discard(second)
+    assert writer.discard(second)
+    assert store.collect_garbage() == 0 # still queued: GC must not touch it
+    release.set()
+    assert writer.flush(5.0)
+    writer.close()
+
+    assert written == [first]
+    assert store.files("LOWER") == [first]
+    assert not os.path.exists(second) and not os.path.exists(second + ".tmp")
+    store.collect_garbage()
+    assert sorted(os.listdir(store.dir)) == ["LOWER_1.jpg", "index.jsonl", SessionStore.LOCK]
+
+def test_recover_skips_a_live_session(tmp_path):
+    live = make_store(tmp_path)
+    path = live.path("LOWER_1.jpg")
+    live.add(path, "LOWER")
+    with open(path + ".tmp", "wb") as f: f.write(b"in flight")
+    other = make_store(tmp_path) # a second instance on the same root
+    assert other.recover() == []
+    assert os.path.exists(path + ".tmp")
+    live.written(path)
+    assert live.files("LOWER") == [path]
+
+def test_recover_finishes_a_crashed_session(tmp_path):
+    crashed = make_store(tmp_path)
+    path = crashed.path("LOWER_1.jpg")
+    crashed.add(path, "LOWER")
+    crashed._lock_file.close() # what the OS does when the process dies
+    other = make_store(tmp_path)
+    summaries = other.recover()
+    assert [s["lost"] for s in summaries] == [1]
+    assert not os.path.exists(os.path.join(crashed.dir, SessionStore.LOCK))
+    assert other.recover() == []
@@ -0,0 +1,18 @@
+import cv2
+import numpy as np
+
+from main import ImageDirSource
+
+# Frame sources (run with pytest)
+
+def test_image_dir_skips_files_that_do_not_decode(tmp_path):
+    for i in range(4): cv2.imwrite(str(tmp_path / f"{i}.png"), np.full((8, 8, 3), i, np.uint8))
+    (tmp_path / "1.png").write_bytes(b"truncated")
+    source = ImageDirSource(str(tmp_path))
+    shades = []
+    while True:
+        ret, frame = source.read()
+        if not ret: break
+        shades.append(int(frame[0, 0, 0]))
+    assert shades == [0, 2, 3]
+    assert source.frames_read == 3
@@ -0,0 +1,46 @@
+import threading
+import numpy as np
+import pytest
+
+from main import GuidanceSystem, MotionTraceRecorder, ReplayClock
+from benchmark import SyntheticSource
+from sweep import SWEEPABLE, replay
+
+# The vectorised replay must fire on exactly the motion steps the live workers fired on (run with pytest)
+
+def run_live(tmp_path, **params):
+    # Lockstep through the real _motion_worker/_state_worker; -> (saved trace path, step indices that fired)
+    guidance = GuidanceSystem(None)
+    for name, value in params.items(): setattr(guidance, name, value)
+    guidance.scheduler.pin()
+    guidance.clock = clock = ReplayClock()
+    recorder = guidance.trace_recorder = MotionTraceRecorder()
+    fired, done = [], threading.Event()
+    guidance.on_capture_triggered = lambda: fired.append(len(recorder) - 1) # recorded just before the state step
+    guidance.on_stage_timing = lambda stage, dt: stage == "motion" and done.set()
+    guidance.start()
+    try:
+        source = SyntheticSource(n_frames=400, width=640, height=360)
+        guidance.select_odometry("LOWER").reset()
+        guidance.set_processing_active(True)
+        i = 0
+        while True:
+            ret, frame = source.read()
+            if not ret: break
+            done.clear()
+            clock.set(i / source.fps)
+            guidance.process_frame(frame)
+            assert done.wait(5.0)
+            i += 1
+    finally: guidance.stop()
+    path = str(tmp_path / "trace.npz")
+    recorder.save(path, target_width=guidance.motion_width)
+    return path, fired, {name: getattr(guidance, name) for name in SWEEPABLE}
+
+@pytest.mark.parametrize("mode", ["distance", "time"])
+def test_replay_matches_live_captures(tmp_path, mode):
+    path, fired, config = run_live(tmp_path, CAPTURE_MODE=mode)
+    trace, segments, meta = MotionTraceRecorder.load(path)
+    result = replay(trace, {name: np.array([value]) for name, value in config.items()}, meta["target_width"], capture_steps=True)
+    assert len(fired) >= 2
+    assert result["capture_steps"][0] == fired